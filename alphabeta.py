@@ -0,0 +1,531 @@
+"""
+A reference alpha-beta search for homemade engines.
+
+The search uses iterative deepening, principal variation search with aspiration windows, a quiescence search of captures,
+move ordering by the hash move, killer moves and the history heuristic, and a fixed-size transposition table that is kept
+between the moves of a game. The search runs on a `bitboard.Position` instead of a `chess.Board`, because it is much
+faster. See `strategies.AlphaBeta` for the engine that uses it.
+"""
+from __future__ import annotations
+import logging
+import chess
+import chess.engine
+from bitboard import Position, PIECE_SQUARE_TABLES_TYPE, CASTLING, EMPTY, EN_PASSANT, zero_tables
+from engine_wrapper import Deadline, SearchStats
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MATE_SCORE = 32000
+MAX_PLY = 100
+MATE_BOUND = MATE_SCORE - MAX_PLY  # Scores beyond this are mate scores.
+INFINITE_SCORE = MATE_SCORE + 1
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+NO_MOVE = 0  # No move from a1 to a1 is possible, so 0 stands for no move.
+TT_ENTRY_TYPE = tuple[int, int, int, int, int, int]  # key, depth, score, bound, move, generation
+
+piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+phase_weights = {chess.KNIGHT: 1, chess.BISHOP: 1, chess.ROOK: 2, chess.QUEEN: 4}
+full_phase = 24
+
+# Piece-square tables from white's point of view, as the board is printed (a8 first, h1 last).
+piece_square_tables = {
+    chess.PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0],
+    chess.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50],
+    chess.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20],
+    chess.ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0],
+    chess.QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20],
+    chess.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20],
+}
+king_endgame_table = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the hard deadline or the node limit is reached."""
+
+
+def build_piece_square_tables() -> tuple[PIECE_SQUARE_TABLES_TYPE, PIECE_SQUARE_TABLES_TYPE]:
+    """
+    Combine the piece values and the piece-square tables into the tables of `bitboard.Position`.
+
+    The king uses a middlegame table and an endgame table, which `Position.evaluate` weights by the material left on the
+    board. The other pieces have the same score in both.
+
+    :return: The middlegame and endgame scores of each piece index on each square, from white's point of view.
+    """
+    middlegame, endgame = zero_tables(), zero_tables()
+    for piece_type in chess.PIECE_TYPES:
+        endgame_table = king_endgame_table if piece_type == chess.KING else piece_square_tables[piece_type]
+        for square in chess.SQUARES:
+            for index, sign, flip in ((piece_type - 1, 1, 56), (piece_type + 5, -1, 0)):
+                middlegame[index][square] = sign * (piece_values[piece_type] + piece_square_tables[piece_type][square ^ flip])
+                endgame[index][square] = sign * (piece_values[piece_type] + endgame_table[square ^ flip])
+    return middlegame, endgame
+
+
+middlegame_tables, endgame_tables = build_piece_square_tables()
+ordering_values = [piece_values[piece_type] for piece_type in chess.PIECE_TYPES] * 2 + [piece_values[chess.PAWN]]
+
+
+def pov_score(score: int, turn: chess.Color) -> chess.engine.PovScore:
+    """Convert a search score to a `chess.engine.PovScore`."""
+    if score >= MATE_BOUND:
+        return chess.engine.PovScore(chess.engine.Mate((MATE_SCORE - score + 1) // 2), turn)
+    if score <= -MATE_BOUND:
+        return chess.engine.PovScore(chess.engine.Mate(-((MATE_SCORE + score) // 2)), turn)
+    return chess.engine.PovScore(chess.engine.Cp(score), turn)
+
+
+class TranspositionTable:
+    """
+    A fixed-size hash table of search results, indexed by the Zobrist hash of the position (`chess.polyglot.zobrist_hash`).
+
+    An entry is replaced by a result from a newer search or by a deeper search of the same age. Mate scores are stored
+    relative to the position of the entry, so they can be used at any distance from the root.
+    """
+
+    entry_size = 128  # The approximate memory used by one entry, in bytes.
+
+    def __init__(self, size_mb: int = 16) -> None:
+        """:param size_mb: The memory the table may use, in megabytes."""
+        entries = max(1, size_mb * 1024 * 1024 // self.entry_size)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.generation = 0
+        self.entries: list[Optional[TT_ENTRY_TYPE]] = [None] * self.size
+
+    def clear(self) -> None:
+        """Forget all the entries, e.g. at the start of a new game."""
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """Mark the entries stored so far as old, so they are replaced first."""
+        self.generation += 1
+
+    def probe(self, key: int) -> Optional[TT_ENTRY_TYPE]:
+        """Get the entry of the position with the Zobrist hash `key`, if there is one."""
+        entry = self.entries[key & self.mask]
+        return entry if entry is not None and entry[0] == key else None
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: int, ply: int) -> None:
+        """
+        Store the result of a search.
+
+        :param key: The Zobrist hash of the position.
+        :param depth: The depth that the position was searched to.
+        :param score: The score of the position.
+        :param bound: Whether the score is `EXACT`, a `LOWER_BOUND` or an `UPPER_BOUND`.
+        :param move: The best move found, or `NO_MOVE`.
+        :param ply: The distance of the position from the root, used to store mate scores.
+        """
+        index = key & self.mask
+        old = self.entries[index]
+        if old is not None and old[5] == self.generation and old[1] > depth and old[0] != key:
+            return
+        if old is not None and old[0] == key and move == NO_MOVE:
+            move = old[4]
+        if score >= MATE_BOUND:
+            score += ply
+        elif score <= -MATE_BOUND:
+            score -= ply
+        self.entries[index] = (key, depth, score, bound, move, self.generation)
+
+    def hashfull(self) -> int:
+        """Get how full the table is with entries of the current search, in permille, like the UCI `hashfull` info."""
+        sample = self.entries[:min(1000, self.size)]
+        used = sum(1 for entry in sample if entry is not None and entry[5] == self.generation)
+        return used * 1000 // len(sample)
+
+
+def score_from_tt(score: int, ply: int) -> int:
+    """Convert a mate score stored in the transposition table to a score relative to the root."""
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def bound_type(score: int, alpha: int, beta: int) -> int:
+    """Get whether the score of a search with the window (`alpha`, `beta`) is exact, a lower bound or an upper bound."""
+    if score >= beta:
+        return LOWER_BOUND
+    return EXACT if score > alpha else UPPER_BOUND
+
+
+class Searcher:
+    """
+    Search for the best move with iterative deepening alpha-beta.
+
+    The search runs on a `bitboard.Position`, so moves are integers (see `bitboard.encode_move`). One instance is used for
+    a whole game, so the transposition table and the history of quiet moves that caused cutoffs help the next searches.
+    """
+
+    aspiration_window = 25  # The half width of the first aspiration window, in centipawns.
+    aspiration_min_depth = 4  # The first depth that is searched with an aspiration window.
+    check_interval = 1024  # The deadline is checked every time this many nodes have been searched.
+
+    def __init__(self, hash_size_mb: int = 16) -> None:
+        """:param hash_size_mb: The memory the transposition table may use, in megabytes."""
+        self.tt = TranspositionTable(hash_size_mb)
+        self.history = [[0] * 64 for _ in range(64)]
+        self.killers = [[NO_MOVE, NO_MOVE] for _ in range(MAX_PLY + 1)]
+        self.pv_table: list[list[int]] = [[] for _ in range(MAX_PLY + 2)]
+        self.nodes = 0
+        self.seldepth = 0
+        self.max_nodes: Optional[int] = None
+        self.deadline = Deadline(0, 0)
+        self.can_abort = False
+        self.stats = SearchStats()
+
+    def new_game(self) -> None:
+        """Forget everything learned in the previous game."""
+        self.tt.clear()
+        self.history = [[0] * 64 for _ in range(64)]
+
+    def evaluate(self, position: Position) -> int:
+        """Evaluate the position in centipawns from the point of view of the side to move. Override this to change it."""
+        return position.evaluate()
+
+    def search(self, board: chess.Board, deadline: Deadline, max_depth: Optional[int] = None,
+               max_nodes: Optional[int] = None, root_moves: Optional[list[chess.Move]] = None,
+               stats: Optional[SearchStats] = None) -> chess.engine.PlayResult:
+        """
+        Search the position until the deadline, the depth limit or the node limit is reached.
+
+        :param board: The position to search. It has at least one legal move.
+        :param deadline: No new iteration is started after the soft deadline, and the search returns at the hard deadline.
+        :param max_depth: The deepest iteration to search.
+        :param max_nodes: The number of nodes after which the search stops.
+        :param root_moves: If given, only these moves are searched.
+        :param stats: The counters of the search, e.g. `MinimalEngine.search_stats`.
+        :return: The best move, with the depth, nodes, speed, score and principal variation in `info`.
+        """
+        position = Position(board, middlegame_tables, endgame_tables)
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.seldepth = 0
+        self.stats = stats or SearchStats()
+        self.killers = [[NO_MOVE, NO_MOVE] for _ in range(MAX_PLY + 1)]
+        self.tt.new_search()
+        self.history = [[value // 8 for value in row] for row in self.history]
+
+        moves = [position.from_move(move) for move in root_moves] if root_moves else position.legal_moves()
+        best_move = moves[0]
+        score = self.evaluate(position)
+        pv = [best_move]
+        completed_depth = 0
+        for depth in range(1, min(max_depth or MAX_PLY, MAX_PLY) + 1):
+            if depth > 1 and deadline.soft_expired():
+                break
+            self.can_abort = depth > 1
+            try:
+                score = self.aspiration_search(position, moves, depth, score)
+            except SearchAborted:
+                if moves[0] != best_move:  # The first moves of the unfinished iteration found a better move.
+                    best_move = moves[0]
+                    pv = self.pv_table[0] or [best_move]
+                break
+            best_move = moves[0]
+            pv = self.pv_table[0] or [best_move]
+            completed_depth = depth
+            self.stats.nodes = self.nodes
+            self.stats.end_iteration(depth)
+            logger.debug(f"Depth {depth}: {pov_score(score, board.turn)} "
+                         f"{board.variation_san([position.to_move(move) for move in pv])}")
+            if abs(score) >= MATE_BOUND and MATE_SCORE - abs(score) <= depth:
+                break  # Found the shortest mate.
+
+        self.stats.nodes = self.nodes
+        chess_pv = [position.to_move(move) for move in pv]
+        return chess.engine.PlayResult(chess_pv[0], chess_pv[1] if len(chess_pv) > 1 else None,
+                                       self.info(board, completed_depth, score, chess_pv))
+
+    def info(self, board: chess.Board, depth: int, score: int, pv: list[chess.Move]) -> chess.engine.InfoDict:
+        """Collect the statistics of the search, in the same format as a UCI engine reports them."""
+        elapsed = self.deadline.elapsed()
+        info: chess.engine.InfoDict = {}
+        info["depth"] = depth
+        info["seldepth"] = self.seldepth
+        info["nodes"] = self.nodes
+        info["nps"] = int(self.nodes / elapsed) if elapsed > 0 else 0
+        info["time"] = elapsed
+        info["score"] = pov_score(score, board.turn)
+        info["pv"] = pv
+        info["hashfull"] = self.tt.hashfull()
+        return info
+
+    def aspiration_search(self, position: Position, moves: list[int], depth: int, previous_score: int) -> int:
+        """Search the root with a narrow window around the score of the previous iteration, and widen it if needed."""
+        if depth < self.aspiration_min_depth or abs(previous_score) >= MATE_BOUND:
+            return self.search_root(position, moves, depth, -INFINITE_SCORE, INFINITE_SCORE)
+
+        window = self.aspiration_window
+        alpha, beta = previous_score - window, previous_score + window
+        while True:
+            score = self.search_root(position, moves, depth, alpha, beta)
+            if alpha < score < beta:
+                return score
+            window *= 4
+            if score <= alpha:
+                alpha = max(score - window, -INFINITE_SCORE)
+            else:
+                beta = min(score + window, INFINITE_SCORE)
+            if window > 1000:
+                alpha, beta = -INFINITE_SCORE, INFINITE_SCORE
+
+    def search_root(self, position: Position, moves: list[int], depth: int, alpha: int, beta: int) -> int:
+        """
+        Search all the root moves, which are legal.
+
+        The best move so far is moved to the front of `moves` as soon as it is found, so the moves are in the right order
+        for the next iteration, and the best move is known if the search is aborted.
+        """
+        self.pv_table[0] = []
+        original_alpha = alpha
+        best_score = -INFINITE_SCORE
+        for index, move in enumerate(list(moves)):
+            score = self.search_move(position, move, index == 0, depth, alpha, beta, 0)
+            if score is None or score <= best_score:
+                continue
+            best_score = score
+            if index > 0 and score > alpha:
+                moves.remove(move)
+                moves.insert(0, move)
+            if score > alpha:
+                self.pv_table[0] = [move] + self.pv_table[1]
+                alpha = score
+            if score >= beta:
+                break
+        self.tt.store(position.key, depth, best_score, bound_type(best_score, original_alpha, beta), moves[0], 0)
+        return best_score
+
+    def count_node(self, ply: int) -> None:
+        """Count a node, and stop the search if the deadline or the node limit is reached."""
+        self.nodes += 1
+        if ply > self.seldepth:
+            self.seldepth = ply
+        if self.can_abort and (self.nodes % self.check_interval == 0 and self.deadline.hard_expired()
+                               or self.max_nodes is not None and self.nodes >= self.max_nodes):
+            raise SearchAborted()
+
+    def negamax(self, position: Position, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """
+        Search the position with principal variation search.
+
+        :param position: The position to search.
+        :param depth: The remaining depth. At depth 0, the quiescence search is used.
+        :param alpha: The lower bound of the window.
+        :param beta: The upper bound of the window.
+        :param ply: The distance from the root.
+        :return: The score from the point of view of the side to move.
+        """
+        self.pv_table[ply] = []
+        if position.is_draw():
+            return 0
+
+        in_check = position.is_check()
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(position, alpha, beta, ply)
+        self.count_node(ply)
+
+        key = position.key
+        tt_score, hash_move = self.probe_tt(key, depth, alpha, beta, ply)
+        if tt_score is not None:
+            return tt_score
+
+        original_alpha = alpha
+        best_score = -INFINITE_SCORE
+        best_move = NO_MOVE
+        for move in self.order_moves(position, position.generate_moves(), hash_move, ply):
+            score = self.search_move(position, move, best_move == NO_MOVE, depth, alpha, beta, ply)
+            if score is None or score <= best_score:
+                continue
+            best_score = score
+            best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+            if score >= beta:
+                self.stats.cutoffs += 1
+                self.update_quiet_move(position, move, depth, ply)
+                break
+
+        if best_move == NO_MOVE:
+            return -MATE_SCORE + ply if in_check else 0
+        bound = bound_type(best_score, original_alpha, beta)
+        self.tt.store(key, depth, best_score, bound, NO_MOVE if bound == UPPER_BOUND else best_move, ply)
+        return best_score
+
+    def probe_tt(self, key: int, depth: int, alpha: int, beta: int, ply: int) -> tuple[Optional[int], int]:
+        """
+        Look up the position in the transposition table.
+
+        :return: The stored score if the entry is deep enough and its bound settles the window (only outside the principal
+            variation), and the stored move to search first.
+        """
+        entry = self.tt.probe(key)
+        if entry is None:
+            return None, NO_MOVE
+        self.stats.tt_hits += 1
+        _, entry_depth, score, bound, move, _ = entry
+        score = score_from_tt(score, ply)
+        if entry_depth < depth or beta - alpha > 1:
+            return None, move
+        if bound == EXACT or bound == LOWER_BOUND and score >= beta or bound == UPPER_BOUND and score <= alpha:
+            return score, move
+        return None, move
+
+    def search_move(self, position: Position, move: int, first: bool, depth: int, alpha: int, beta: int,
+                    ply: int) -> Optional[int]:
+        """
+        Search the position after a move. Moves after the first are searched with a null window first.
+
+        :param position: The position before the move.
+        :param move: The pseudo-legal move to search.
+        :param first: Whether this is the first legal move searched in the position.
+        :param depth: The remaining depth before the move.
+        :param alpha: The lower bound of the window.
+        :param beta: The upper bound of the window.
+        :param ply: The distance of the position before the move from the root.
+        :return: The score of the move from the point of view of the side to move before the move, or `None` if the move
+            is illegal.
+        """
+        if not position.make(move):
+            return None
+        if first:
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+        else:
+            score = -self.negamax(position, depth - 1, -alpha - 1, -alpha, ply + 1)
+            if alpha < score < beta:
+                score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+        position.unmake()
+        return score
+
+    def quiescence(self, position: Position, alpha: int, beta: int, ply: int) -> int:
+        """
+        Search captures until the position is quiet, so the evaluation is not done in the middle of an exchange.
+
+        :return: The score from the point of view of the side to move.
+        """
+        self.pv_table[ply] = []
+        self.count_node(ply)
+        stats = self.stats
+        stats.qnodes += 1
+        stats.evals += 1
+        stand_pat = self.evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        for move in self.order_moves(position, position.generate_moves(captures_only=True), NO_MOVE, ply):
+            if not position.make(move):
+                continue
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake()
+            if score >= beta:
+                stats.cutoffs += 1
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def order_moves(self, position: Position, moves: list[int], hash_move: int, ply: int) -> list[int]:
+        """
+        Sort the moves so the ones most likely to cause a cutoff are searched first.
+
+        The order is: the move from the transposition table, captures of valuable pieces by cheap pieces, promotions, the
+        killer moves of this ply, and the other quiet moves by their history score.
+        """
+        killer, second_killer = self.killers[min(ply, MAX_PLY)]
+        squares = position.squares
+        history = self.history
+
+        def priority(move: int) -> int:
+            if move == hash_move:
+                return 3_000_000
+            to_square = move >> 6 & 63
+            victim = squares[to_square]
+            if victim != EMPTY and move >> 15 != CASTLING or move >> 15 == EN_PASSANT:
+                return 2_000_000 + 10 * ordering_values[victim] - ordering_values[squares[move & 63]] // 10
+            if move >> 12 & 7:
+                return 1_900_000 + piece_values[move >> 12 & 7]
+            if move == killer:
+                return 1_800_000
+            if move == second_killer:
+                return 1_700_000
+            return history[move & 63][to_square]
+
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def update_quiet_move(self, position: Position, move: int, depth: int, ply: int) -> None:
+        """Remember a quiet move that caused a cutoff as a killer move of this ply and in the history table."""
+        from_square, to_square = move & 63, move >> 6 & 63
+        if position.squares[to_square] != EMPTY and move >> 15 != CASTLING or move >> 12 & 7 or move >> 15 == EN_PASSANT:
+            return
+        killers = self.killers[min(ply, MAX_PLY)]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[from_square][to_square] = min(self.history[from_square][to_square] + depth * depth, 1_000_000)
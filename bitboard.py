@@ -0,0 +1,558 @@
+"""
+A compact chess position for the searches of homemade engines.
+
+`chess.Board` is made for correctness and convenience, so its `push`, `pop`, `legal_moves` and `copy` are slow inside a
+search that visits millions of positions. `Position` keeps only what a search needs: the bitboards of the pieces in a list of
+fixed size, a square-to-piece table, and a Zobrist hash and piece-square scores that are updated with every move. Moves are
+integers, and `make`/`unmake` save and restore the state in lists that are allocated once. Convert the `chess.Board` given
+to `search` to a `Position` at the start of the search, and the moves found back to `chess.Move` at the end.
+Only standard chess and Chess960 are supported.
+"""
+from __future__ import annotations
+import chess
+import chess.polyglot
+from typing import Optional
+
+PIECE_SQUARE_TABLES_TYPE = list[list[int]]  # [piece index][square] -> score in centipawns from white's point of view
+
+WHITE, BLACK = 0, 1
+EMPTY = 12  # The piece index of an empty square.
+WHITE_OCCUPIED, BLACK_OCCUPIED = 12, 13  # The indexes of the bitboards of all the pieces of one color.
+
+# A move is an integer: the from square in bits 0-5, the to square in bits 6-11, the promotion piece type (as in
+# python-chess) in bits 12-14, and one of these flags in bits 15-16.
+NORMAL, DOUBLE_PUSH, EN_PASSANT, CASTLING = 0, 1, 2, 3
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+ZOBRIST_PIECES = [[chess.polyglot.POLYGLOT_RANDOM_ARRAY[64 * ((index % 6) * 2 + (index < 6)) + square] for square in range(64)]
+                  for index in range(12)]
+ZOBRIST_CASTLING = [0] * 16
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights & (1 << _bit):
+            ZOBRIST_CASTLING[_rights] ^= chess.polyglot.POLYGLOT_RANDOM_ARRAY[768 + _bit]
+ZOBRIST_EN_PASSANT = [chess.polyglot.POLYGLOT_RANDOM_ARRAY[772 + file] for file in range(8)]
+ZOBRIST_WHITE_TO_MOVE = chess.polyglot.POLYGLOT_RANDOM_ARRAY[780]
+
+PHASE = [0, 1, 1, 2, 4, 0] * 2 + [0]  # The game phase of each piece index. All the pieces add up to FULL_PHASE.
+FULL_PHASE = 24
+COLOR_BITBOARD = [WHITE_OCCUPIED] * 6 + [BLACK_OCCUPIED] * 6
+
+SQUARE_BB = chess.BB_SQUARES
+KNIGHT_ATTACKS = chess.BB_KNIGHT_ATTACKS
+KING_ATTACKS = chess.BB_KING_ATTACKS
+PAWN_ATTACKS = [chess.BB_PAWN_ATTACKS[chess.WHITE], chess.BB_PAWN_ATTACKS[chess.BLACK]]
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = chess.BB_DIAG_MASKS, chess.BB_DIAG_ATTACKS
+FILE_MASKS, FILE_ATTACKS = chess.BB_FILE_MASKS, chess.BB_FILE_ATTACKS
+RANK_MASKS, RANK_ATTACKS = chess.BB_RANK_MASKS, chess.BB_RANK_ATTACKS
+
+# The squares of the king and the rook after castling. In Chess960 too, only the squares before castling differ.
+CASTLING_TARGETS = {WHITE_KINGSIDE: (chess.G1, chess.F1), WHITE_QUEENSIDE: (chess.C1, chess.D1),
+                    BLACK_KINGSIDE: (chess.G8, chess.F8), BLACK_QUEENSIDE: (chess.C8, chess.D8)}
+COLOR_CASTLING_RIGHTS = [(WHITE_KINGSIDE, WHITE_QUEENSIDE), (BLACK_KINGSIDE, BLACK_QUEENSIDE)]
+
+PROMOTION_RANKS = [chess.BB_RANK_8, chess.BB_RANK_1]
+ALL_PROMOTIONS = (chess.QUEEN, chess.KNIGHT, chess.ROOK, chess.BISHOP)
+
+
+def encode_move(from_square: int, to_square: int, promotion: int = 0, flag: int = NORMAL) -> int:
+    """Pack a move into an integer."""
+    return from_square | to_square << 6 | promotion << 12 | flag << 15
+
+
+def zero_tables() -> PIECE_SQUARE_TABLES_TYPE:
+    """Get piece-square tables that score every piece on every square as 0."""
+    return [[0] * 64 for _ in range(13)]
+
+
+class Position:
+    """
+    A chess position with fast move generation and make/unmake.
+
+    Pieces are numbered `color * 6 + piece_type - 1`, where white is 0 and black is 1, so 0 is a white pawn and 11 is a black
+    king. `bitboards` has a bitboard for each piece and, at `WHITE_OCCUPIED` and `BLACK_OCCUPIED`, for all the pieces of a
+    color. `squares` has the piece on each square, or `EMPTY`. `key` is the same Zobrist hash as `chess.polyglot.zobrist_hash`
+    of the same position, and `middlegame`, `endgame` and `phase` are the sums of the piece-square tables and the game
+    phase of the pieces, from white's point of view.
+
+    A castling move goes from the square of the king to the square where the king ends (e.g. g1), also in Chess960, where
+    the rook of each castling right can start on any square. `castling_rook_moves` has the squares of the rook before and
+    after each castling move, and `castling_mask` the castling rights that are kept when a piece moves from or to a square.
+    """
+
+    stack_size = 256  # The most moves that can be made on the position without unmaking them.
+
+    def __init__(self, board: chess.Board, middlegame_tables: Optional[PIECE_SQUARE_TABLES_TYPE] = None,
+                 endgame_tables: Optional[PIECE_SQUARE_TABLES_TYPE] = None) -> None:
+        """
+        Convert a `chess.Board`.
+
+        :param board: The position. Its previous positions since the last capture or pawn move are used to find repetitions.
+        :param middlegame_tables: The score of each piece on each square in the middlegame, from white's point of view.
+        :param endgame_tables: The score of each piece on each square in the endgame, from white's point of view.
+        """
+        if board.uci_variant != "chess":
+            raise ValueError(f"Only standard chess and Chess960 are supported, not {board.uci_variant}.")
+        self.middlegame_tables = middlegame_tables or zero_tables()
+        self.endgame_tables = endgame_tables or zero_tables()
+        self.chess960 = board.chess960
+        self.bitboards = [0] * 14
+        self.squares = [EMPTY] * 64
+        self.middlegame = 0
+        self.endgame = 0
+        self.phase = 0
+        self.key = 0
+        for square, piece in board.piece_map().items():
+            self.put(piece.piece_type - 1 + (0 if piece.color else 6), square)
+
+        self.turn = WHITE if board.turn else BLACK
+        self.castling_rooks = castling_rooks(board)  # The square of the rook of each castling right.
+        self.castling = 0
+        self.castling_mask = [15] * 64
+        self.castling_rook_moves: dict[int, tuple[int, int]] = {}
+        for right, rook_square in self.castling_rooks.items():
+            king_square = board.king(chess.WHITE if right in COLOR_CASTLING_RIGHTS[WHITE] else chess.BLACK)
+            assert king_square is not None
+            self.castling |= right
+            self.castling_mask[rook_square] &= 15 ^ right
+            self.castling_mask[king_square] &= 15 ^ right
+            king_target, rook_target = CASTLING_TARGETS[right]
+            self.castling_rook_moves[king_target] = (rook_square, rook_target)
+        self.ep_square = board.ep_square if board.ep_square is not None else -1
+        self.halfmove_clock = board.halfmove_clock
+        self.fullmove_number = board.fullmove_number
+        self.key ^= ZOBRIST_CASTLING[self.castling] ^ self.ep_key() ^ (ZOBRIST_WHITE_TO_MOVE if self.turn == WHITE else 0)
+
+        history = previous_keys(board)
+        self.keys = history + [self.key] + [0] * self.stack_size  # The Zobrist hashes of the positions of the game.
+        self.key_index = len(history)
+        self.ply = 0
+        self.undo_move = [0] * self.stack_size
+        self.undo_captured = [EMPTY] * self.stack_size
+        self.undo_castling = [0] * self.stack_size
+        self.undo_ep_square = [-1] * self.stack_size
+        self.undo_halfmove_clock = [0] * self.stack_size
+        self.undo_key = [0] * self.stack_size
+        self.undo_middlegame = [0] * self.stack_size
+        self.undo_endgame = [0] * self.stack_size
+        self.undo_phase = [0] * self.stack_size
+
+    def put(self, piece: int, square: int) -> None:
+        """Put a piece on an empty square."""
+        bit = SQUARE_BB[square]
+        self.bitboards[piece] |= bit
+        self.bitboards[COLOR_BITBOARD[piece]] |= bit
+        self.squares[square] = piece
+        self.key ^= ZOBRIST_PIECES[piece][square]
+        self.middlegame += self.middlegame_tables[piece][square]
+        self.endgame += self.endgame_tables[piece][square]
+        self.phase += PHASE[piece]
+
+    def remove(self, piece: int, square: int) -> None:
+        """Remove the piece from its square."""
+        bit = SQUARE_BB[square]
+        self.bitboards[piece] ^= bit
+        self.bitboards[COLOR_BITBOARD[piece]] ^= bit
+        self.squares[square] = EMPTY
+        self.key ^= ZOBRIST_PIECES[piece][square]
+        self.middlegame -= self.middlegame_tables[piece][square]
+        self.endgame -= self.endgame_tables[piece][square]
+        self.phase -= PHASE[piece]
+
+    def ep_key(self) -> int:
+        """Get the part of the Zobrist hash for the en passant square. Like polyglot, it only counts if a pawn can capture."""
+        if self.ep_square < 0 or not PAWN_ATTACKS[self.turn ^ 1][self.ep_square] & self.bitboards[self.turn * 6]:
+            return 0
+        return ZOBRIST_EN_PASSANT[self.ep_square & 7]
+
+    def make(self, move: int) -> bool:
+        """
+        Make a pseudo-legal move from `generate_moves`.
+
+        :return: Whether the move is legal. An illegal move (one that leaves the king in check) is unmade right away.
+        """
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        promotion = move >> 12 & 7
+        flag = move >> 15
+        us = self.turn
+        squares = self.squares
+        piece = squares[from_square]
+        captured = squares[to_square] if flag != CASTLING else EMPTY  # In Chess960, the king can move to its rook's square.
+
+        ply = self.ply
+        self.undo_move[ply] = move
+        self.undo_captured[ply] = captured
+        self.undo_castling[ply] = self.castling
+        self.undo_ep_square[ply] = self.ep_square
+        self.undo_halfmove_clock[ply] = self.halfmove_clock
+        self.undo_key[ply] = self.key
+        self.undo_middlegame[ply] = self.middlegame
+        self.undo_endgame[ply] = self.endgame
+        self.undo_phase[ply] = self.phase
+        self.ply = ply + 1
+
+        key = self.key ^ ZOBRIST_WHITE_TO_MOVE
+        if self.ep_square >= 0:
+            key ^= self.ep_key()
+        bitboards = self.bitboards
+        middlegame_tables = self.middlegame_tables
+        endgame_tables = self.endgame_tables
+        to_bit = SQUARE_BB[to_square]
+        own = WHITE_OCCUPIED + us
+        if captured != EMPTY:
+            bitboards[captured] ^= to_bit
+            bitboards[own ^ 1] ^= to_bit
+            key ^= ZOBRIST_PIECES[captured][to_square]
+            self.middlegame -= middlegame_tables[captured][to_square]
+            self.endgame -= endgame_tables[captured][to_square]
+            self.phase -= PHASE[captured]
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock = 0 if piece == us * 6 else self.halfmove_clock + 1
+
+        if flag == CASTLING:
+            self.key = key
+            rook_from, rook_to = self.castling_rook_moves[to_square]
+            self.move_castling_pieces(us, from_square, to_square, rook_from, rook_to)
+        else:
+            placed = us * 6 + promotion - 1 if promotion else piece
+            bitboards[piece] ^= SQUARE_BB[from_square]
+            bitboards[placed] ^= to_bit
+            bitboards[own] ^= SQUARE_BB[from_square] | to_bit
+            squares[from_square] = EMPTY
+            squares[to_square] = placed
+            self.key = key ^ ZOBRIST_PIECES[piece][from_square] ^ ZOBRIST_PIECES[placed][to_square]
+            self.middlegame += middlegame_tables[placed][to_square] - middlegame_tables[piece][from_square]
+            self.endgame += endgame_tables[placed][to_square] - endgame_tables[piece][from_square]
+            if promotion:
+                self.phase += PHASE[placed]
+            if flag == EN_PASSANT:
+                self.remove((us ^ 1) * 6, to_square ^ 8)
+
+        castling = self.castling
+        if castling:
+            self.castling &= self.castling_mask[from_square] & self.castling_mask[to_square]
+            if self.castling != castling:
+                self.key ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[self.castling]
+        self.fullmove_number += us
+        self.turn = us ^ 1
+        if flag == DOUBLE_PUSH:
+            self.ep_square = (from_square + to_square) >> 1
+            self.key ^= self.ep_key()
+        else:
+            self.ep_square = -1
+        self.key_index += 1
+        self.keys[self.key_index] = self.key
+
+        if self.is_attacked(self.bitboards[us * 6 + 5].bit_length() - 1, us ^ 1):
+            self.unmake()
+            return False
+        return True
+
+    def move_castling_pieces(self, us: int, king_from: int, king_to: int, rook_from: int, rook_to: int) -> None:
+        """
+        Move the king and the rook of a castling move, or move them back.
+
+        Both are removed before either is put back, because in Chess960 the king can end on the square where the rook
+        started, or the rook on the square where the king started.
+        """
+        self.remove(us * 6 + 5, king_from)
+        self.remove(us * 6 + 3, rook_from)
+        self.put(us * 6 + 5, king_to)
+        self.put(us * 6 + 3, rook_to)
+
+    def unmake(self) -> None:
+        """Take back the last move made with `make`."""
+        self.ply -= 1
+        ply = self.ply
+        move = self.undo_move[ply]
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flag = move >> 15
+        self.turn ^= 1
+        us = self.turn
+        bitboards = self.bitboards
+        squares = self.squares
+        color_bitboard = WHITE_OCCUPIED + us
+
+        if flag == CASTLING:  # The key and the scores changed by `move_castling_pieces` are restored below.
+            rook_from, rook_to = self.castling_rook_moves[to_square]
+            self.move_castling_pieces(us, to_square, from_square, rook_to, rook_from)
+        else:
+            moved = squares[to_square]
+            piece = us * 6 if move >> 12 & 7 else moved
+            from_bit, to_bit = SQUARE_BB[from_square], SQUARE_BB[to_square]
+            bitboards[moved] ^= to_bit
+            bitboards[piece] ^= from_bit
+            bitboards[color_bitboard] ^= from_bit | to_bit
+            squares[from_square] = piece
+            captured = self.undo_captured[ply]
+            squares[to_square] = captured
+            if captured != EMPTY:
+                bitboards[captured] ^= to_bit
+                bitboards[color_bitboard ^ 1] ^= to_bit
+            if flag == EN_PASSANT:
+                pawn_square = to_square ^ 8
+                bitboards[(us ^ 1) * 6] ^= SQUARE_BB[pawn_square]
+                bitboards[color_bitboard ^ 1] ^= SQUARE_BB[pawn_square]
+                squares[pawn_square] = (us ^ 1) * 6
+
+        self.castling = self.undo_castling[ply]
+        self.ep_square = self.undo_ep_square[ply]
+        self.halfmove_clock = self.undo_halfmove_clock[ply]
+        self.key = self.undo_key[ply]
+        self.middlegame = self.undo_middlegame[ply]
+        self.endgame = self.undo_endgame[ply]
+        self.phase = self.undo_phase[ply]
+        self.fullmove_number -= us
+        self.key_index -= 1
+
+    def is_attacked(self, square: int, by: int) -> bool:
+        """Check whether a piece of the color `by` attacks the square."""
+        bitboards = self.bitboards
+        base = by * 6
+        if KNIGHT_ATTACKS[square] & bitboards[base + 1] or KING_ATTACKS[square] & bitboards[base + 5]:
+            return True
+        if PAWN_ATTACKS[by ^ 1][square] & bitboards[base]:
+            return True
+        occupied = bitboards[WHITE_OCCUPIED] | bitboards[BLACK_OCCUPIED]
+        queens = bitboards[base + 4]
+        if DIAGONAL_ATTACKS[square][DIAGONAL_MASKS[square] & occupied] & (bitboards[base + 2] | queens):
+            return True
+        rooks = bitboards[base + 3] | queens
+        return bool((RANK_ATTACKS[square][RANK_MASKS[square] & occupied]
+                     | FILE_ATTACKS[square][FILE_MASKS[square] & occupied]) & rooks)
+
+    def is_check(self) -> bool:
+        """Check whether the side to move is in check."""
+        return self.is_attacked(self.bitboards[self.turn * 6 + 5].bit_length() - 1, self.turn ^ 1)
+
+    def generate_moves(self, captures_only: bool = False) -> list[int]:
+        """
+        Generate the pseudo-legal moves. `make` tells whether a move is legal.
+
+        :param captures_only: Only generate captures and promotions to a queen, e.g. for a quiescence search.
+        :return: The moves.
+        """
+        us = self.turn
+        bitboards = self.bitboards
+        own = bitboards[WHITE_OCCUPIED + us]
+        enemy = bitboards[BLACK_OCCUPIED - us]
+        occupied = own | enemy
+        targets = enemy if captures_only else ~own & chess.BB_ALL
+        moves = self.pawn_moves(captures_only, enemy, occupied)
+        append = moves.append
+        base = us * 6
+        queens = bitboards[base + 4]
+
+        for piece, attack_table in ((base + 1, KNIGHT_ATTACKS), (base + 5, KING_ATTACKS)):
+            pieces = bitboards[piece]
+            while pieces:
+                from_square = (pieces & -pieces).bit_length() - 1
+                pieces &= pieces - 1
+                attacks = attack_table[from_square] & targets
+                while attacks:
+                    to_square = (attacks & -attacks).bit_length() - 1
+                    attacks &= attacks - 1
+                    append(from_square | to_square << 6)
+
+        pieces = bitboards[base + 2] | queens
+        while pieces:
+            from_square = (pieces & -pieces).bit_length() - 1
+            pieces &= pieces - 1
+            attacks = DIAGONAL_ATTACKS[from_square][DIAGONAL_MASKS[from_square] & occupied] & targets
+            while attacks:
+                to_square = (attacks & -attacks).bit_length() - 1
+                attacks &= attacks - 1
+                append(from_square | to_square << 6)
+
+        pieces = bitboards[base + 3] | queens
+        while pieces:
+            from_square = (pieces & -pieces).bit_length() - 1
+            pieces &= pieces - 1
+            attacks = (RANK_ATTACKS[from_square][RANK_MASKS[from_square] & occupied]
+                       | FILE_ATTACKS[from_square][FILE_MASKS[from_square] & occupied]) & targets
+            while attacks:
+                to_square = (attacks & -attacks).bit_length() - 1
+                attacks &= attacks - 1
+                append(from_square | to_square << 6)
+
+        if not captures_only and self.castling:
+            self.castling_moves(moves, occupied)
+        return moves
+
+    def pawn_moves(self, captures_only: bool, enemy: int, occupied: int) -> list[int]:
+        """Generate the pseudo-legal pawn moves, shifting all the pawns of the side to move at once."""
+        us = self.turn
+        pawns = self.bitboards[us * 6]
+        promotion_rank = PROMOTION_RANKS[us]
+        moves: list[int] = []
+        if us == WHITE:
+            single = pawns << 8 & ~occupied
+            double = (single & chess.BB_RANK_3) << 8 & ~occupied
+            captures = ((pawns << 7 & ~chess.BB_FILE_H & enemy, -7), (pawns << 9 & ~chess.BB_FILE_A & enemy, -9))
+            push = -8
+        else:
+            single = pawns >> 8 & ~occupied
+            double = (single & chess.BB_RANK_6) >> 8 & ~occupied
+            captures = ((pawns >> 9 & ~chess.BB_FILE_H & enemy, 9), (pawns >> 7 & ~chess.BB_FILE_A & enemy, 7))
+            push = 8
+
+        if captures_only:
+            single &= promotion_rank
+        else:
+            while double:
+                to_square = (double & -double).bit_length() - 1
+                double &= double - 1
+                moves.append((to_square + 2 * push) | to_square << 6 | DOUBLE_PUSH << 15)
+        for targets, offset in ((single, push),) + captures:
+            while targets:
+                to_square = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                if SQUARE_BB[to_square] & promotion_rank:
+                    add_promotions(moves, to_square + offset, to_square, captures_only)
+                else:
+                    moves.append((to_square + offset) | to_square << 6)
+
+        if self.ep_square >= 0:
+            capturers = PAWN_ATTACKS[us ^ 1][self.ep_square] & pawns
+            while capturers:
+                from_square = (capturers & -capturers).bit_length() - 1
+                capturers &= capturers - 1
+                moves.append(from_square | self.ep_square << 6 | EN_PASSANT << 15)
+        return moves
+
+    def castling_moves(self, moves: list[int], occupied: int) -> None:
+        """
+        Add the castling moves.
+
+        The squares that the king and the rook cross or end on must be empty, but for the king and the rook themselves, and
+        the king must not be in check or cross an attacked square. `make` checks the square where the king ends.
+        """
+        us = self.turn
+        them = us ^ 1
+        rights = [right for right in COLOR_CASTLING_RIGHTS[us] if self.castling & right]
+        if not rights:
+            return
+        king = self.bitboards[us * 6 + 5].bit_length() - 1
+        if self.is_attacked(king, them):
+            return
+        for right in rights:
+            rook = self.castling_rooks[right]
+            king_target, rook_target = CASTLING_TARGETS[right]
+            king_crosses = chess.between(king, king_target)
+            crossed = king_crosses | chess.between(rook, rook_target) | SQUARE_BB[king_target] | SQUARE_BB[rook_target]
+            if occupied & crossed & ~(SQUARE_BB[king] | SQUARE_BB[rook]):
+                continue
+            if any(self.is_attacked(square, them) for square in chess.scan_forward(king_crosses)):
+                continue
+            moves.append(king | king_target << 6 | CASTLING << 15)
+
+    def legal_moves(self) -> list[int]:
+        """Get the legal moves. This makes and unmakes every move, so a search should use `generate_moves` and `make`."""
+        legal = []
+        for move in self.generate_moves():
+            if self.make(move):
+                self.unmake()
+                legal.append(move)
+        return legal
+
+    def is_repetition(self) -> bool:
+        """Check whether the position occurred before, since the last capture or pawn move."""
+        keys = self.keys
+        key = self.key
+        index = self.key_index - 4
+        oldest = max(0, self.key_index - self.halfmove_clock)
+        while index >= oldest:
+            if keys[index] == key:
+                return True
+            index -= 2
+        return False
+
+    def is_insufficient_material(self) -> bool:
+        """Check whether neither side can checkmate, i.e. there are no pawns, rooks or queens and at most one minor piece."""
+        bitboards = self.bitboards
+        if bitboards[0] | bitboards[3] | bitboards[4] | bitboards[6] | bitboards[9] | bitboards[10]:
+            return False
+        return chess.popcount(bitboards[1] | bitboards[2] | bitboards[7] | bitboards[8]) <= 1
+
+    def is_draw(self) -> bool:
+        """Check for a draw by the fifty-move rule, insufficient material, or a repetition of an earlier position."""
+        return self.halfmove_clock >= 100 or self.is_insufficient_material() or self.is_repetition()
+
+    def evaluate(self) -> int:
+        """Get the piece-square score, weighted by the game phase, from the point of view of the side to move."""
+        phase = min(self.phase, FULL_PHASE)
+        score = (self.middlegame * phase + self.endgame * (FULL_PHASE - phase)) // FULL_PHASE
+        return -score if self.turn else score
+
+    def piece_type_at(self, square: int) -> Optional[int]:
+        """Get the python-chess piece type of the piece on the square, or `None` if the square is empty."""
+        piece = self.squares[square]
+        return None if piece == EMPTY else piece % 6 + 1
+
+    def to_move(self, move: int) -> chess.Move:
+        """Convert a move to a `chess.Move` for the `chess.Board` that the position was made from."""
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        promotion = move >> 12 & 7
+        if move >> 15 == CASTLING and self.chess960:
+            to_square = self.castling_rook_moves[to_square][0]
+        return chess.Move(from_square, to_square, promotion or None)
+
+    def from_move(self, move: chess.Move) -> int:
+        """Convert a legal `chess.Move` to a move of this position."""
+        for candidate in self.legal_moves():
+            if self.to_move(candidate) == move:
+                return candidate
+        raise ValueError(f"The move {move} is not legal in the position {self.to_board().fen()}.")
+
+    def to_board(self) -> chess.Board:
+        """Convert the position to a `chess.Board`, without the moves that led to it."""
+        board = chess.Board.empty(chess960=self.chess960)
+        for square, piece in enumerate(self.squares):
+            if piece != EMPTY:
+                board.set_piece_at(square, chess.Piece(piece % 6 + 1, piece < 6))
+        board.turn = self.turn == WHITE
+        board.castling_rights = 0
+        for right, rook_square in self.castling_rooks.items():
+            if self.castling & right:
+                board.castling_rights |= SQUARE_BB[rook_square]
+        board.ep_square = self.ep_square if self.ep_square >= 0 else None
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        return board
+
+
+def add_promotions(moves: list[int], from_square: int, to_square: int, queen_only: bool) -> None:
+    """Add the promotions of a pawn that reaches the last rank."""
+    if queen_only:
+        moves.append(from_square | to_square << 6 | chess.QUEEN << 12)
+    else:
+        for promotion in ALL_PROMOTIONS:
+            moves.append(from_square | to_square << 6 | promotion << 12)
+
+
+def castling_rooks(board: chess.Board) -> dict[int, int]:
+    """Get the square of the rook of each castling right of a board, e.g. `{WHITE_KINGSIDE: chess.H1}` in standard chess."""
+    rooks = {}
+    for rook_square in chess.scan_forward(board.clean_castling_rights()):
+        color = WHITE if SQUARE_BB[rook_square] & chess.BB_RANK_1 else BLACK
+        king_square = board.king(color == WHITE)
+        assert king_square is not None
+        kingside, queenside = COLOR_CASTLING_RIGHTS[color]
+        rooks[kingside if chess.square_file(rook_square) > chess.square_file(king_square) else queenside] = rook_square
+    return rooks
+
+
+def previous_keys(board: chess.Board) -> list[int]:
+    """Get the Zobrist hashes of the positions before the current one, since the last capture or pawn move, oldest first."""
+    plies = min(board.halfmove_clock, len(board.move_stack))
+    previous = board.copy(stack=plies)
+    keys = []
+    for _ in range(plies):
+        previous.pop()
+        keys.append(chess.polyglot.zobrist_hash(previous))
+    return keys[::-1]
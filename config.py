@@ -153,10 +153,30 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     """
     set_config_default(CONFIG, key="abort_time", default=20)
     set_config_default(CONFIG, key="move_overhead", default=1000)
+    set_config_default(CONFIG, "move_overhead_calibration", key="enabled", default=False)
+    set_config_default(CONFIG, "move_overhead_calibration", key="percentile", default=95, force_empty_values=True)
+    set_config_default(CONFIG, "move_overhead_calibration", key="window", default=50, force_empty_values=True)
+    set_config_default(CONFIG, "move_overhead_calibration", key="min", default=100, force_empty_values=True)
+    set_config_default(CONFIG, "move_overhead_calibration", key="max", default=5000, force_empty_values=True)
     set_config_default(CONFIG, key="rate_limiting_delay", default=0)
     set_config_default(CONFIG, key="pgn_file_grouping", default="game", force_empty_values=True)
     set_config_default(CONFIG, "engine", key="working_dir", default=os.getcwd(), force_empty_values=True)
     set_config_default(CONFIG, "engine", key="silence_stderr", default=False)
+    set_config_default(CONFIG, "engine", key="reuse_engine", default=False)
+    set_config_default(CONFIG, "engine", key="standby_engine", default=False)
+    set_config_default(CONFIG, "engine", key="shared_event_loop", default=False)
+    set_config_default(CONFIG, "engine", "remote", key="address", default="", force_empty_values=True)
+    set_config_default(CONFIG, "engine", "remote", key="protocol", default="uci", force_empty_values=True)
+    set_config_default(CONFIG, "engine", "streaming_search", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "streaming_search", key="stable_depths", default=0, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "ensemble", key="policy", default="strongest", force_empty_values=True)
+    set_config_default(CONFIG, "engine", "ensemble", key="first_below", default=10000, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "ensemble", key="engines", default=[], force_empty_values=True)
+    set_config_default(CONFIG, "engine", "cpu_budget", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "cpu_budget", key="threads", default=os.cpu_count() or 1, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "cpu_budget", key="hash", default=0, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "cpu_budget", key="speed_weights", default={}, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "cpu_budget", key="ponder_arbiter", default=False)
     set_config_default(CONFIG, "engine", "draw_or_resign", key="offer_draw_enabled", default=False)
     set_config_default(CONFIG, "engine", "draw_or_resign", key="offer_draw_for_egtb_zero", default=True)
     set_config_default(CONFIG, "engine", "draw_or_resign", key="resign_enabled", default=False)
@@ -197,6 +217,11 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="max_pieces", default=5)
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="move_quality", default="best")
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="min_dtm_to_consider_as_wdl_1", default=120)
+    set_config_default(CONFIG, "engine", "instant_moves", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "instant_moves", key="single_legal_move", default=True)
+    set_config_default(CONFIG, "engine", "instant_moves", key="forced_recapture", default=False)
+    set_config_default(CONFIG, "engine", "instant_moves", key="repeated_position", default=False)
+    set_config_default(CONFIG, "engine", "instant_moves", key="low_clock_time", default=0, force_empty_values=True)
     set_config_default(CONFIG, "engine", "polyglot", key="enabled", default=False)
     set_config_default(CONFIG, "engine", "polyglot", key="max_depth", default=8)
     set_config_default(CONFIG, "engine", "polyglot", key="selection", default="weighted_random")
@@ -216,6 +241,8 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "correspondence", key="checkin_period", default=600)
     set_config_default(CONFIG, "correspondence", key="move_time", default=60, force_empty_values=True)
     set_config_default(CONFIG, "correspondence", key="disconnect_time", default=300)
+    set_config_default(CONFIG, "correspondence", key="background_analysis", default=False)
+    set_config_default(CONFIG, "correspondence", key="background_analysis_time", default=1800, force_empty_values=True)
     set_config_default(CONFIG, "matchmaking", key="challenge_timeout", default=30, force_empty_values=True)
     CONFIG["matchmaking"]["challenge_timeout"] = max(CONFIG["matchmaking"]["challenge_timeout"], 1)
     set_config_default(CONFIG, "matchmaking", key="block_list", default=[], force_empty_values=True)
@@ -261,6 +288,34 @@ def log_config(CONFIG: CONFIG_DICT_TYPE) -> None:
     logger.debug("====================")
 
 
+def check_ensemble_config(engine_config: CONFIG_DICT_TYPE) -> None:
+    """
+    Check the engines of an ensemble (`engine.protocol: "ensemble"`).
+
+    :param engine_config: The `engine` section of the config.
+    """
+    ensemble = engine_config["ensemble"]
+    valid_policies = ["strongest", "first", "vote"]
+    config_assert(ensemble["policy"] in valid_policies,
+                  f'The ensemble policy "{ensemble["policy"]}" is not valid. Please choose from {valid_policies}.')
+    config_assert(isinstance(ensemble["engines"], list) and len(ensemble["engines"]) >= 2,
+                  "An ensemble needs at least two engines in `engine.ensemble.engines`.")
+    for member in ensemble["engines"]:
+        config_assert(isinstance(member, dict), f"Each engine of the ensemble must be a section, not `{member}`.")
+        member_config = engine_config | member
+        protocol = member.get("protocol", "uci")
+        config_assert(protocol in ["uci", "xboard", "remote"],
+                      f'The engines of an ensemble must be "uci", "xboard", or "remote" engines, not "{protocol}".')
+        if protocol == "remote":
+            config_assert(bool((member_config.get("remote") or {}).get("address")),
+                          f"The address of the engine host of the ensemble engine {member_config['name']} is not set.")
+        else:
+            engine = os.path.join(member_config["dir"], member_config["name"])
+            config_assert(os.path.isfile(engine), f"The engine {engine} file does not exist.")
+            config_assert(os.access(engine, os.X_OK),
+                          f"The engine {engine} doesn't have execute (x) permission. Try: chmod +x {engine}")
+
+
 def validate_config(CONFIG: CONFIG_DICT_TYPE) -> None:
     """Check if the config is valid."""
     check_config_section(CONFIG, "token", str)
@@ -278,12 +333,22 @@ def validate_config(CONFIG: CONFIG_DICT_TYPE) -> None:
                   f"Your engine's working directory `{working_dir}` is not a directory.")
 
     engine = os.path.join(CONFIG["engine"]["dir"], CONFIG["engine"]["name"])
-    config_assert(os.path.isfile(engine) or CONFIG["engine"]["protocol"] == "homemade",
+    local_engine = CONFIG["engine"]["protocol"] not in ["homemade", "remote", "ensemble"]
+    config_assert(os.path.isfile(engine) or not local_engine,
                   f"The engine {engine} file does not exist.")
-    config_assert(os.access(engine, os.X_OK) or CONFIG["engine"]["protocol"] == "homemade",
+    config_assert(os.access(engine, os.X_OK) or not local_engine,
                   f"The engine {engine} doesn't have execute (x) permission. Try: chmod +x {engine}")
 
-    if CONFIG["engine"]["protocol"] == "xboard":
+    remote = CONFIG["engine"]["remote"]
+    if CONFIG["engine"]["protocol"] == "remote":
+        config_assert(bool(remote["address"]), "The address of the engine host (`engine.remote.address`) is not set.")
+        config_assert(remote["protocol"] in ["uci", "xboard"],
+                      f'The protocol of the remote engine must be "uci" or "xboard", not "{remote["protocol"]}".')
+    if CONFIG["engine"]["protocol"] == "ensemble":
+        check_ensemble_config(CONFIG["engine"])
+
+    engine_protocol = remote["protocol"] if CONFIG["engine"]["protocol"] == "remote" else CONFIG["engine"]["protocol"]
+    if engine_protocol == "xboard":
         for section, subsection in (("online_moves", "online_egtb"),
                                     ("lichess_bot_tbs", "syzygy"),
                                     ("lichess_bot_tbs", "gaviota")):
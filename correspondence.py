@@ -0,0 +1,179 @@
+"""Analyse the positions of correspondence games in the background while lichess-bot is not connected to them."""
+import logging
+import time
+import multiprocessing.managers
+import multiprocessing.pool
+import chess
+import chess.engine
+import lichess
+from collections.abc import Callable, MutableMapping
+from config import Configuration
+from engine_wrapper import EngineWrapper
+from timer import Timer, seconds, minutes
+from typing import Any, Optional
+ANALYSIS_RESULTS_TYPE = MutableMapping[str, dict[str, Any]]
+STOP_FLAGS_TYPE = MutableMapping[str, bool]
+
+logger = logging.getLogger(__name__)
+
+# The analysis info that is kept. The other info (e.g. "string" or "currmove") is of no use for playing a move later.
+stored_info = ["score", "pv", "depth", "seldepth", "nodes", "time", "wdl"]
+
+
+class BackgroundAnalysis:
+    """
+    Schedule the analysis of correspondence games, in which it is our turn, on the game processes that aren't used.
+
+    The scheduler lives in the main process. A parked correspondence game (one that lichess-bot disconnected from)
+    is analysed until it is our turn to play it, `correspondence.background_analysis_time` has passed, or a game
+    process is needed for another game. The best line found is kept in `results`, which the game processes read
+    before searching for a move.
+    """
+
+    def __init__(self, config: Configuration, manager: multiprocessing.managers.SyncManager,
+                 analyze_game: Callable[..., None]) -> None:
+        """
+        Initialize the scheduler.
+
+        :param config: The config that the bot will use.
+        :param manager: The manager that creates the shared state.
+        :param analyze_game: The function run in a game process to analyse a game (`analyze_correspondence_game`).
+        """
+        self.enabled: bool = config.correspondence.background_analysis and config.engine.protocol != "homemade"
+        self.results: ANALYSIS_RESULTS_TYPE = manager.dict()
+        self.stop_flags: STOP_FLAGS_TYPE = manager.dict()
+        self.analyze_game = analyze_game
+        self.running: dict[str, tuple[str, multiprocessing.pool.AsyncResult[None]]] = {}  # game ID -> FEN and task
+        self.analyzed_positions: dict[str, str] = {}  # game ID -> FEN of the last position that was fully analysed
+        self.waiting_games: dict[str, str] = {}  # game ID -> FEN of parked games in which it is our turn
+        self.next_check = Timer()  # Look for games right away. Afterwards, look every minute.
+
+    def update(self, li: lichess.Lichess, pool: multiprocessing.pool.Pool, active_games: set[str], max_games: int,
+               analysis_args: dict[str, Any]) -> None:
+        """
+        Stop and start the analyses of correspondence games.
+
+        :param li: Provides communication with lichess.org.
+        :param pool: The pool of game processes.
+        :param active_games: The IDs of all the games that are being played.
+        :param max_games: The maximum number of games that can be played at the same time.
+        :param analysis_args: The arguments for `analyze_game` (besides the game ID).
+        """
+        if not self.enabled:
+            return
+
+        self.forget_finished_analyses()
+        self.stop_analyses(active_games, max_games)
+        if self.next_check.is_expired():
+            self.find_waiting_games(li, active_games)
+            self.next_check = Timer(minutes(1))
+        self.start_analyses(pool, active_games, max_games, analysis_args)
+
+    def forget_finished_analyses(self) -> None:
+        """Forget the analyses that ended, so their game processes can be used again."""
+        for game_id, (fen, analysis) in list(self.running.items()):
+            if analysis.ready():
+                del self.running[game_id]
+                if not self.stop_flags.pop(game_id, False):
+                    # The analysis used all of its time. An analysis that was stopped early may continue later.
+                    self.analyzed_positions[game_id] = fen
+
+    def stop_analyses(self, active_games: set[str], max_games: int) -> None:
+        """Stop analysing games that are being played, and free game processes for new games."""
+        free_slots = max_games - len(active_games)
+        for index, game_id in enumerate(self.running):
+            if (game_id in active_games or index >= free_slots) and not self.stop_flags.get(game_id):
+                logger.debug(f"Stopping background analysis of game {game_id}")
+                self.stop_flags[game_id] = True
+
+    def find_waiting_games(self, li: lichess.Lichess, active_games: set[str]) -> None:
+        """Find the parked correspondence games in which it is our turn."""
+        ongoing_games = li.get_ongoing_games()
+        self.waiting_games = {game["gameId"]: game["fen"] for game in ongoing_games
+                              if game["speed"] == "correspondence" and game["isMyTurn"]
+                              and game["gameId"] not in active_games}
+        ongoing_ids = {game["gameId"] for game in ongoing_games}
+        for game_id in list(self.results.keys()):
+            if game_id not in ongoing_ids:
+                del self.results[game_id]
+
+    def start_analyses(self, pool: multiprocessing.pool.Pool, active_games: set[str], max_games: int,
+                       analysis_args: dict[str, Any]) -> None:
+        """Start analysing waiting games in the free game processes."""
+        for game_id, fen in self.waiting_games.items():
+            if len(active_games) + len(self.running) >= max_games:
+                break
+            if game_id in active_games or game_id in self.running or self.analyzed_positions.get(game_id) == fen:
+                continue
+
+            logger.info(f"--- Analysing {game_id} in the background")
+            self.stop_flags[game_id] = False
+            self.running[game_id] = (fen, pool.apply_async(self.analyze_game,
+                                                           kwds=analysis_args | {"game_id": game_id},
+                                                           error_callback=analysis_error_handler))
+
+
+def analysis_error_handler(error: BaseException) -> None:
+    """Handle errors in the background analysis."""
+    logger.exception("Background analysis ended due to error:", exc_info=error)
+
+
+def analyze_position(engine: EngineWrapper, board: chess.Board, game_id: str, results: ANALYSIS_RESULTS_TYPE,
+                     stop_flags: STOP_FLAGS_TYPE, max_time: float) -> None:
+    """
+    Analyse a position until the analysis is stopped or the time runs out. Used in a game process.
+
+    The latest result is stored every time the engine reaches a new depth, so a stopped analysis is not lost.
+
+    :param engine: The engine.
+    :param board: The position of the game.
+    :param game_id: The ID of the game.
+    :param results: Where the results are stored (game ID -> FEN and analysis info).
+    :param stop_flags: The flags used by the main process to stop the analysis.
+    :param max_time: The maximum time to analyse, in seconds.
+    """
+    analysis_timer = Timer(seconds(max_time))
+    depth = 0
+    with engine.analysis(board) as analysis:
+        while not stop_flags.get(game_id, True) and not analysis_timer.is_expired():
+            time.sleep(0.5)
+            info = analysis.info
+            if info.get("pv") and info.get("depth", 0) > depth:
+                depth = info.get("depth", 0)
+                store_result(results, game_id, board, info)
+        analysis.stop()
+        analysis.wait()
+        info = analysis.info
+    if info.get("pv"):
+        store_result(results, game_id, board, info)
+    logger.info(f"Background analysis of {game_id} stopped at depth {info.get('depth')} after "
+                f"{info.get('time', 0):.0f} seconds with score {info.get('score')}")
+
+
+def store_result(results: ANALYSIS_RESULTS_TYPE, game_id: str, board: chess.Board, info: chess.engine.InfoDict) -> None:
+    """
+    Store the analysis of a position, so the game process can use it when it is our turn.
+
+    An analysis that continues after it was stopped starts from scratch, so it doesn't replace the stored analysis of the
+    same position until it has been running for longer.
+    """
+    previous = results.get(game_id)
+    if previous and previous["fen"] == board.fen() and previous["info"].get("time", 0) > info.get("time", 0):
+        return
+    results[game_id] = {"fen": board.fen(), "info": {key: value for key, value in info.items() if key in stored_info}}
+
+
+def stored_analysis(results: ANALYSIS_RESULTS_TYPE, game_id: str, board: chess.Board) -> Optional[chess.engine.InfoDict]:
+    """
+    Get the background analysis of the current position of a game.
+
+    :param results: The stored results (game ID -> FEN and analysis info).
+    :param game_id: The ID of the game.
+    :param board: The current position.
+    :return: The analysis info, or `None` if the current position wasn't analysed.
+    """
+    result = results.get(game_id)
+    if result is None or result["fen"] != board.fen():
+        return None
+    info: chess.engine.InfoDict = result["info"]
+    return info
@@ -0,0 +1,260 @@
+"""Share the CPU cores and hash memory of the computer between the engines of all concurrent games."""
+import os
+import logging
+import threading
+import multiprocessing.managers
+import chess
+from collections.abc import MutableMapping
+from config import Configuration
+from engine_wrapper import EngineWrapper
+from typing import Optional
+ENGINE_RESOURCES_TYPE = dict[str, int]
+ENGINE_ALLOCATIONS_TYPE = MutableMapping[str, ENGINE_RESOURCES_TYPE]
+PONDER_STATES_TYPE = MutableMapping[str, tuple[str, int]]
+PONDER_COUNTERS_TYPE = MutableMapping[str, int]
+
+logger = logging.getLogger(__name__)
+
+default_speed_weights = {"ultraBullet": 4, "bullet": 3, "blitz": 2, "rapid": 2, "classical": 1, "correspondence": 1}
+
+
+class CpuBudget:
+    """
+    Divide the engine threads (and optionally the hash memory) between the active games.
+
+    The budget lives in the main process. The allocations are written to a shared dictionary that the game processes read
+    before each move, so a change is sent to an engine with `setoption` between two moves.
+    """
+
+    def __init__(self, budget_cfg: Configuration, allocations: ENGINE_ALLOCATIONS_TYPE) -> None:
+        """
+        Initialize the budget.
+
+        :param budget_cfg: The `engine.cpu_budget` section of the config.
+        :param allocations: The shared dictionary (game ID -> resources) that the game processes read.
+        """
+        self.enabled: bool = budget_cfg.enabled
+        self.threads: int = budget_cfg.threads or os.cpu_count() or 1
+        self.hash: int = budget_cfg.hash or 0
+        self.speed_weights = default_speed_weights | dict((budget_cfg.speed_weights or Configuration({})).items())
+        self.allocations = allocations
+        self.speeds: dict[str, str] = {}
+        self.budgeted_games: set[str] = set()
+
+    def set_speed(self, game_id: str, speed: str) -> None:
+        """Record the time control of a game, so that faster games can get more threads."""
+        self.speeds[game_id] = speed
+        self.budgeted_games.clear()  # Force a new division the next time `update` is called.
+
+    def update(self, active_games: set[str]) -> None:
+        """
+        Divide the resources again if a game started or ended.
+
+        :param active_games: The IDs of all the games that are being played.
+        """
+        if not self.enabled or active_games == self.budgeted_games:
+            return
+
+        self.budgeted_games = set(active_games)
+        for game_id in list(self.speeds):
+            if game_id not in active_games:
+                del self.speeds[game_id]
+
+        weights = {game_id: self.weight(game_id) for game_id in active_games}
+        threads = divide(self.threads, weights)
+        hashes = divide(self.hash, weights) if self.hash else {}
+        for game_id in list(self.allocations.keys()):
+            if game_id not in active_games:
+                del self.allocations[game_id]
+        for game_id in active_games:
+            resources = {"threads": threads[game_id]}
+            if hashes:
+                resources["hash"] = hashes[game_id]
+            if self.allocations.get(game_id) != resources:
+                self.allocations[game_id] = resources
+        logger.debug(f"Engine resources: {dict(self.allocations)}")
+
+    def weight(self, game_id: str) -> int:
+        """Get how big the share of a game should be based on its time control."""
+        speed = self.speeds.get(game_id, "")
+        return max(1, int(self.speed_weights.get(speed, 1)))
+
+
+def divide(total: int, weights: dict[str, int]) -> dict[str, int]:
+    """
+    Divide an amount between games in proportion to their weights.
+
+    Every game gets at least 1. The remainder left by rounding down goes to the games with the largest fractional shares.
+
+    :param total: The amount to divide (e.g. the number of threads).
+    :param weights: The weight of every game.
+    :return: The share of every game.
+    """
+    if not weights:
+        return {}
+
+    total_weight = sum(weights.values())
+    exact_shares = {game_id: total * weight / total_weight for game_id, weight in weights.items()}
+    shares = {game_id: max(1, int(share)) for game_id, share in exact_shares.items()}
+    remainder = total - sum(shares.values())
+    by_fraction = sorted(exact_shares, key=lambda game_id: exact_shares[game_id] - int(exact_shares[game_id]), reverse=True)
+    for game_id in by_fraction[:max(0, remainder)]:
+        shares[game_id] += 1
+    return shares
+
+
+class PonderArbiter:
+    """
+    Decide which games may ponder, so that pondering engines don't take the cores that a thinking engine needs.
+
+    The arbiter is shared by the main process and all game processes. Its state is kept in managed dictionaries, so
+    every game process sees the same state. A game may ponder only if the threads of all the thinking and pondering
+    engines fit in the CPU budget. When a game starts thinking and there are not enough free threads, the permission to
+    ponder of other games is revoked and those games stop pondering.
+    """
+
+    counter_names = ["granted", "denied", "revoked", "hits", "misses"]
+
+    def __init__(self, budget_cfg: Configuration, manager: multiprocessing.managers.SyncManager) -> None:
+        """
+        Initialize the arbiter.
+
+        :param budget_cfg: The `engine.cpu_budget` section of the config.
+        :param manager: The manager that creates the shared state.
+        """
+        self.enabled: bool = budget_cfg.ponder_arbiter
+        self.capacity: int = budget_cfg.threads or os.cpu_count() or 1
+        self.states: PONDER_STATES_TYPE = manager.dict()
+        self.counters: PONDER_COUNTERS_TYPE = manager.dict({name: 0 for name in self.counter_names})
+        self.lock = manager.Lock()
+
+    def used_threads(self, excluded_game_id: str) -> int:
+        """Get the number of threads used by the thinking and pondering engines of all other games."""
+        return sum(threads for game_id, (state, threads) in self.states.items()
+                   if game_id != excluded_game_id and state in ["thinking", "pondering"])
+
+    def count(self, name: str) -> None:
+        """Increase one of the counters."""
+        with self.lock:
+            self.counters[name] += 1
+
+    def start_thinking(self, game_id: str, threads: int) -> None:
+        """
+        Record that a game is searching for a move and revoke the pondering of other games if there aren't enough threads.
+
+        :param game_id: The ID of the game.
+        :param threads: The number of threads the engine of this game uses.
+        """
+        with self.lock:
+            self.states[game_id] = ("thinking", threads)
+            pondering_games = [other_id for other_id, (state, _) in self.states.items() if state == "pondering"]
+            while pondering_games and self.used_threads("") > self.capacity:
+                revoked_game_id = pondering_games.pop()
+                self.states[revoked_game_id] = ("revoked", 0)
+                self.counters["revoked"] += 1
+                logger.debug(f"Revoked pondering of game {revoked_game_id} for game {game_id}")
+
+    def allow_pondering(self, game_id: str, threads: int) -> bool:
+        """
+        Decide whether a game may ponder after it made a move.
+
+        :param game_id: The ID of the game.
+        :param threads: The number of threads the engine of this game uses.
+        :return: Whether the engine may ponder.
+        """
+        with self.lock:
+            allowed = self.used_threads(game_id) + threads <= self.capacity
+            self.states[game_id] = ("pondering", threads) if allowed else ("waiting", 0)
+            self.counters["granted" if allowed else "denied"] += 1
+            return allowed
+
+    def is_revoked(self, game_id: str) -> bool:
+        """Check whether the permission to ponder of a game was revoked."""
+        state, _ = self.states.get(game_id, ("", 0))
+        return state == "revoked"
+
+    def stop(self, game_id: str) -> None:
+        """Record that a game is neither thinking nor pondering."""
+        with self.lock:
+            self.states[game_id] = ("waiting", 0)
+
+    def game_over(self, game_id: str) -> None:
+        """Forget a game that ended."""
+        with self.lock:
+            self.states.pop(game_id, None)
+
+    def stats(self) -> dict[str, int]:
+        """Get the counters of granted, denied, and revoked pondering, and of ponder hits and misses."""
+        return dict(self.counters)
+
+
+class PonderControl:
+    """Apply the decisions of the `PonderArbiter` to the engine of one game. Used in the game process."""
+
+    def __init__(self, arbiter: PonderArbiter, game_id: str, engine: EngineWrapper) -> None:
+        """
+        Initialize the control.
+
+        :param arbiter: The arbiter shared by all games.
+        :param game_id: The ID of the game.
+        :param engine: The engine playing the game.
+        """
+        self.arbiter = arbiter
+        self.game_id = game_id
+        self.engine = engine
+        self.pondering = False
+        self.stop_watching = threading.Event()
+        self.watcher: Optional[threading.Thread] = None
+
+    def before_move(self, board: chess.Board) -> None:
+        """Stop watching for revocations, count the ponder hit or miss, and tell the arbiter that the engine is thinking."""
+        if not self.arbiter.enabled:
+            return
+
+        self.stop_watcher()
+        expected_reply = self.engine.expected_reply
+        if self.pondering and expected_reply is not None and not self.arbiter.is_revoked(self.game_id):
+            hit = bool(board.move_stack) and board.move_stack[-1] == expected_reply
+            self.arbiter.count("hits" if hit else "misses")
+        self.pondering = False
+        self.arbiter.start_thinking(self.game_id, self.engine.thread_count())
+
+    def after_move(self) -> None:
+        """Ask the arbiter whether the engine may keep pondering. If not, stop pondering right away."""
+        if not self.arbiter.enabled:
+            return
+
+        if self.engine.expected_reply is None:
+            self.arbiter.stop(self.game_id)
+        elif self.arbiter.allow_pondering(self.game_id, self.engine.thread_count()):
+            self.pondering = True
+            self.stop_watching.clear()
+            self.watcher = threading.Thread(target=self.watch, daemon=True)
+            self.watcher.start()
+        else:
+            logger.debug(f"Not enough free threads to ponder in game {self.game_id}")
+            self.engine.stop_pondering()
+
+    def watch(self) -> None:
+        """Stop pondering as soon as the permission to ponder is revoked."""
+        while not self.stop_watching.wait(0.1):
+            if self.arbiter.is_revoked(self.game_id):
+                logger.debug(f"Stopping pondering in game {self.game_id}")
+                self.engine.stop_pondering()
+                self.pondering = False
+                return
+
+    def stop_watcher(self) -> None:
+        """Stop the thread watching for revocations. It must not stop the search that is about to start."""
+        self.stop_watching.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
+
+    def game_over(self) -> None:
+        """Stop watching and tell the arbiter that the game ended."""
+        if not self.arbiter.enabled:
+            return
+
+        self.stop_watcher()
+        self.arbiter.game_over(self.game_id)
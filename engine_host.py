@@ -0,0 +1,145 @@
+"""
+Run chess engines for lichess-bot on another computer.
+
+Every connection to the engine host starts a new engine process. Everything received from the connection is written to
+the engine's stdin and everything the engine writes to its stdout is sent back, so lichess-bot talks UCI or XBoard to
+the engine as if it had started the engine itself. The engine is stopped when the connection closes.
+
+Start the engine host with the address to listen on and the engine command, e.g.
+
+    python3 engine_host.py --listen 0.0.0.0:9000 -- ./engines/stockfish
+    python3 engine_host.py --listen unix:/tmp/engine.sock -- ./engines/stockfish
+
+and set `engine.protocol` to "remote" and `engine.remote.address` to the same address in the config of lichess-bot.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_address(address: str) -> tuple[str, str, int]:
+    """
+    Split an address into a UNIX socket path or a host and a port.
+
+    :param address: "unix:/path/to/socket" or "host:port".
+    :return: The socket path (or ""), the host (or ""), and the port (or 0).
+    """
+    if address.startswith("unix:"):
+        return address.removeprefix("unix:"), "", 0
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid engine host address: {address}. Expected host:port or unix:/path/to/socket.")
+    return "", host.strip("[]"), int(port)
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Copy data from a reader to a writer until the reader reaches the end."""
+    while data := await reader.read(CHUNK_SIZE):
+        writer.write(data)
+        await writer.drain()
+
+
+class EngineHost:
+    """Start an engine for every connection and connect the engine's stdin and stdout to the connection."""
+
+    def __init__(self, commands: list[str], max_engines: int, cwd: Optional[str], silence_stderr: bool) -> None:
+        """
+        Initialize the engine host.
+
+        :param commands: The engine path and the arguments for the engine.
+        :param max_engines: How many engines may run at the same time. Further connections are closed right away.
+        :param cwd: The working directory of the engines.
+        :param silence_stderr: Whether to discard what the engines write to their stderr.
+        """
+        self.commands = commands
+        self.max_engines = max_engines
+        self.cwd = cwd
+        self.silence_stderr = silence_stderr
+        self.running_engines = 0
+
+    async def serve(self, address: str) -> None:
+        """Accept connections until the engine host is stopped."""
+        socket_path, host, port = parse_address(address)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Engine host is listening on {address} and runs {self.commands}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Run an engine for one connection."""
+        peer = writer.get_extra_info("peername") or "local client"
+        if self.running_engines >= self.max_engines:
+            logger.warning(f"Refusing connection from {peer}: {self.running_engines} engines are already running.")
+            writer.close()
+            return
+
+        self.running_engines += 1
+        try:
+            await self.run_engine(reader, writer, peer)
+        finally:
+            self.running_engines -= 1
+            writer.close()
+
+    async def run_engine(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, peer: str) -> None:
+        """Start an engine and pass the data between the connection and the engine until one of them closes."""
+        engine = await asyncio.create_subprocess_exec(*self.commands, cwd=self.cwd, stdin=subprocess.PIPE,
+                                                      stdout=subprocess.PIPE,
+                                                      stderr=subprocess.DEVNULL if self.silence_stderr else None)
+        assert engine.stdin is not None and engine.stdout is not None
+        logger.info(f"Started engine with pid={engine.pid} for {peer}")
+        to_engine = asyncio.create_task(pipe(reader, engine.stdin))
+        from_engine = asyncio.create_task(pipe(engine.stdout, writer))
+        try:
+            done, _ = await asyncio.wait([to_engine, from_engine], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    logger.debug(f"Connection to {peer} failed: {task.exception()}")
+        finally:
+            to_engine.cancel()
+            from_engine.cancel()
+            await self.stop_engine(engine)
+        logger.info(f"Engine with pid={engine.pid} for {peer} stopped with exit code {engine.returncode}")
+
+    async def stop_engine(self, engine: asyncio.subprocess.Process) -> None:
+        """Give the engine a moment to exit after its stdin is closed, then kill it."""
+        if engine.stdin is not None:
+            engine.stdin.close()
+        try:
+            await asyncio.wait_for(engine.wait(), 5)
+        except asyncio.TimeoutError:
+            engine.kill()
+            await engine.wait()
+
+
+def main() -> None:
+    """Start the engine host."""
+    parser = argparse.ArgumentParser(description="Run chess engines for lichess-bot on this computer.")
+    parser.add_argument("--listen", default="127.0.0.1:9000",
+                        help="Address to listen on: host:port or unix:/path/to/socket (default: 127.0.0.1:9000).")
+    parser.add_argument("--max-engines", type=int, default=os.cpu_count() or 1,
+                        help="How many engines may run at the same time (default: the number of CPUs).")
+    parser.add_argument("--working-dir", help="Directory where the engines will read and write files.")
+    parser.add_argument("--silence-stderr", action="store_true", help="Discard what the engines write to their stderr.")
+    parser.add_argument("engine", nargs="+", help="The engine path followed by the arguments for the engine.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    host = EngineHost(args.engine, args.max_engines, args.working_dir, args.silence_stderr)
+    try:
+        asyncio.run(host.serve(args.listen))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
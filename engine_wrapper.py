@@ -1,6 +1,8 @@
 """Provides communication with the engine."""
 from __future__ import annotations
 import os
+import asyncio
+import json
 import chess.engine
 import chess.polyglot
 import chess.syzygy
@@ -12,13 +14,21 @@ import datetime
 import time
 import random
 import math
-from collections import Counter
+import copy
+import importlib
+import threading
+import concurrent.futures
+import multiprocessing.util
+from collections import Counter, defaultdict
 from collections.abc import Generator, Callable
 from contextlib import contextmanager
 import config
+import engine_host
 import model
 import lichess
+import search_workers
 from config import Configuration
+from instant_moves import InstantMoves
 from timer import Timer, msec, seconds, msec_str, sec_str, to_seconds
 from typing import Any, Optional, Union, Literal
 OPTIONS_TYPE = dict[str, Any]
@@ -27,30 +37,64 @@ COMMANDS_TYPE = list[str]
 LICHESS_EGTB_MOVE = dict[str, Any]
 CHESSDB_EGTB_MOVE = dict[str, Any]
 MOVE = Union[chess.engine.PlayResult, list[chess.Move]]
+# An online opening book: (lichess, position, config section) -> (move in UCI notation or None, move commentary)
+ONLINE_MOVE_SOURCE_TYPE = Callable[[lichess.Lichess, model.PositionContext, config.Configuration],
+                                   tuple[Optional[str], chess.engine.InfoDict]]
+# A search of some of the root moves in a worker process: (board, deadline, time limit, root moves, stats) -> move
+SEARCH_MOVES_TYPE = Callable[[chess.Board, "Deadline", chess.engine.Limit, list[chess.Move], "SearchStats"],
+                             chess.engine.PlayResult]
 
 logger = logging.getLogger(__name__)
 
 out_of_online_opening_book_moves: Counter[str] = Counter()
 
+# Engines that finished a game and are waiting in this process for the next one. The key identifies the engine command.
+idle_engines: defaultdict[str, list[EngineWrapper]] = defaultdict(list)
+idle_engines_finalizer: Optional[multiprocessing.util.Finalize] = None
+
 
 @contextmanager
-def create_engine(engine_config: config.Configuration) -> Generator[EngineWrapper, None, None]:
+def create_engine(engine_config: config.Configuration, reuse: bool = False) -> Generator[EngineWrapper, None, None]:
     """
     Create the engine.
 
     Use in a with-block to automatically close the engine when exiting the game.
 
     :param engine_config: The options for the engine.
+    :param reuse: Whether to take the engine from (and return it to) the idle engines of this process instead of
+        starting a new engine and quitting it afterwards. Only UCI and XBoard engines are reused.
     :return: An engine. Either UCI, XBoard, or Homemade.
     """
     cfg = engine_config.engine
-    engine_path = os.path.abspath(os.path.join(cfg.dir, cfg.name))
-    engine_type = cfg.protocol
-    commands = [engine_path]
-    if cfg.engine_options:
-        for k, v in cfg.engine_options.items():
-            commands.append(f"--{k}={v}" if v is not None else f"--{k}")
+    reuse = reuse and cfg.protocol != "homemade"
+    engine_key = get_engine_key(cfg)
+    engine = get_idle_engine(engine_key) if reuse else None
+    if engine is None:
+        engine = start_engine(cfg)
+    try:
+        yield engine
+    finally:
+        if reuse and engine.is_alive():
+            park_engine(engine_key, engine)
+        else:
+            engine.ping()
+            engine.quit()
+
+
+def start_engine(cfg: config.Configuration) -> EngineWrapper:
+    """
+    Start an engine.
 
+    :param cfg: The `engine` section of the config.
+    :return: An engine. Either UCI, XBoard, Homemade, or an ensemble of UCI and XBoard engines.
+    """
+    if cfg.protocol == "ensemble":
+        members = [start_engine(member_cfg) for member_cfg in get_ensemble_member_configs(cfg)]
+        return EnsembleEngine(members, cfg.ensemble, cfg.draw_or_resign)
+
+    remote_address = cfg.remote.address if cfg.protocol == "remote" else ""
+    engine_type = cfg.remote.protocol if remote_address else cfg.protocol
+    commands = [remote_address] if remote_address else get_engine_commands(cfg)
     stderr = None if cfg.silence_stderr else subprocess.DEVNULL
 
     Engine: Union[type[UCIEngine], type[XBoardEngine], type[MinimalEngine]]
@@ -62,15 +106,264 @@ def create_engine(engine_config: config.Configuration) -> Generator[EngineWrappe
         Engine = getHomemadeEngine(cfg.name)
     else:
         raise ValueError(
-            f"    Invalid engine type: {engine_type}. Expected xboard, uci, or homemade.")
+            f"    Invalid engine type: {engine_type}. Expected xboard, uci, homemade, remote, or ensemble.")
     options = remove_managed_options(cfg.lookup(f"{engine_type}_options") or config.Configuration({}))
     logger.debug(f"Starting engine: {commands}")
-    engine = Engine(commands, options, stderr, cfg.draw_or_resign, cwd=cfg.working_dir)
-    try:
-        yield engine
-    finally:
-        engine.ping()
-        engine.quit()
+    if issubclass(Engine, UCIEngine):
+        return Engine(commands, options, stderr, cfg.draw_or_resign, shared_event_loop=cfg.shared_event_loop,
+                      remote_address=remote_address, streaming_search=cfg.streaming_search, cwd=cfg.working_dir)
+    if issubclass(Engine, XBoardEngine):
+        return Engine(commands, options, stderr, cfg.draw_or_resign, shared_event_loop=cfg.shared_event_loop,
+                      remote_address=remote_address, cwd=cfg.working_dir)
+    return Engine(commands, options, stderr, cfg.draw_or_resign, cwd=cfg.working_dir)
+
+
+def get_engine_key(cfg: config.Configuration) -> str:
+    """
+    Identify the engine command, so that an idle engine is only reused by a game that uses the same engine.
+
+    :param cfg: The `engine` section of the config.
+    :return: A string that is the same for engines started with the same command.
+    """
+    if cfg.protocol == "ensemble":
+        return f"ensemble:{[get_engine_key(member_cfg) for member_cfg in get_ensemble_member_configs(cfg)]}"
+    if cfg.protocol == "remote":
+        return f"remote:{cfg.remote.protocol}:{cfg.remote.address}"
+    return f"{cfg.protocol}:{get_engine_commands(cfg)}:{cfg.working_dir}"
+
+
+def get_ensemble_member_configs(cfg: config.Configuration) -> list[config.Configuration]:
+    """
+    Get the config of each engine of an ensemble.
+
+    :param cfg: The `engine` section of the config.
+    :return: The `engine` section for each engine: the options of the engine in `ensemble.engines` replace the options
+        in the `engine` section. The protocol of an engine is "uci" unless it is set.
+    """
+    engine_cfg = {key: value for key, value in cfg.config.items() if key != "ensemble"} | {"protocol": "uci"}
+    return [config.Configuration(engine_cfg | member | {"remote": engine_cfg["remote"] | member.get("remote", {})})
+            for member in cfg.ensemble.engines or []]
+
+
+def get_engine_commands(cfg: config.Configuration) -> COMMANDS_TYPE:
+    """
+    Get the command that starts the engine.
+
+    :param cfg: The `engine` section of the config.
+    :return: The engine path followed by the arguments from `engine_options`.
+    """
+    commands = [os.path.abspath(os.path.join(cfg.dir, cfg.name))]
+    if cfg.engine_options:
+        for k, v in cfg.engine_options.items():
+            commands.append(f"--{k}={v}" if v is not None else f"--{k}")
+    return commands
+
+
+def start_standby_engine(engine_config: config.Configuration) -> None:
+    """
+    Start an engine and keep it idle in this process, so that the next game does not have to wait for the engine to start.
+
+    :param engine_config: The options for the engine.
+    """
+    if engine_config.engine.protocol == "homemade":
+        return
+
+    with create_engine(engine_config, reuse=True) as engine:
+        logger.debug(f"Standby engine is ready with pid={engine.get_pid()}")
+
+
+def park_engine(engine_key: str, engine: EngineWrapper) -> None:
+    """
+    Keep an engine idle in this process for the next game.
+
+    The first time, `quit_idle_engines` is registered to run when the process exits. A `multiprocessing` finalizer is used
+    instead of `atexit`, because the workers of a `multiprocessing.Pool` (e.g. after `maxtasksperchild` games, or when the
+    pool is closed) exit without running `atexit` functions. In the main process, the finalizers run at exit too.
+    """
+    global idle_engines_finalizer
+    if idle_engines_finalizer is None or not idle_engines_finalizer.still_active():
+        idle_engines_finalizer = multiprocessing.util.Finalize(None, quit_idle_engines, exitpriority=10)
+    idle_engines[engine_key].append(engine)
+
+
+def quit_idle_engines() -> None:
+    """Quit all the idle engines of this process, so they don't outlive it."""
+    for engines in idle_engines.values():
+        while engines:
+            engine = engines.pop()
+            try:
+                logger.debug(f"Quitting idle engine with pid={engine.get_pid()}")
+                engine.quit()
+            except Exception:
+                logger.debug("Could not quit an idle engine.", exc_info=True)
+
+
+def get_idle_engine(engine_key: str) -> Optional[EngineWrapper]:
+    """
+    Take an idle engine from a previous game and prepare it for a new game.
+
+    :param engine_key: Identifies the engine command, so that only an engine started with the same command is reused.
+    :return: The engine, or `None` if there are no idle engines that are still running.
+    """
+    engines = idle_engines[engine_key]
+    while engines:
+        engine = engines.pop()
+        if engine.is_alive():
+            logger.debug(f"Reusing engine with pid={engine.get_pid()}")
+            engine.new_game()
+            return engine
+        logger.debug(f"Discarding idle engine with pid={engine.get_pid()} because it stopped responding")
+    return None
+
+
+# The event loop that communicates with all the UCI and XBoard engines of this process (see `engine.shared_event_loop`).
+shared_loop: Optional[asyncio.AbstractEventLoop] = None
+shared_loop_lock = threading.Lock()
+
+
+def get_shared_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the event loop shared by the engines of this process. The loop is started the first time it is needed.
+
+    The loop runs in a daemon thread, so an idle engine does not keep the process alive.
+    """
+    global shared_loop
+    with shared_loop_lock:
+        if shared_loop is None:
+            if not isinstance(asyncio.get_event_loop_policy(), chess.engine.EventLoopPolicy):
+                asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+            loop_ready: concurrent.futures.Future[asyncio.AbstractEventLoop] = concurrent.futures.Future()
+
+            async def run_loop() -> None:
+                loop_ready.set_result(asyncio.get_running_loop())
+                await asyncio.get_running_loop().create_future()  # Run until the process exits.
+
+            threading.Thread(target=asyncio.run, args=(run_loop(),), name="engine-event-loop", daemon=True).start()
+            shared_loop = loop_ready.result()
+        return shared_loop
+
+
+def popen_engine(Protocol: type[chess.engine.Protocol], commands: COMMANDS_TYPE, shared_event_loop: bool,
+                 remote_address: str = "", **popen_args: Any) -> chess.engine.SimpleEngine:
+    """
+    Start an engine.
+
+    :param Protocol: `chess.engine.UciProtocol` or `chess.engine.XBoardProtocol`.
+    :param commands: The engine path and commands to send to the engine.
+    :param shared_event_loop: Whether to drive the engine from the event loop shared by all engines of this process
+        instead of a new event loop thread for this engine.
+    :param remote_address: If set, connect to an engine host (see engine_host.py) at this address instead of starting
+        the engine here. Remote engines always use the shared event loop.
+    :param popen_args: The arguments for starting the engine process (e.g. stderr and cwd).
+    :return: The engine.
+    """
+    if not shared_event_loop and not remote_address:
+        return chess.engine.SimpleEngine.popen(Protocol, commands, timeout=10., debug=False, setpgrp=False, **popen_args)
+
+    async def start_engine() -> chess.engine.SimpleEngine:
+        transport: asyncio.SubprocessTransport
+        if remote_address:
+            transport, protocol = await RemoteEngineConnection.connect(Protocol, remote_address)
+        else:
+            transport, protocol = await Protocol.popen(commands, setpgrp=False, **popen_args)
+        engine = chess.engine.SimpleEngine(transport, protocol, timeout=10.)
+        try:
+            await asyncio.wait_for(protocol.initialize(), 10.)
+        except BaseException:
+            engine.close()
+            raise
+        asyncio.get_running_loop().create_task(watch_returncode(engine))
+        return engine
+
+    async def watch_returncode(engine: chess.engine.SimpleEngine) -> None:
+        try:
+            engine.returncode.set_result(await engine.protocol.returncode)
+        finally:
+            engine.close()
+
+    return asyncio.run_coroutine_threadsafe(start_engine(), get_shared_event_loop()).result()
+
+
+class RemoteEngineConnection(asyncio.SubprocessTransport, asyncio.Protocol):
+    """
+    A connection to an engine that runs in an engine host (see engine_host.py).
+
+    To python-chess, the connection looks like the transport of an engine process: the engine protocol writes its
+    commands to "stdin" and receives the data from the socket as "stdout".
+    """
+
+    def __init__(self, engine_protocol: chess.engine.Protocol) -> None:
+        """:param engine_protocol: The UCI or XBoard protocol that talks to the engine."""
+        super().__init__()
+        self.engine_protocol = engine_protocol
+        self.socket: Optional[asyncio.Transport] = None
+        self.returncode: Optional[int] = None
+
+    @classmethod
+    async def connect(cls, Protocol: type[chess.engine.Protocol],
+                      address: str) -> tuple[RemoteEngineConnection, chess.engine.Protocol]:
+        """
+        Connect to an engine host.
+
+        :param Protocol: `chess.engine.UciProtocol` or `chess.engine.XBoardProtocol`.
+        :param address: "host:port" or "unix:/path/to/socket".
+        :return: The connection and the engine protocol, like `chess.engine.Protocol.popen`.
+        """
+        loop = asyncio.get_running_loop()
+        connection = cls(Protocol())
+        socket_path, host, port = engine_host.parse_address(address)
+        if socket_path:
+            await loop.create_unix_connection(lambda: connection, socket_path)
+        else:
+            await loop.create_connection(lambda: connection, host, port)
+        return connection, connection.engine_protocol
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Start the engine protocol when the socket is connected."""
+        assert isinstance(transport, asyncio.Transport)
+        self.socket = transport
+        self.engine_protocol.connection_made(self)
+
+    def data_received(self, data: bytes) -> None:
+        """Pass the output of the engine to the engine protocol."""
+        self.engine_protocol.pipe_data_received(1, data)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """Tell the engine protocol that the engine stopped. The engine host does not send the exit code."""
+        self.returncode = 0 if exc is None else 1
+        self.engine_protocol.connection_lost(exc)
+
+    def get_pid(self) -> int:
+        """Remote engines don't have a local pid."""
+        return -1
+
+    def get_pipe_transport(self, fd: int) -> Optional[asyncio.BaseTransport]:
+        """Get the socket, which acts as the stdin of the engine."""
+        return self.socket
+
+    def get_returncode(self) -> Optional[int]:
+        """Get the exit code after the connection is closed."""
+        return self.returncode
+
+    def is_closing(self) -> bool:
+        """Check whether the connection is closed or closing."""
+        return self.socket is None or self.socket.is_closing()
+
+    def close(self) -> None:
+        """Close the connection. The engine host stops the engine."""
+        if self.socket is not None:
+            self.socket.close()
+
+    def kill(self) -> None:
+        """Close the connection."""
+        self.close()
+
+    def terminate(self) -> None:
+        """Close the connection."""
+        self.close()
+
+    def send_signal(self, signal: int) -> None:
+        """Signals can't be sent to remote engines."""
 
 
 def remove_managed_options(config: config.Configuration) -> OPTIONS_TYPE:
@@ -87,6 +380,9 @@ PONDERPV_CHARACTERS = 6  # The length of ", Pv: ".
 class EngineWrapper:
     """A wrapper used by all engines (UCI, XBoard, Homemade)."""
 
+    # The engine options that set the number of threads and the hash size. See `set_resources`.
+    resource_options: dict[str, str] = {}
+
     def __init__(self, options: OPTIONS_TYPE, draw_or_resign: config.Configuration) -> None:
         """
         Initialize the values of the wrapper used by all engines (UCI, XBoard, Homemade).
@@ -98,8 +394,61 @@ class EngineWrapper:
         self.scores: list[chess.engine.PovScore] = []
         self.draw_or_resign = draw_or_resign
         self.go_commands = config.Configuration(options.pop("go_commands", {}) or {})
+        self.options = options
         self.move_commentary: list[MOVE_INFO_TYPE] = []
         self.comment_start_index = -1
+        self.game_number = 0
+        self.resources: dict[str, int] = {}
+        self.expected_reply: Optional[chess.Move] = None
+        self.move_sent_timer = Timer()
+        self.time_manager = TimeManager()
+        self.streaming_search: Optional[config.Configuration] = None
+        self.search_stopped = threading.Event()  # Set when the game ends. See `stop_search`.
+        self.search_lock = threading.Lock()
+        self.searching = False
+        self.analysis_searches: list[AnalysisSearch] = []  # The searches that `stop_search` stops with a result.
+        self.instant_moves = InstantMoves()
+
+    def new_game(self) -> None:
+        """
+        Prepare an engine that played a previous game for a new game.
+
+        The engine receives `ucinewgame` (or `new` for XBoard engines) before the next search and its options are reapplied.
+        """
+        self.reset_game_state()
+        self.engine.configure(self.options)
+
+    def reset_game_state(self) -> None:
+        """Forget the scores, commentary, instant moves and resources of the last game, without touching the engine."""
+        self.game_number += 1
+        self.search_stopped.clear()
+        self.instant_moves.new_game()
+        self.scores = []
+        self.move_commentary = []
+        self.comment_start_index = -1
+        self.resources = {}
+
+    def set_resources(self, resources: dict[str, int]) -> None:
+        """
+        Change the number of threads and the hash size of the engine.
+
+        Only the values that changed since the last call are sent to the engine, since configuring the engine stops
+        pondering.
+
+        :param resources: The share of the CPU budget for this game, with the keys `threads` and (optionally) `hash`.
+        """
+        changed = {name: value for name, value in resources.items() if self.resources.get(name) != value}
+        options = {self.resource_options[name]: value for name, value in changed.items() if name in self.resource_options}
+        supported_options = {name: value for name, value in options.items() if name in self.engine.options}
+        if supported_options:
+            logger.debug(f"Changing engine resources: {supported_options}")
+            self.engine.configure(supported_options)
+        self.resources.update(changed)
+
+    def thread_count(self) -> int:
+        """Get the number of threads the engine uses."""
+        configured_threads = self.options.get(self.resource_options.get("threads", ""), 1)
+        return int(self.resources.get("threads", configured_threads))
 
     def play_move(self,
                   board: chess.Board,
@@ -111,7 +460,8 @@ class EngineWrapper:
                   is_correspondence: bool,
                   correspondence_move_time: datetime.timedelta,
                   engine_cfg: config.Configuration,
-                  min_time: datetime.timedelta) -> None:
+                  min_time: datetime.timedelta,
+                  prior_analysis: Optional[chess.engine.InfoDict] = None) -> None:
         """
         Play a move.
 
@@ -125,26 +475,31 @@ class EngineWrapper:
         :param correspondence_move_time: The time the engine will think if `is_correspondence` is true.
         :param engine_cfg: Options for external moves (e.g. from an opening book), and for engine resignation and draw offers.
         :param min_time: Minimum time to spend, in seconds.
+        :param prior_analysis: The background analysis of this position in a correspondence game.
         :return: The move to play.
         """
         polyglot_cfg = engine_cfg.polyglot
         online_moves_cfg = engine_cfg.online_moves
         draw_or_resign_cfg = engine_cfg.draw_or_resign
         lichess_bot_tbs = engine_cfg.lichess_bot_tbs
+        self.expected_reply = None
+        position = model.PositionContext(board, game)
+        low_clock = self.instant_moves.low_clock(position, engine_cfg.instant_moves)
 
         best_move: MOVE
-        best_move = get_book_move(board, game, polyglot_cfg)
+        best_move = self.instant_moves.get_move(position, engine_cfg.instant_moves)
+
+        if best_move.move is None:
+            best_move = get_book_move(position, polyglot_cfg)
 
         if best_move.move is None:
-            best_move = get_egtb_move(board,
-                                      game,
+            best_move = get_egtb_move(position,
                                       lichess_bot_tbs,
                                       draw_or_resign_cfg)
 
-        if not isinstance(best_move, list) and best_move.move is None:
+        if not isinstance(best_move, list) and best_move.move is None and not low_clock:
             best_move = get_online_move(li,
-                                        board,
-                                        game,
+                                        position,
                                         online_moves_cfg,
                                         draw_or_resign_cfg)
 
@@ -159,7 +514,13 @@ class EngineWrapper:
             else:
                 time_limit = game_clock_time(board, game, setup_timer, move_overhead)
 
-            best_move = self.search(board, time_limit, can_ponder, draw_offered, best_move)
+            prior_result = self.prior_analysis_result(board, prior_analysis, time_limit, best_move)
+            search_result = prior_result or self.cancellable_search(board, time_limit, can_ponder, draw_offered, best_move)
+            if search_result is None:
+                logger.info("The game ended during the search. No move is sent.")
+                return
+            self.instant_moves.remember_search(position, search_result)
+            best_move = search_result
 
         # Heed min_time
         elapsed = setup_timer.time_since_reset()
@@ -171,6 +532,7 @@ class EngineWrapper:
         if best_move.resigned and len(board.move_stack) >= 2:
             li.resign(game.id)
         else:
+            self.move_sent_timer.reset()
             li.make_move(game.id, best_move)
 
     def add_go_commands(self, time_limit: chess.engine.Limit) -> chess.engine.Limit:
@@ -228,18 +590,142 @@ class EngineWrapper:
         :return: The move to play.
         """
         time_limit = self.add_go_commands(time_limit)
-        result = self.engine.play(board,
-                                  time_limit,
-                                  info=chess.engine.INFO_ALL,
-                                  ponder=ponder,
-                                  draw_offered=draw_offered,
-                                  root_moves=root_moves if isinstance(root_moves, list) else None)
+        if self.streaming_search is not None:
+            result = self.stoppable_search(board, time_limit, root_moves)
+            ponder = False
+        else:
+            result = self.engine.play(board,
+                                      time_limit,
+                                      game=self.game_number,
+                                      info=chess.engine.INFO_ALL,
+                                      ponder=ponder,
+                                      draw_offered=draw_offered,
+                                      root_moves=root_moves if isinstance(root_moves, list) else None)
+        self.expected_reply = result.ponder if ponder else None
         # Use null_score to have no effect on draw/resign decisions
         null_score = chess.engine.PovScore(chess.engine.Mate(1), board.turn)
         self.scores.append(result.info.get("score", null_score))
         result = self.offer_draw_or_resign(result, board)
         return result
 
+    def cancellable_search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+                           root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Search, unless the game ends before or during the search.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search.
+        :param ponder: Whether the engine can ponder.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine will only play a move that is in `root_moves`.
+        :return: The move to play, or `None` if `stop_search` was called.
+        """
+        with self.search_lock:
+            if self.search_stopped.is_set():
+                return None
+            self.searching = True
+        try:
+            result = self.search(board, time_limit, ponder, draw_offered, root_moves)
+        except concurrent.futures.CancelledError:
+            if not self.search_stopped.is_set():
+                raise
+            return None
+        finally:
+            with self.search_lock:
+                self.searching = False
+                self.analysis_searches = []
+        return None if self.search_stopped.is_set() else result
+
+    def stop_search(self) -> None:
+        """
+        Stop the search because the game ended, so the engine doesn't use the CPU for a move that can't be played.
+
+        This is called by the thread that reads the game stream while the game process waits for the search. Once it is
+        called, no search is started until the next game.
+        """
+        with self.search_lock:
+            self.search_stopped.set()
+            if self.searching:
+                logger.info("The game ended. Stopping the search.")
+                self.interrupt_search()
+
+    def interrupt_search(self) -> None:
+        """Interrupt the running search. Any command sent to the engine ends `play()` with `CancelledError`."""
+        if self.analysis_searches:
+            for search in self.analysis_searches:
+                search.stop("the game ended")
+        else:
+            self.engine.ping()
+
+    def stoppable_search(self, board: chess.Board, time_limit: chess.engine.Limit,
+                         root_moves: MOVE) -> chess.engine.PlayResult:
+        """
+        Search with `engine.analysis()`, so lichess-bot can stop the search and still get the best move found so far.
+
+        The search is stopped when the clock is about to run out (see `TimeManager.panic_time`), even if the engine
+        would keep searching. If `streaming_search.stable_depths` is set, the search is also stopped once the best move
+        stayed the same for that many depths and at least half of the planned time for the move was used.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search.
+        :param root_moves: If it is a list, the engine will only play a move that is in `root_moves`.
+        :return: The move to play.
+        """
+        assert self.streaming_search is not None
+        deadline = self.time_manager.deadline(board, time_limit)
+        search = AnalysisSearch(self, board, time_limit, root_moves, stable_depths=self.streaming_search.stable_depths,
+                                min_stable_time=deadline.soft_time / 2)
+        self.analysis_searches = [search]
+        panic_time = self.time_manager.panic_time(board, time_limit)
+        panic_timer = threading.Timer(panic_time, search.stop, kwargs={"reason": "the time for the move ran out"})
+        panic_timer.daemon = True
+        if math.isfinite(panic_time):
+            panic_timer.start()
+        try:
+            result = search.run()
+        finally:
+            panic_timer.cancel()
+
+        if search.stop_reason:
+            logger.info(f"Stopped the search after {msec_str(seconds(deadline.elapsed()))} ms because "
+                        f"{search.stop_reason}.")
+        if result is None:
+            raise chess.engine.EngineError("The engine did not find a move.")
+        return result
+
+    def prior_analysis_result(self, board: chess.Board, prior_analysis: Optional[chess.engine.InfoDict],
+                              time_limit: chess.engine.Limit, root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Use the background analysis of a correspondence game instead of searching.
+
+        :param board: The current position.
+        :param prior_analysis: The background analysis of this position.
+        :param time_limit: The time the search would use. The analysis is used only if it ran for at least as long.
+        :param root_moves: If it is a list, the move must be in `root_moves`, so the analysis is not used.
+        :return: The move to play, or `None` if the analysis can't be used.
+        """
+        if not prior_analysis or isinstance(root_moves, list) or not prior_analysis.get("pv"):
+            return None
+        if prior_analysis.get("time", 0) < (time_limit.time or 0) or prior_analysis["pv"][0] not in board.legal_moves:
+            return None
+
+        logger.info(f"Using the background analysis (depth {prior_analysis.get('depth')}, "
+                    f"{prior_analysis.get('time', 0):.0f} seconds)")
+        pv = prior_analysis["pv"]
+        result = chess.engine.PlayResult(pv[0], pv[1] if len(pv) > 1 else None, prior_analysis)
+        null_score = chess.engine.PovScore(chess.engine.Mate(1), board.turn)
+        self.scores.append(prior_analysis.get("score", null_score))
+        return self.offer_draw_or_resign(result, board)
+
+    def analysis(self, board: chess.Board) -> chess.engine.SimpleAnalysisResult:
+        """
+        Start analysing a position without a time limit.
+
+        :param board: The position to analyse.
+        :return: The running analysis. It ends when `stop` is called.
+        """
+        return self.engine.analysis(board, game=self.game_number)
+
     def comment_index(self, move_stack_index: int) -> int:
         """
         Get the index of a move for use in `comment_for_board_index`.
@@ -404,6 +890,18 @@ class EngineWrapper:
         """Ping the engine."""
         self.engine.ping()
 
+    def stop_pondering(self) -> None:
+        """Stop the engine from thinking on the opponent's time. Any command sent to the engine stops pondering."""
+        self.engine.ping()
+
+    def is_alive(self) -> bool:
+        """Check whether the engine is still running and responding."""
+        try:
+            self.ping()
+            return True
+        except (chess.engine.EngineError, asyncio.TimeoutError):
+            return False
+
     def send_game_result(self, game: model.Game, board: chess.Board) -> None:
         """
         Inform engine of the game ending.
@@ -442,8 +940,12 @@ class EngineWrapper:
 class UCIEngine(EngineWrapper):
     """The class used to communicate with UCI engines."""
 
+    resource_options = {"threads": "Threads", "hash": "Hash"}
+
     def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
-                 draw_or_resign: config.Configuration, **popen_args: str) -> None:
+                 draw_or_resign: config.Configuration, *, shared_event_loop: bool = False,
+                 remote_address: str = "", streaming_search: Optional[config.Configuration] = None,
+                 **popen_args: str) -> None:
         """
         Communicate with UCI engines.
 
@@ -451,19 +953,27 @@ class UCIEngine(EngineWrapper):
         :param options: The options to send to the engine.
         :param stderr: Whether we should silence the stderr.
         :param draw_or_resign: Options on whether the bot should resign or offer draws.
+        :param shared_event_loop: Whether to use the event loop shared by all engines of this process.
+        :param remote_address: The address of the engine host if the engine runs on another computer.
+        :param streaming_search: The `engine.streaming_search` section of the config.
         :param popen_args: The cwd of the engine.
         """
         super().__init__(options, draw_or_resign)
-        self.engine = chess.engine.SimpleEngine.popen_uci(commands, timeout=10., debug=False, setpgrp=False, stderr=stderr,
-                                                          **popen_args)
+        if streaming_search is not None and streaming_search.enabled:
+            self.streaming_search = streaming_search
+        self.engine = popen_engine(chess.engine.UciProtocol, commands, shared_event_loop, remote_address, stderr=stderr,
+                                   **popen_args)
         self.engine.configure(options)
 
 
 class XBoardEngine(EngineWrapper):
     """The class used to communicate with XBoard engines."""
 
+    resource_options = {"threads": "cores", "hash": "memory"}
+
     def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
-                 draw_or_resign: config.Configuration, **popen_args: str) -> None:
+                 draw_or_resign: config.Configuration, *, shared_event_loop: bool = False,
+                 remote_address: str = "", **popen_args: str) -> None:
         """
         Communicate with XBoard engines.
 
@@ -471,11 +981,13 @@ class XBoardEngine(EngineWrapper):
         :param options: The options to send to the engine.
         :param stderr: Whether we should silence the stderr.
         :param draw_or_resign: Options on whether the bot should resign or offer draws.
+        :param shared_event_loop: Whether to use the event loop shared by all engines of this process.
+        :param remote_address: The address of the engine host if the engine runs on another computer.
         :param popen_args: The cwd of the engine.
         """
         super().__init__(options, draw_or_resign)
-        self.engine = chess.engine.SimpleEngine.popen_xboard(commands, timeout=10., debug=False, setpgrp=False,
-                                                             stderr=stderr, **popen_args)
+        self.engine = popen_engine(chess.engine.XBoardProtocol, commands, shared_event_loop, remote_address, stderr=stderr,
+                                   **popen_args)
         egt_paths = options.pop("egtpath", {}) or {}
         features = self.engine.protocol.features if isinstance(self.engine.protocol, chess.engine.XBoardProtocol) else {}
         egt_features = features.get("egt", "")
@@ -490,6 +1002,290 @@ class XBoardEngine(EngineWrapper):
         self.engine.configure(options)
 
 
+class AnalysisSearch:
+    """
+    A search that can be stopped at any time and still returns the best move found so far.
+
+    The search uses `engine.analysis()` instead of `engine.play()`, because stopping `play()` early discards its result.
+    """
+
+    def __init__(self, engine: EngineWrapper, board: chess.Board, time_limit: chess.engine.Limit,
+                 root_moves: MOVE, stable_depths: int = 0, min_stable_time: float = 0.0) -> None:
+        """
+        Prepare the search.
+
+        :param engine: The engine. It must be a UCI or XBoard engine.
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search.
+        :param root_moves: If it is a list, the engine will only play a move that is in `root_moves`.
+        :param stable_depths: Stop the search once the best move is the same at this many consecutive depths. 0 turns
+            this off.
+        :param min_stable_time: The search is not stopped for a stable best move before this many seconds.
+        """
+        self.engine = engine
+        self.board = board
+        self.time_limit = engine.add_go_commands(copy.copy(time_limit))
+        self.root_moves = root_moves if isinstance(root_moves, list) else None
+        self.lock = threading.Lock()
+        self.analysis: Optional[chess.engine.SimpleAnalysisResult] = None
+        self.stop_requested = False
+        self.stop_reason = ""
+        self.stable_depths = stable_depths
+        self.min_stable_time = min_stable_time
+        self.result: Optional[chess.engine.PlayResult] = None
+
+    def run(self) -> Optional[chess.engine.PlayResult]:
+        """
+        Search until the engine stops by itself or `stop()` is called.
+
+        :return: The move found, or `None` if the engine did not find a move.
+        """
+        with self.engine.engine.analysis(self.board, self.time_limit, game=self.engine.game_number,
+                                         root_moves=self.root_moves) as analysis:
+            with self.lock:
+                self.analysis = analysis
+                if self.stop_requested:
+                    analysis.stop()
+            if self.stable_depths > 0:
+                self.watch_best_move(analysis)
+            best_move = analysis.wait()
+            info = analysis.info
+        if best_move.move is not None:
+            self.result = chess.engine.PlayResult(best_move.move, best_move.ponder, info)
+        return self.result
+
+    def watch_best_move(self, analysis: chess.engine.SimpleAnalysisResult) -> None:
+        """Read the info sent by the engine and stop the search once the best move stops changing."""
+        start = time.perf_counter()
+        best_move: Optional[chess.Move] = None
+        stable_count = 0
+        depth = 0
+        for info in analysis:
+            if info.get("multipv", 1) != 1 or not info.get("pv") or info.get("depth", 0) <= depth:
+                continue
+            depth = info.get("depth", 0)
+            move = info["pv"][0]
+            stable_count = stable_count + 1 if move == best_move else 1
+            best_move = move
+            if stable_count >= self.stable_depths and time.perf_counter() - start >= self.min_stable_time:
+                self.stop(f"the best move {move} did not change for {stable_count} depths")
+                return
+
+    def stop(self, reason: str = "") -> None:
+        """
+        Stop the search. `run()` returns the best move found so far.
+
+        :param reason: Why the search was stopped, for the logs.
+        """
+        with self.lock:
+            self.stop_reason = self.stop_reason or reason
+            self.stop_requested = True
+            if self.analysis is not None:
+                self.analysis.stop()
+
+
+class EnsembleEngine(EngineWrapper):
+    """
+    Search with several engines at the same time and play the move chosen by a policy.
+
+    The engines are listed from the strongest to the weakest. The policies are
+        - "strongest": Wait until all engines finish or the deadline passes, and play the move of the strongest engine.
+        - "first": Play the move of the engine that finishes first and stop the other engines.
+        - "vote": Wait until all engines finish or the deadline passes, and play the move found by most engines.
+    When the clock is below `first_below`, the "first" policy is used, so a fast engine can save the game from flagging.
+    The deadline is the hard deadline of the `TimeManager`. Engines that are still searching then are stopped and their
+    best move so far is used.
+    """
+
+    policies = ["strongest", "first", "vote"]
+
+    def __init__(self, members: list[EngineWrapper], ensemble_cfg: config.Configuration,
+                 draw_or_resign: config.Configuration) -> None:
+        """
+        Combine the engines.
+
+        :param members: The engines, from the strongest to the weakest. They must be UCI or XBoard engines.
+        :param ensemble_cfg: The `engine.ensemble` section of the config.
+        :param draw_or_resign: Options on whether the bot should resign or offer draws.
+        """
+        super().__init__({}, draw_or_resign)
+        self.members = members
+        self.engine = members[0].engine
+        self.policy: str = ensemble_cfg.policy
+        self.first_below = msec(ensemble_cfg.first_below)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(members), thread_name_prefix="ensemble")
+
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+               root_moves: MOVE) -> chess.engine.PlayResult:
+        """
+        Search with all engines and combine their moves. The ensemble doesn't ponder.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engines can search.
+        :param ponder: Ignored. The engines don't ponder.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engines will only play a move that is in `root_moves`.
+        :return: The move to play.
+        """
+        remaining, _ = self.time_manager.clock(board, time_limit)
+        low_clock = remaining is not None and time_limit.time is None and seconds(remaining) < self.first_below
+        policy = "first" if low_clock else self.policy
+        deadline = self.time_manager.deadline(board, time_limit)
+        searches = [AnalysisSearch(member, board, time_limit, root_moves) for member in self.members]
+        self.analysis_searches = searches
+        futures = {self.executor.submit(search.run): index for index, search in enumerate(searches)}
+        finished_first = self.wait_for_searches(futures, policy, deadline)
+        for search in searches:
+            search.stop()
+        concurrent.futures.wait(futures)
+
+        results = self.member_results(futures)
+        result = self.combine(board, results, policy, finished_first)
+        self.expected_reply = None
+        null_score = chess.engine.PovScore(chess.engine.Mate(1), board.turn)
+        self.scores.append(result.info.get("score", null_score))
+        result.draw_offered = draw_offered
+        return self.offer_draw_or_resign(result, board)
+
+    def wait_for_searches(self, futures: dict[concurrent.futures.Future[Optional[chess.engine.PlayResult]], int],
+                          policy: str, deadline: Deadline) -> Optional[int]:
+        """
+        Wait until the policy has the moves it needs or the deadline passes.
+
+        :return: The index of the first engine that found a move, if the policy is "first".
+        """
+        pending = set(futures)
+        while pending:
+            timeout = max(0.0, deadline.hard_end - time.perf_counter())
+            done, pending = concurrent.futures.wait(pending, timeout=timeout,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                logger.debug("Ensemble deadline passed. Stopping the engines that are still searching.")
+                return None
+            finished = [futures[future] for future in done if not future.exception() and future.result() is not None]
+            if policy == "first" and finished:
+                return min(finished)
+        return None
+
+    def member_results(self, futures: dict[concurrent.futures.Future[Optional[chess.engine.PlayResult]], int]
+                       ) -> list[Optional[chess.engine.PlayResult]]:
+        """
+        Get the result of each engine, after logging the engines that failed or found no move.
+
+        :return: The result of each engine, or `None` for an engine that failed or found no move.
+        :raises chess.engine.EngineError: If all the engines failed.
+        """
+        results: list[Optional[chess.engine.PlayResult]] = [None] * len(futures)
+        errors: list[BaseException] = []
+        for future, index in futures.items():
+            error = future.exception()
+            name = self.members[index].name()
+            if error is not None:
+                logger.warning(f"Engine {name} of the ensemble failed and is left out of this move: {error!r}")
+                errors.append(error)
+                continue
+            result = future.result()
+            results[index] = result
+            if result is None or result.move is None:
+                logger.warning(f"Engine {name} of the ensemble found no move before the deadline.")
+        if len(errors) == len(futures):
+            raise chess.engine.EngineError("All the engines of the ensemble failed.") from errors[0]
+        return results
+
+    def combine(self, board: chess.Board, results: list[Optional[chess.engine.PlayResult]], policy: str,
+                finished_first: Optional[int]) -> chess.engine.PlayResult:
+        """
+        Choose the move to play from the moves of the engines.
+
+        :param board: The current position.
+        :param results: The move of each engine, or `None` if an engine found no move.
+        :param policy: "strongest", "first", or "vote".
+        :param finished_first: The index of the engine that finished first, if the policy is "first".
+        :return: The move to play, with the info of the engine that found it and the number of nodes of all engines.
+        """
+        found = [(index, result) for index, result in enumerate(results) if result is not None and result.move is not None]
+        if not found:
+            raise chess.engine.EngineError("No engine of the ensemble found a move.")
+
+        votes = Counter(result.move for _, result in found)
+        if policy == "vote":
+            chosen_index, chosen = max(found, key=lambda index_result: (votes[index_result[1].move], -index_result[0]))
+        elif policy == "first" and finished_first is not None:
+            chosen_index, chosen = finished_first, results[finished_first] or found[0][1]
+        else:
+            chosen_index, chosen = found[0]
+
+        moves = ", ".join(f"{self.members[index].name()}: {board.san(result.move)}"
+                          for index, result in found if result.move is not None)
+        logger.info(f"Ensemble ({policy}) moves: {moves}")
+        info = chosen.info.copy()
+        info["nodes"] = sum(result.info.get("nodes", 0) for _, result in found)
+        info["string"] = (f"lichess-bot-source:{self.members[chosen_index].name()} ({policy}, "
+                          f"{votes[chosen.move]}/{len(self.members)} agree)")
+        return chess.engine.PlayResult(chosen.move, chosen.ponder, info)
+
+    def new_game(self) -> None:
+        """
+        Prepare all the engines for a new game.
+
+        The ensemble has no engine of its own (`self.engine` is the engine of the first member), so only its own state is
+        reset, and each member reapplies its options.
+        """
+        self.reset_game_state()
+        for member in self.members:
+            member.new_game()
+
+    def set_resources(self, resources: dict[str, int]) -> None:
+        """Divide the threads and hash size of the game equally between the engines."""
+        count = len(self.members)
+        for member in self.members:
+            member.set_resources({name: max(1, value // count) for name, value in resources.items()})
+
+    def thread_count(self) -> int:
+        """Get the number of threads used by all the engines."""
+        return sum(member.thread_count() for member in self.members)
+
+    def get_opponent_info(self, game: model.Game) -> None:
+        """Send the opponent's information to all the engines."""
+        for member in self.members:
+            member.get_opponent_info(game)
+
+    def name(self) -> str:
+        """Get the names of all the engines."""
+        return " + ".join(member.name() for member in self.members)
+
+    def get_pid(self) -> str:
+        """Get the pids of all the engines."""
+        return ",".join(member.get_pid() for member in self.members)
+
+    def ping(self) -> None:
+        """Ping all the engines."""
+        for member in self.members:
+            member.ping()
+
+    def stop_pondering(self) -> None:
+        """Do nothing, since the engines of an ensemble don't ponder."""
+
+    def is_alive(self) -> bool:
+        """Check whether all the engines are still running."""
+        return all(member.is_alive() for member in self.members)
+
+    def send_game_result(self, game: model.Game, board: chess.Board) -> None:
+        """Inform all the engines of the game ending."""
+        for member in self.members:
+            member.send_game_result(game, board)
+
+    def analysis(self, board: chess.Board) -> chess.engine.SimpleAnalysisResult:
+        """Analyse a position with the strongest engine."""
+        return self.members[0].analysis(board)
+
+    def quit(self) -> None:
+        """Close all the engines."""
+        self.executor.shutdown(wait=False)
+        for member in self.members:
+            member.quit()
+
+
 class MinimalEngine(EngineWrapper):
     """
     Subclass this to prevent a few random errors.
@@ -502,6 +1298,11 @@ class MinimalEngine(EngineWrapper):
     `notify`, etc.
     """
 
+    # `Threads` in `homemade_options` (or the share of `engine.cpu_budget`) is the number of processes of `parallel_search`.
+    resource_options = {"threads": "Threads", "hash": "Hash"}
+    # Set this to True in an engine whose `search` stops at `self.deadline`, so it can ponder. See `start_pondering`.
+    supports_pondering = False
+
     def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
                  draw_or_resign: Configuration, name: Optional[str] = None, **popen_args: str) -> None:
         """
@@ -515,6 +1316,240 @@ class MinimalEngine(EngineWrapper):
         self.engine_name = self.__class__.__name__ if name is None else name
 
         self.engine = FillerEngine(self, name=self.engine_name)
+        self.search_workers = search_workers.SearchWorkers()
+
+        # The search on the opponent's time. See `start_pondering`.
+        self.ponder_thread: Optional[threading.Thread] = None
+        self.ponder_board: Optional[chess.Board] = None  # The position after the expected reply.
+        self.ponder_deadline = Deadline(0, 0)
+        self.ponder_result: Optional[chess.engine.PlayResult] = None
+        self.ponder_score_count = 0  # The length of `scores` before pondering, to forget the score of a ponder miss.
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+
+        self.search_stats = SearchStats()  # The counters of the current search.
+        self.last_search_stats: Optional[SearchStats] = None  # The counters of the search for the last move played.
+        self.stats_directory: Optional[str] = options.get("StatsDirectory")  # Where the counters of each game are written.
+        self.stats_file: Optional[str] = None
+
+    def deadline(self, board: chess.Board, time_limit: chess.engine.Limit) -> Deadline:
+        """
+        Get the deadline of the search for a move. Call this at the start of `search`.
+
+        While pondering, the deadline only expires when the search is stopped, and it becomes the deadline of the move on a
+        ponder hit.
+
+        :param board: The current position.
+        :param time_limit: The `time_limit` passed to `search`.
+        :return: The deadline of the search.
+        """
+        if self.ponder_thread is not None and threading.current_thread() is self.ponder_thread:
+            return self.ponder_deadline
+        return self.time_manager.deadline(board, time_limit, self.search_stopped)
+
+    def play_move(self, board: chess.Board, game: model.Game, *args: Any, **kwargs: Any) -> None:
+        """Play a move (see `EngineWrapper.play_move`), and count the ponder hit or miss."""
+        self.last_search_stats = None
+        if self.stats_directory:
+            self.stats_file = os.path.join(self.stats_directory, f"{game.id}.jsonl")
+        if self.ponder_board is not None:
+            if board.fen() == self.ponder_board.fen():
+                self.ponder_hits += 1
+            else:
+                self.ponder_misses += 1
+                self.stop_pondering()
+        pondering = self.ponder_thread
+        try:
+            super().play_move(board, game, *args, **kwargs)
+        finally:
+            if pondering is not None and self.ponder_thread is pondering:
+                self.stop_pondering()  # The move was not searched, e.g. it came from the opening book.
+
+    def cancellable_search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+                           root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Search, or finish the search that pondered on this position. Then ponder on the expected reply if the engine can.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search.
+        :param ponder: Whether the engine can ponder.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine will only play a move that is in `root_moves`.
+        :return: The move to play, or `None` if `stop_search` was called.
+        """
+        result = self.finish_pondering(board, time_limit, root_moves)
+        if result is None:
+            self.search_stats = SearchStats()
+            result = super().cancellable_search(board, time_limit, ponder, draw_offered, root_moves)
+        elif self.search_stopped.is_set():
+            return None
+        if result is not None:
+            self.record_search_stats(board, result)
+        if (ponder and self.supports_pondering and result is not None and result.move is not None
+                and result.ponder is not None and not result.resigned):
+            self.start_pondering(board, result.move, result.ponder, time_limit)
+        return result
+
+    def start_pondering(self, board: chess.Board, move: chess.Move, expected_reply: chess.Move,
+                        time_limit: chess.engine.Limit) -> None:
+        """
+        Search the position after the move and the expected reply in a background thread until the opponent moves.
+
+        The search is the engine's own `search`, with a deadline that only expires when pondering stops. On a ponder hit,
+        the deadline of the move is given to the running search (see `Deadline.ponderhit`), and its result is played.
+
+        :param board: The position before the move.
+        :param move: The move that will be played.
+        :param expected_reply: The reply the engine expects.
+        :param time_limit: The `time_limit` of the move, which is also given to the search on the opponent's time.
+        """
+        ponder_board = board.copy()
+        ponder_board.push(move)
+        if not ponder_board.is_legal(expected_reply):
+            return
+        ponder_board.push(expected_reply)
+        if ponder_board.is_game_over():
+            return
+        self.expected_reply = expected_reply
+        self.ponder_board = ponder_board
+        self.ponder_result = None
+        self.ponder_score_count = len(self.scores)
+        self.ponder_deadline = Deadline(math.inf, math.inf, threading.Event())
+        self.search_stats = SearchStats()
+        self.ponder_thread = threading.Thread(target=self.ponder, args=(ponder_board, time_limit), name="ponder", daemon=True)
+        self.ponder_thread.start()
+
+    def ponder(self, board: chess.Board, time_limit: chess.engine.Limit) -> None:
+        """Search on the opponent's time. Runs in the thread started by `start_pondering`."""
+        try:
+            self.ponder_result = self.search(board, time_limit, True, False, chess.engine.PlayResult(None, None))
+        except Exception:
+            logger.exception("Error while pondering:")
+
+    def finish_pondering(self, board: chess.Board, time_limit: chess.engine.Limit,
+                         root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Give the deadline of the move to the search that pondered on this position, and wait for its move.
+
+        :return: The move of the search, or `None` if the engine did not ponder on this position.
+        """
+        if self.ponder_thread is None or self.ponder_board is None or board.fen() != self.ponder_board.fen():
+            return None
+        move_deadline = self.time_manager.deadline(board, time_limit, self.search_stopped)
+        logger.info(f"Ponder hit. Searching until {move_deadline}.")
+        self.ponder_deadline.ponderhit(move_deadline.soft_time, move_deadline.hard_time)
+        self.ponder_thread.join()
+        result = self.ponder_result
+        if result is None or (isinstance(root_moves, list) and result.move not in root_moves):
+            self.stop_pondering()
+            return None
+        self.ponder_thread = None
+        self.ponder_board = None
+        return result
+
+    def stop_pondering(self) -> None:
+        """Stop the search on the opponent's time, and forget its result."""
+        if self.ponder_thread is None:
+            return
+        self.ponder_deadline.stopped.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_board = None
+        self.ponder_result = None
+        del self.scores[self.ponder_score_count:]
+
+    def stop_search(self) -> None:
+        """Stop the search, and the search on the opponent's time, because the game ended."""
+        super().stop_search()
+        self.ponder_deadline.stopped.set()
+
+    def record_search_stats(self, board: chess.Board, result: chess.engine.PlayResult) -> None:
+        """
+        Add the counters of the search to the move's `info`, and write them to the file of the game.
+
+        :param board: The position that was searched.
+        :param result: The move found by the search.
+        """
+        stats = self.search_stats
+        stats.add_to_info(result.info)
+        self.last_search_stats = stats
+        if not self.stats_file:
+            return
+        record: dict[str, Any] = {"ply": len(board.move_stack), "fen": board.fen(),
+                                  "move": result.move.uci() if result.move else None,
+                                  "depth": result.info.get("depth")} | stats.record()
+        try:
+            os.makedirs(os.path.dirname(self.stats_file) or ".", exist_ok=True)
+            with open(self.stats_file, "a") as file:
+                file.write(json.dumps(record) + "\n")
+        except OSError:
+            logger.exception(f"Could not write the search stats to {self.stats_file}:")
+
+    def get_stats(self, for_chat: bool = False) -> list[str]:
+        """Get the stats of the engine, the counters of the search, and the share of ponder hits (except in the chat)."""
+        stats = super().get_stats(for_chat)
+        if for_chat:
+            return stats
+        search = self.last_search_stats
+        if search is not None and (search.qnodes or search.tt_hits or search.cutoffs or search.evals):
+            stats.append(f"Search: {self.readable_number(search.qnodes)} qnodes, {self.readable_number(search.tt_hits)} "
+                         f"TT hits, {self.readable_number(search.cutoffs)} cutoffs, {self.readable_number(search.evals)} "
+                         "evals")
+        if search is not None and search.iterations:
+            stats.append("Iterations: " + ", ".join(f"{depth} ({seconds:.2f}s)" for depth, seconds, _ in search.iterations))
+        pondered = self.ponder_hits + self.ponder_misses
+        if pondered:
+            stats.append(f"Ponder hits: {self.ponder_hits}/{pondered} ({100 * self.ponder_hits / pondered:.0f}%)")
+        return stats
+
+    def parallel_search(self, board: chess.Board, time_limit: chess.engine.Limit, root_moves: MOVE,
+                        search_moves: SEARCH_MOVES_TYPE) -> chess.engine.PlayResult:
+        """
+        Search with several processes, which each search a share of the root moves, and play the best move found.
+
+        The number of processes is `thread_count()`. Every process gets the same deadline, and the node limit is divided
+        between them. The nodes and the speed in `info` are the sums of all the processes.
+
+        :param board: The current position.
+        :param time_limit: The `time_limit` passed to `search`.
+        :param root_moves: The `root_moves` passed to `search`.
+        :param search_moves: The search of a worker: `search_moves(board, deadline, time_limit, moves, stats)` searches
+            only `moves`, counts in `stats` (a `SearchStats`), and returns a `PlayResult` with the score in `info`. It runs
+            in another process, so it must be a function at the top level of a module (or a `functools.partial` of one)
+            with picklable arguments. The counters of all the workers are added to `search_stats`.
+        :return: The move with the best score.
+        """
+        deadline = self.deadline(board, time_limit)
+        moves = root_moves if isinstance(root_moves, list) else list(board.legal_moves)
+        count = max(1, min(self.thread_count(), len(moves)))
+        worker_limit = copy.copy(time_limit)
+        if time_limit.nodes is not None:
+            worker_limit.nodes = max(1, time_limit.nodes // count)
+        calls: list[search_workers.CALL_TYPE] = [
+            (search_in_worker, (search_moves, board, deadline.soft_time - deadline.elapsed(),
+                                deadline.hard_time - deadline.elapsed(), time.time(), worker_limit, moves[index::count]))
+            for index in range(count)]
+        worker_results: Optional[list[tuple[chess.engine.PlayResult, SearchStats]]] = self.search_workers.run(
+            calls, deadline.stopped)
+        if worker_results is None:  # The game ended. The move is not sent.
+            return chess.engine.PlayResult(moves[0], None)
+        self.search_stats.add_workers([stats for _, stats in worker_results])
+        result = combine_search_results([result for result, _ in worker_results], deadline.elapsed())
+        # No pondering, because the deadlines of the workers can't be changed on a ponder hit.
+        return chess.engine.PlayResult(result.move, None, result.info)
+
+    def set_resources(self, resources: dict[str, int]) -> None:
+        """Remember the share of the CPU budget, which `thread_count()` returns. There are no engine options to send."""
+        self.resources.update(resources)
+
+    def quit(self) -> None:
+        """Stop pondering and the worker processes of `parallel_search`."""
+        self.stop_pondering()
+        self.search_workers.close()
+        super().quit()
+
+    def interrupt_search(self) -> None:
+        """Do nothing. The deadline of the search expires when the game ends, so the engine can return early."""
 
     def get_pid(self) -> str:
         """Homemade engines don't have a pid, so we return a question mark."""
@@ -576,18 +1611,262 @@ class FillerEngine:
         return method
 
 
+def search_in_worker(search_moves: SEARCH_MOVES_TYPE, board: chess.Board, soft_time: float, hard_time: float,
+                     sent_time: float, time_limit: chess.engine.Limit,
+                     moves: list[chess.Move]) -> tuple[chess.engine.PlayResult, SearchStats]:
+    """
+    Run the search of `MinimalEngine.parallel_search` in a worker process.
+
+    :param sent_time: When the search was sent to the worker (`time.time()`). The time to start the worker and to send the
+        search is taken from the deadline.
+    :return: The move found by the worker, and its counters.
+    """
+    delay = max(0.0, time.time() - sent_time)
+    stats = SearchStats()
+    result = search_moves(board, Deadline(soft_time - delay, hard_time - delay), time_limit, moves, stats)
+    return result, stats
+
+
+def combine_search_results(results: list[chess.engine.PlayResult], elapsed: float) -> chess.engine.PlayResult:
+    """
+    Choose the move with the best score from the searches of `MinimalEngine.parallel_search`.
+
+    :param results: The best move of each worker, with its score in `info`.
+    :param elapsed: The time spent by the search, in seconds.
+    :return: The best move, with the nodes and speed of all the workers.
+    """
+    def score(result: chess.engine.PlayResult) -> int:
+        pov_score = result.info.get("score")
+        return pov_score.relative.score(mate_score=40000) if pov_score is not None else -40001
+
+    best = max(results, key=score)
+    info = best.info.copy()
+    nodes = sum(result.info.get("nodes", 0) for result in results)
+    info["nodes"] = nodes
+    info["nps"] = int(nodes / elapsed) if elapsed > 0 else 0
+    info["time"] = elapsed
+    if "seldepth" in info:
+        info["seldepth"] = max(result.info.get("seldepth", 0) for result in results)
+    return chess.engine.PlayResult(best.move, best.ponder, info)
+
+
 def getHomemadeEngine(name: str) -> type[MinimalEngine]:
     """
     Get the homemade engine with name `name`. e.g. If `name` is `RandomMove` then we will return `strategies.RandomMove`.
 
+    A name with dots is the class of another module, e.g. `engines.mlengine.NeuralEngine`.
+
     :param name: The name of the homemade engine.
     :return: The engine with this name.
     """
-    import strategies
-    engine: type[MinimalEngine] = getattr(strategies, name)
+    module_name, _, class_name = name.rpartition(".")
+    module = importlib.import_module(module_name or "strategies")
+    engine: type[MinimalEngine] = getattr(module, class_name)
     return engine
 
 
+class Deadline:
+    """
+    The time a homemade engine may spend searching for a move.
+
+    The search should not start new work (e.g. a new iteration of iterative deepening) after the soft deadline, and must
+    return a move before the hard deadline. Checking the deadline only compares two numbers, so it can be done often.
+    """
+
+    def __init__(self, soft_time: float, hard_time: float, stopped: Optional[threading.Event] = None) -> None:
+        """
+        Start the clock of the search.
+
+        :param soft_time: Seconds until the soft deadline.
+        :param hard_time: Seconds until the hard deadline.
+        :param stopped: When this is set (e.g. because the game ended), both deadlines have passed.
+        """
+        self.start = time.perf_counter()
+        self.soft_time = soft_time
+        self.hard_time = hard_time
+        self.soft_end = self.start + soft_time
+        self.hard_end = self.start + hard_time
+        self.stopped = stopped or threading.Event()
+
+    def soft_expired(self) -> bool:
+        """Check whether the soft deadline has passed."""
+        return time.perf_counter() >= self.soft_end or self.stopped.is_set()
+
+    def hard_expired(self) -> bool:
+        """Check whether the hard deadline has passed."""
+        return time.perf_counter() >= self.hard_end or self.stopped.is_set()
+
+    def ponderhit(self, soft_time: float, hard_time: float) -> None:
+        """
+        Turn the deadline of a search on the opponent's time into the deadline of a move, after the expected reply was played.
+
+        The time spent pondering counts toward both deadlines, so the move is played right away if the search already
+        pondered longer than the time for the move.
+
+        :param soft_time: Seconds from the start of the move until the soft deadline.
+        :param hard_time: Seconds from the start of the move until the hard deadline.
+        """
+        now = time.perf_counter()
+        self.soft_time = soft_time
+        self.hard_time = hard_time
+        self.soft_end = max(now, self.start + soft_time)
+        self.hard_end = max(now, self.start + hard_time)
+
+    def elapsed(self) -> float:
+        """Get the number of seconds since the search started."""
+        return time.perf_counter() - self.start
+
+    def __repr__(self) -> str:
+        """Get the string representation of the deadline."""
+        return f"Deadline(soft={self.soft_time:.3f}s, hard={self.hard_time:.3f}s)"
+
+
+class SearchStats:
+    """
+    What a homemade engine did during the search for one move.
+
+    The engine adds to the counters of `MinimalEngine.search_stats` while it searches, e.g. `self.search_stats.nodes += 1`,
+    and calls `end_iteration` after each iteration of iterative deepening. After the search, the depth, nodes, speed and
+    time that the engine didn't put in `PlayResult.info` are taken from the counters (see `add_to_info`).
+    """
+
+    counter_names = ("nodes", "qnodes", "tt_hits", "cutoffs", "evals", "playouts")
+
+    def __init__(self) -> None:
+        """Start the clock of the search with all counters at zero."""
+        self.start = time.perf_counter()
+        self.nodes = 0  # All the positions searched, including `qnodes`.
+        self.qnodes = 0  # The positions searched by a quiescence search.
+        self.tt_hits = 0  # The lookups that found the position in the transposition table.
+        self.cutoffs = 0  # The positions where a move scored at least beta.
+        self.evals = 0  # The calls to the evaluation function.
+        self.playouts = 0  # The descents of a Monte Carlo tree search that gave a value to a leaf.
+        self.iterations: list[tuple[int, float, int]] = []  # The depth, seconds since the start, and nodes of each iteration.
+
+    def elapsed(self) -> float:
+        """Get the number of seconds since the search started."""
+        return time.perf_counter() - self.start
+
+    def end_iteration(self, depth: int) -> None:
+        """Record the time and the nodes at the end of an iteration of iterative deepening."""
+        self.iterations.append((depth, self.elapsed(), self.nodes))
+
+    def add_workers(self, workers: list[SearchStats]) -> None:
+        """
+        Add the counters of the searches of the worker processes of `MinimalEngine.parallel_search`.
+
+        An iteration is recorded when all the workers finished it, with the nodes of all the workers.
+        """
+        for name in self.counter_names:
+            setattr(self, name, getattr(self, name) + sum(getattr(worker, name) for worker in workers))
+        worker_iterations = [{depth: (seconds, nodes) for depth, seconds, nodes in worker.iterations} for worker in workers]
+        depths = sorted(set.intersection(*(set(iterations) for iterations in worker_iterations))) if workers else []
+        for depth in depths:
+            self.iterations.append((depth, max(iterations[depth][0] for iterations in worker_iterations),
+                                    sum(iterations[depth][1] for iterations in worker_iterations)))
+
+    def add_to_info(self, info: chess.engine.InfoDict) -> None:
+        """Add the depth, nodes, speed and time of the search to `info`, unless the engine already put them there."""
+        elapsed = self.elapsed()
+        if self.iterations and "depth" not in info:
+            info["depth"] = self.iterations[-1][0]
+        if self.nodes and "nodes" not in info:
+            info["nodes"] = self.nodes
+            info["nps"] = int(self.nodes / elapsed) if elapsed > 0 else 0
+        if (self.nodes or self.iterations) and "time" not in info:
+            info["time"] = elapsed
+
+    def record(self) -> dict[str, Any]:
+        """Get the counters, the time, and the iterations, e.g. to write them to a file."""
+        record: dict[str, Any] = {name: getattr(self, name) for name in self.counter_names}
+        record["time"] = round(self.elapsed(), 4)
+        record["iterations"] = [{"depth": depth, "time": round(seconds, 4), "nodes": nodes}
+                                for depth, seconds, nodes in self.iterations]
+        return record
+
+
+class TimeManager:
+    """
+    Turn the `chess.engine.Limit` given to a homemade engine into a `Deadline`.
+
+    With a clock, the time for a move is the remaining time divided by an estimate of the number of moves left in the
+    game, plus most of the increment. The estimate depends on the material left on the board, so fewer moves are expected
+    in an endgame. The hard deadline allows the search to run longer than planned, e.g. to finish an iteration, but it
+    always leaves time for the move overhead of the next move.
+    """
+
+    min_moves_to_go = 15  # The estimate of moves left when only kings and pawns are left.
+    max_moves_to_go = 40  # The estimate of moves left when all pieces are on the board.
+    increment_share = 0.75  # The part of the increment that is used for this move.
+    hard_factor = 3.0  # How many times longer than the soft deadline the search may run.
+    max_clock_share = 0.4  # The largest part of the remaining time that one move may use.
+    piece_values = {chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+    full_material = 62  # The sum of the piece values at the start of the game.
+
+    def deadline(self, board: chess.Board, time_limit: chess.engine.Limit,
+                 stopped: Optional[threading.Event] = None) -> Deadline:
+        """
+        Get the deadline of the search.
+
+        The clock in `time_limit` is the one passed to `search`, which already has the move overhead and the time since the
+        position was received taken off (see `game_clock_time`), so the overhead is not taken off again here.
+
+        :param board: The current position.
+        :param time_limit: The limit passed to `search`.
+        :param stopped: When this is set, the deadline has passed. See `Deadline`.
+        :return: The deadline of the search. Without a time limit, the deadline only expires when `stopped` is set.
+        """
+        if time_limit.time is not None:
+            return Deadline(time_limit.time, time_limit.time, stopped)
+
+        remaining, increment = self.clock(board, time_limit)
+        if remaining is None:
+            return Deadline(math.inf, math.inf, stopped)
+
+        moves_to_go = time_limit.remaining_moves or self.moves_to_go(board)
+        soft_time = remaining / moves_to_go + self.increment_share * increment
+        hard_time = min(soft_time * self.hard_factor, self.panic_time(board, time_limit))
+        return Deadline(min(soft_time, hard_time), hard_time, stopped)
+
+    def panic_time(self, board: chess.Board, time_limit: chess.engine.Limit) -> float:
+        """
+        Get the longest time a search may take, whatever the engine's own time management does.
+
+        Like in `deadline`, the clock in `time_limit` already has the move overhead taken off, so this is a share of it.
+
+        :param board: The current position.
+        :param time_limit: The limit passed to `search`.
+        :return: The time in seconds. Without a time limit, it is infinite.
+        """
+        if time_limit.time is not None:
+            return time_limit.time
+        remaining, _ = self.clock(board, time_limit)
+        if remaining is None:
+            return math.inf
+        return max(0.0, remaining * self.max_clock_share)
+
+    def clock(self, board: chess.Board, time_limit: chess.engine.Limit) -> tuple[Optional[float], float]:
+        """
+        Get the time left on the clock and the increment of the side to move.
+
+        :param board: The current position.
+        :param time_limit: The limit passed to `search`.
+        :return: The remaining time (`None` if there is no clock and no time limit) and the increment, in seconds.
+        """
+        if time_limit.time is not None:
+            return time_limit.time, 0.0
+        if board.turn == chess.WHITE:
+            return time_limit.white_clock, time_limit.white_inc or 0.0
+        return time_limit.black_clock, time_limit.black_inc or 0.0
+
+    def moves_to_go(self, board: chess.Board) -> float:
+        """Estimate the number of moves left in the game from the material on the board."""
+        material = sum(value * chess.popcount(board.pieces_mask(piece_type, color))
+                       for piece_type, value in self.piece_values.items() for color in chess.COLORS)
+        phase = min(1.0, material / self.full_material)
+        return self.min_moves_to_go + (self.max_moves_to_go - self.min_moves_to_go) * phase
+
+
 def single_move_time(board: chess.Board, game: model.Game, search_time: datetime.timedelta,
                      setup_timer: Timer, move_overhead: datetime.timedelta) -> chess.engine.Limit:
     """
@@ -653,19 +1932,16 @@ def check_for_draw_offer(game: model.Game) -> bool:
     return game.state.get(f"{game.opponent_color[0]}draw", False)
 
 
-def get_book_move(board: chess.Board, game: model.Game,
-                  polyglot_cfg: config.Configuration) -> chess.engine.PlayResult:
+def get_book_move(position: model.PositionContext, polyglot_cfg: config.Configuration) -> chess.engine.PlayResult:
     """Get a move from an opening book."""
+    board, game = position.board, position.game
     no_book_move = chess.engine.PlayResult(None, None)
     use_book = polyglot_cfg.enabled
     max_game_length = polyglot_cfg.max_depth * 2 - 1
     if not use_book or len(board.move_stack) > max_game_length:
         return no_book_move
 
-    if board.chess960:
-        variant = "chess960"
-    else:
-        variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
+    variant = "chess960" if board.chess960 else position.variant
 
     config.change_value_to_list(polyglot_cfg.config, "book", key=variant)
     books = polyglot_cfg.book.lookup(variant)
@@ -692,15 +1968,16 @@ def get_book_move(board: chess.Board, game: model.Game,
     return no_book_move
 
 
-def get_online_move(li: lichess.Lichess, board: chess.Board, game: model.Game, online_moves_cfg: config.Configuration,
+def get_online_move(li: lichess.Lichess, position: model.PositionContext, online_moves_cfg: config.Configuration,
                     draw_or_resign_cfg: config.Configuration) -> Union[chess.engine.PlayResult, list[chess.Move]]:
     """
     Get a move from an online source.
 
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
+    board, game = position.board, position.game
     online_egtb_cfg = online_moves_cfg.online_egtb
-    best_move, wdl, comment = get_online_egtb_move(li, board, game, online_egtb_cfg)
+    best_move, wdl, comment = get_online_egtb_move(li, position, online_egtb_cfg)
     if best_move is not None:
         can_offer_draw = draw_or_resign_cfg.offer_draw_enabled
         offer_draw_for_zero = draw_or_resign_cfg.offer_draw_for_egtb_zero
@@ -726,32 +2003,27 @@ def get_online_move(li: lichess.Lichess, board: chess.Board, game: model.Game, o
     if game_moves > max_opening_moves or out_of_online_opening_book_moves[game.id] >= max_out_of_book_moves:
         return chess.engine.PlayResult(None, None)
 
-    chessdb_cfg = online_moves_cfg.chessdb_book
-    lichess_cloud_cfg = online_moves_cfg.lichess_cloud_analysis
-    opening_explorer_cfg = online_moves_cfg.lichess_opening_explorer
-
-    for online_source, cfg in ((get_chessdb_move, chessdb_cfg),
-                               (get_lichess_cloud_move, lichess_cloud_cfg),
-                               (get_opening_explorer_move, opening_explorer_cfg)):
-        best_move, comment = online_source(li, board, game, cfg)
+    used_opening_books = False
+    for online_source, section in online_move_sources:
+        cfg = online_moves_cfg.lookup(section) or Configuration({})
+        used_opening_books = used_opening_books or bool(cfg.enabled)
+        best_move, comment = online_source(li, position, cfg)
         if best_move:
             return chess.engine.PlayResult(chess.Move.from_uci(best_move), None, comment)
 
     out_of_online_opening_book_moves[game.id] += 1
-    used_opening_books = chessdb_cfg.enabled or lichess_cloud_cfg.enabled or opening_explorer_cfg.enabled
     if out_of_online_opening_book_moves[game.id] == max_out_of_book_moves and used_opening_books:
         logger.info(f"Will stop using online opening books for game {game.id}.")
     return chess.engine.PlayResult(None, None)
 
 
-def get_chessdb_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
+def get_chessdb_move(li: lichess.Lichess, position: model.PositionContext,
                      chessdb_cfg: config.Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
     """Get a move from chessdb.cn's opening book."""
-    wb = "w" if board.turn == chess.WHITE else "b"
+    game = position.game
     use_chessdb = chessdb_cfg.enabled
-    time_left = msec(game.state[f"{wb}time"])
     min_time = seconds(chessdb_cfg.min_time)
-    if not use_chessdb or time_left < min_time or board.uci_variant != "chess":
+    if not use_chessdb or position.remaining_time < min_time or position.uci_variant != "chess":
         return None, {}
 
     move = None
@@ -763,7 +2035,7 @@ def get_chessdb_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
               "all": "query"}
     try:
         params = {"action": action[quality],
-                  "board": board.fen(),
+                  "board": position.fen,
                   "json": 1}
         data = li.online_book_get(site, params=params)
         if data["status"] == "ok":
@@ -772,7 +2044,7 @@ def get_chessdb_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
                 if depth >= chessdb_cfg.min_depth:
                     score = data["score"]
                     move = data["pv"][0]
-                    comment["score"] = chess.engine.PovScore(chess.engine.Cp(score), board.turn)
+                    comment["score"] = chess.engine.PovScore(chess.engine.Cp(score), position.turn)
                     comment["depth"] = data["depth"]
                     comment["pv"] = list(map(chess.Move.from_uci, data["pv"]))
                     comment["string"] = "lichess-bot-source:ChessDB"
@@ -786,14 +2058,13 @@ def get_chessdb_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
     return move, comment
 
 
-def get_lichess_cloud_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
+def get_lichess_cloud_move(li: lichess.Lichess, position: model.PositionContext,
                            lichess_cloud_cfg: config.Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
     """Get a move from the lichess's cloud analysis."""
-    wb = "w" if board.turn == chess.WHITE else "b"
-    time_left = msec(game.state[f"{wb}time"])
+    game, wb = position.game, position.wb
     min_time = seconds(lichess_cloud_cfg.min_time)
     use_lichess_cloud = lichess_cloud_cfg.enabled
-    if not use_lichess_cloud or time_left < min_time:
+    if not use_lichess_cloud or position.remaining_time < min_time:
         return None, {}
 
     move = None
@@ -801,13 +2072,12 @@ def get_lichess_cloud_move(li: lichess.Lichess, board: chess.Board, game: model.
 
     quality = lichess_cloud_cfg.move_quality
     multipv = 1 if quality == "best" else 5
-    variant = "standard" if board.uci_variant == "chess" else board.uci_variant
 
     try:
         data = li.online_book_get("https://lichess.org/api/cloud-eval",
-                                  params={"fen": board.fen(),
+                                  params={"fen": position.fen,
                                           "multiPv": multipv,
-                                          "variant": variant})
+                                          "variant": position.variant})
         if "error" not in data:
             depth = data["depth"]
             knodes = data["knodes"]
@@ -827,7 +2097,7 @@ def get_lichess_cloud_move(li: lichess.Lichess, board: chess.Board, game: model.
                     pv = random.choice(pvs)
                 move = pv["moves"].split()[0]
                 score = pv["cp"] if wb == "w" else -pv["cp"]
-                comment["score"] = chess.engine.PovScore(chess.engine.Cp(score), board.turn)
+                comment["score"] = chess.engine.PovScore(chess.engine.Cp(score), position.turn)
                 comment["depth"] = data["depth"]
                 comment["nodes"] = data["knodes"] * 1000
                 comment["pv"] = list(map(chess.Move.from_uci, pv["moves"].split()))
@@ -840,35 +2110,34 @@ def get_lichess_cloud_move(li: lichess.Lichess, board: chess.Board, game: model.
     return move, comment
 
 
-def get_opening_explorer_move(li: lichess.Lichess, board: chess.Board, game: model.Game,
+def get_opening_explorer_move(li: lichess.Lichess, position: model.PositionContext,
                               opening_explorer_cfg: config.Configuration
                               ) -> tuple[Optional[str], chess.engine.InfoDict]:
     """Get a move from lichess's opening explorer."""
-    wb = "w" if board.turn == chess.WHITE else "b"
-    time_left = msec(game.state[f"{wb}time"])
+    game, wb, variant = position.game, position.wb, position.variant
     min_time = seconds(opening_explorer_cfg.min_time)
     source = opening_explorer_cfg.source
-    if not opening_explorer_cfg.enabled or time_left < min_time or source == "master" and board.uci_variant != "chess":
+    if (not opening_explorer_cfg.enabled or position.remaining_time < min_time
+            or source == "master" and position.uci_variant != "chess"):
         return None, {}
 
     move = None
     comment: chess.engine.InfoDict = {}
-    variant = "standard" if board.uci_variant == "chess" else board.uci_variant
     try:
         if source == "masters":
-            params = {"fen": board.fen(), "moves": 100}
+            params = {"fen": position.fen, "moves": 100}
             response = li.online_book_get("https://explorer.lichess.ovh/masters", params)
             comment = {"string": "lichess-bot-source:Lichess Opening Explorer (Masters)"}
         elif source == "player":
             player = opening_explorer_cfg.player_name
             if not player:
                 player = game.username
-            params = {"player": player, "fen": board.fen(), "moves": 100, "variant": variant,
+            params = {"player": player, "fen": position.fen, "moves": 100, "variant": variant,
                       "recentGames": 0, "color": "white" if wb == "w" else "black"}
             response = li.online_book_get("https://explorer.lichess.ovh/player", params, True)
             comment = {"string": "lichess-bot-source:Lichess Opening Explorer (Player)"}
         else:
-            params = {"fen": board.fen(), "moves": 100, "variant": variant, "topGames": 0, "recentGames": 0}
+            params = {"fen": position.fen, "moves": 100, "variant": variant, "topGames": 0, "recentGames": 0}
             response = li.online_book_get("https://explorer.lichess.ovh/lichess", params)
             comment = {"string": "lichess-bot-source:Lichess Opening Explorer (Lichess)"}
         moves = []
@@ -890,7 +2159,17 @@ def get_opening_explorer_move(li: lichess.Lichess, board: chess.Board, game: mod
     return move, comment
 
 
-def get_online_egtb_move(li: lichess.Lichess, board: chess.Board, game: model.Game, online_egtb_cfg: config.Configuration
+# The online opening books, in the order in which they are asked for a move: (source, its section in
+# `engine.online_moves` in the config). Another source can be added by appending it, e.g. in the module of a homemade
+# engine: `engine_wrapper.online_move_sources.append((get_my_book_move, "my_book"))`. A source whose section is missing
+# from the config gets an empty `Configuration`.
+online_move_sources: list[tuple[ONLINE_MOVE_SOURCE_TYPE, str]] = [
+    (get_chessdb_move, "chessdb_book"),
+    (get_lichess_cloud_move, "lichess_cloud_analysis"),
+    (get_opening_explorer_move, "lichess_opening_explorer")]
+
+
+def get_online_egtb_move(li: lichess.Lichess, position: model.PositionContext, online_egtb_cfg: config.Configuration
                          ) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
     """
     Get a move from an online egtb (either by lichess or chessdb).
@@ -898,46 +2177,43 @@ def get_online_egtb_move(li: lichess.Lichess, board: chess.Board, game: model.Ga
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
     use_online_egtb = online_egtb_cfg.enabled
-    wb = "w" if board.turn == chess.WHITE else "b"
-    pieces = chess.popcount(board.occupied)
     source = online_egtb_cfg.source
     minimum_time = seconds(online_egtb_cfg.min_time)
     if (not use_online_egtb
-            or msec(game.state[f"{wb}time"]) < minimum_time
-            or board.uci_variant not in ["chess", "antichess", "atomic"]
+            or position.remaining_time < minimum_time
+            or position.uci_variant not in ["chess", "antichess", "atomic"]
             and source == "lichess"
-            or board.uci_variant != "chess"
+            or position.uci_variant != "chess"
             and source == "chessdb"
-            or pieces > online_egtb_cfg.max_pieces
-            or board.castling_rights):
+            or position.piece_count > online_egtb_cfg.max_pieces
+            or position.board.castling_rights):
 
         return None, -3, {}
 
     quality = online_egtb_cfg.move_quality
-    variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
 
     try:
         if source == "lichess":
-            return get_lichess_egtb_move(li, game, board, quality, variant)
+            return get_lichess_egtb_move(li, position, quality)
         elif source == "chessdb":
-            return get_chessdb_egtb_move(li, game, board, quality)
+            return get_chessdb_egtb_move(li, position, quality)
     except Exception:
         pass
 
     return None, -3, {}
 
 
-def get_egtb_move(board: chess.Board, game: model.Game, lichess_bot_tbs: config.Configuration,
+def get_egtb_move(position: model.PositionContext, lichess_bot_tbs: config.Configuration,
                   draw_or_resign_cfg: config.Configuration) -> Union[chess.engine.PlayResult, list[chess.Move]]:
     """
     Get a move from a local egtb.
 
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
-    best_move, wdl = get_syzygy(board, game, lichess_bot_tbs.syzygy)
+    best_move, wdl = get_syzygy(position, lichess_bot_tbs.syzygy)
     source = "lichess-bot-source:Syzygy EGTB"
     if best_move is None:
-        best_move, wdl = get_gaviota(board, game, lichess_bot_tbs.gaviota)
+        best_move, wdl = get_gaviota(position, lichess_bot_tbs.gaviota)
         source = "lichess-bot-source:Gaviota EGTB"
     if best_move:
         can_offer_draw = draw_or_resign_cfg.offer_draw_enabled
@@ -948,7 +2224,7 @@ def get_egtb_move(board: chess.Board, game: model.Game, lichess_bot_tbs: config.
         resign_on_egtb_loss = draw_or_resign_cfg.resign_for_egtb_minus_two
         resign = bool(can_resign and resign_on_egtb_loss and wdl == -2)
         wdl_to_score = {2: 9900, 1: 500, 0: 0, -1: -500, -2: -9900}
-        comment: chess.engine.InfoDict = {"score": chess.engine.PovScore(chess.engine.Cp(wdl_to_score[wdl]), board.turn),
+        comment: chess.engine.InfoDict = {"score": chess.engine.PovScore(chess.engine.Cp(wdl_to_score[wdl]), position.turn),
                                           "string": source}
         if isinstance(best_move, chess.Move):
             return chess.engine.PlayResult(best_move, None, comment, draw_offered=offer_draw, resigned=resign)
@@ -956,8 +2232,8 @@ def get_egtb_move(board: chess.Board, game: model.Game, lichess_bot_tbs: config.
     return chess.engine.PlayResult(None, None)
 
 
-def get_lichess_egtb_move(li: lichess.Lichess, game: model.Game, board: chess.Board, quality: str,
-                          variant: str) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
+def get_lichess_egtb_move(li: lichess.Lichess, position: model.PositionContext,
+                          quality: str) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
     """
     Get a move from lichess's egtb.
 
@@ -970,11 +2246,11 @@ def get_lichess_egtb_move(li: lichess.Lichess, game: model.Game, board: chess.Bo
                    "cursed-win": 1,
                    "maybe-win": 1,
                    "win": 2}
-    pieces = chess.popcount(board.occupied)
-    max_pieces = 7 if board.uci_variant == "chess" else 6
-    if pieces <= max_pieces:
-        data = li.online_book_get(f"http://tablebase.lichess.ovh/{variant}",
-                                  params={"fen": board.fen()})
+    game = position.game
+    max_pieces = 7 if position.uci_variant == "chess" else 6
+    if position.piece_count <= max_pieces:
+        data = li.online_book_get(f"http://tablebase.lichess.ovh/{position.variant}",
+                                  params={"fen": position.fen})
         if quality == "best":
             move = data["moves"][0]["uci"]
             wdl = name_to_wld[data["moves"][0]["category"]] * -1
@@ -1009,7 +2285,7 @@ def get_lichess_egtb_move(li: lichess.Lichess, game: model.Game, board: chess.Bo
     return None, -3, {}
 
 
-def get_chessdb_egtb_move(li: lichess.Lichess, game: model.Game, board: chess.Board,
+def get_chessdb_egtb_move(li: lichess.Lichess, position: model.PositionContext,
                           quality: str) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
     """
     Get a move from chessdb's egtb.
@@ -1028,9 +2304,10 @@ def get_chessdb_egtb_move(li: lichess.Lichess, game: model.Game, board: chess.Bo
                                    (0, 'i', 0),
                                    (20000, 'i', 20000 - score)], 30000 - score, score)
 
+    game = position.game
     action = "querypv" if quality == "best" else "queryall"
     data = li.online_book_get("https://www.chessdb.cn/cdb.php",
-                              params={"action": action, "board": board.fen(), "json": 1})
+                              params={"action": action, "board": position.fen, "json": 1})
     if data["status"] == "ok":
         if quality == "best":
             score = data["score"]
@@ -1061,7 +2338,7 @@ def get_chessdb_egtb_move(li: lichess.Lichess, game: model.Game, board: chess.Bo
     return None, -3, {}
 
 
-def get_syzygy(board: chess.Board, game: model.Game,
+def get_syzygy(position: model.PositionContext,
                syzygy_cfg: config.Configuration) -> tuple[Union[chess.Move, list[chess.Move], None], int]:
     """
     Get a move from local syzygy egtbs.
@@ -1069,9 +2346,10 @@ def get_syzygy(board: chess.Board, game: model.Game,
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
     if (not syzygy_cfg.enabled
-            or chess.popcount(board.occupied) > syzygy_cfg.max_pieces
-            or board.uci_variant not in ["chess", "antichess", "atomic"]):
+            or position.piece_count > syzygy_cfg.max_pieces
+            or position.uci_variant not in ["chess", "antichess", "atomic"]):
         return None, -3
+    game = position.game
     move: Union[chess.Move, list[chess.Move]]
     move_quality = syzygy_cfg.move_quality
     with chess.syzygy.open_tablebase(syzygy_cfg.paths[0]) as tablebase:
@@ -1079,7 +2357,7 @@ def get_syzygy(board: chess.Board, game: model.Game,
             tablebase.add_directory(path)
 
         try:
-            moves = score_syzygy_moves(board, dtz_scorer, tablebase)
+            moves = score_syzygy_moves(position, dtz_scorer, tablebase)
 
             best_wdl = max(map(dtz_to_wdl, moves.values()))
             good_moves = [(move, dtz) for move, dtz in moves.items() if dtz_to_wdl(dtz) == best_wdl]
@@ -1097,7 +2375,7 @@ def get_syzygy(board: chess.Board, game: model.Game,
         except KeyError:
             # Attempt to only get the WDL score. It returns moves of quality="suggest", even if quality is set to "best".
             try:
-                moves = score_syzygy_moves(board, lambda tablebase, b: -tablebase.probe_wdl(b), tablebase)
+                moves = score_syzygy_moves(position, lambda tablebase, b: -tablebase.probe_wdl(b), tablebase)
                 best_wdl = int(max(moves.values()))  # int is there only for mypy.
                 good_chess_moves = [chess_move for chess_move, wdl in moves.items() if wdl == best_wdl]
                 logger.debug("Found moves using 'move_quality'='suggest'. We didn't find an '.rtbz' file for this endgame."
@@ -1133,7 +2411,7 @@ def dtz_to_wdl(dtz: Union[int, float]) -> int:
     return piecewise_function([(-100, 'i', -1), (0, 'e', -2), (0, 'i', 0), (100, 'e', 2)], 1, dtz)
 
 
-def get_gaviota(board: chess.Board, game: model.Game,
+def get_gaviota(position: model.PositionContext,
                 gaviota_cfg: config.Configuration) -> tuple[Union[chess.Move, list[chess.Move], None], int]:
     """
     Get a move from local gaviota egtbs.
@@ -1141,9 +2419,10 @@ def get_gaviota(board: chess.Board, game: model.Game,
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
     if (not gaviota_cfg.enabled
-            or chess.popcount(board.occupied) > gaviota_cfg.max_pieces
-            or board.uci_variant != "chess"):
+            or position.piece_count > gaviota_cfg.max_pieces
+            or position.uci_variant != "chess"):
         return None, -3
+    game = position.game
     move: Union[chess.Move, list[chess.Move]]
     move_quality = gaviota_cfg.move_quality
     # Since gaviota TBs use dtm and not dtz, we have to put a limit where after it the position are considered to have
@@ -1158,7 +2437,7 @@ def get_gaviota(board: chess.Board, game: model.Game,
             tablebase.add_directory(path)
 
         try:
-            moves = score_gaviota_moves(board, dtm_scorer, tablebase)
+            moves = score_gaviota_moves(position, dtm_scorer, tablebase)
 
             best_wdl = max(map(dtm_to_gaviota_wdl, moves.values()))
             good_moves = [(move, dtm) for move, dtm in moves.items() if dtm_to_gaviota_wdl(dtm) == best_wdl]
@@ -1281,28 +2560,30 @@ def piecewise_function(range_definitions: list[tuple[Union[int, float], Literal[
     return last_value
 
 
-def score_syzygy_moves(board: chess.Board,
+def score_syzygy_moves(position: model.PositionContext,
                        scorer: Union[Callable[[chess.syzygy.Tablebase, chess.Board], int],
                                      Callable[[chess.syzygy.Tablebase, chess.Board], Union[int, float]]],
                        tablebase: chess.syzygy.Tablebase) -> dict[chess.Move, Union[int, float]]:
     """Score all the moves using syzygy egtbs."""
     moves = {}
-    for move in board.legal_moves:
-        board_copy = board.copy()
+    board_copy = position.board.copy()
+    for move in position.legal_moves:
         board_copy.push(move)
         moves[move] = scorer(tablebase, board_copy)
+        board_copy.pop()
     return moves
 
 
-def score_gaviota_moves(board: chess.Board,
+def score_gaviota_moves(position: model.PositionContext,
                         scorer: Callable[[Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase],
                                           chess.Board], int],
                         tablebase: Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase]
                         ) -> dict[chess.Move, int]:
     """Score all the moves using gaviota egtbs."""
     moves = {}
-    for move in board.legal_moves:
-        board_copy = board.copy()
+    board_copy = position.board.copy()
+    for move in position.legal_moves:
         board_copy.push(move)
         moves[move] = scorer(tablebase, board_copy)
+        board_copy.pop()
     return moves
@@ -0,0 +1 @@
+"""Engines that lichess-bot can run, and the homemade engines in Python that come with it."""
@@ -1,19 +1,665 @@
-# -*- coding: utf-8 -*-
 """
-Created on Tue Sep 26 11:11:28 2023
+A homemade engine that evaluates positions with a neural network.
 
-@author: osiri
+To play with it, set the engine protocol to `homemade` and the engine name to `engines.mlengine.NeuralEngine` in the config.
+The first layer of the network is updated with each move, like in NNUE engines, and the other layers evaluate the positions
+in batches with NumPy, so a search pays the overhead of Python once per batch instead of once per position.
 """
-
-from strategies import ExampleEngine
-import random
+from __future__ import annotations
+import logging
+import socket
+import struct
+import time
 import chess
+import chess.engine
+import numpy as np
+import numpy.typing as npt
+import engine_host
+import model_store
+from alphabeta import SearchAborted
+from mcts import Tree, EXPANDED, TERMINAL
+from bitboard import Position, EMPTY, EN_PASSANT, CASTLING
 from chess.engine import PlayResult
-from typing import Any
+from config import Configuration
+from engine_wrapper import COMMANDS_TYPE, OPTIONS_TYPE, MOVE, Deadline
+from strategies import ExampleEngine
+from typing import Any, Optional
+import random
+
+logger = logging.getLogger(__name__)
+
+FEATURES = 768  # One input for each of the 6 piece types of each side on each of the 64 squares.
+MATE_SCORE = 32000
+ARRAY_TYPE = npt.NDArray[np.float32]
+INFERENCE_HEADER = struct.Struct(">I")  # The number of positions in a request, or the width of the network in a greeting.
+WIRE_FLOAT = np.dtype("<f4")
+piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+
+# [side][piece][square] -> the input of the network for a piece (numbered as in `bitboard.Position`) on a square, from the
+# point of view of a side: the board is flipped for black, and the pieces of the side come first.
+feature_indexes = [[[((piece % 6) + (0 if piece // 6 == side else 6)) * 64 + (square ^ (56 * side)) for square in range(64)]
+                    for piece in range(12)] for side in range(2)]
+
 
 class RandomMove(ExampleEngine):
     """Get a random move."""
 
     def search(self, board: chess.Board, *args: Any) -> PlayResult:
         """Choose a random move."""
-        return PlayResult(random.choice(list(board.legal_moves)), None)
\ No newline at end of file
+        return PlayResult(random.choice(list(board.legal_moves)), None)
+
+
+class Network:
+    """
+    A fully connected network that scores positions in centipawns from the point of view of the side to move.
+
+    The hidden layers use ReLU. A trained network is loaded from a `.npz` file with the arrays `weights_0`, `bias_0`,
+    `weights_1`, `bias_1`, etc. The first weights have `FEATURES` rows, and the last layer has one output. Without a file,
+    the network only counts the material. The weights are mapped read-only from files by `model_store`, so all the games
+    share one copy.
+
+    To use less memory, the weights of a layer can be stored as `int8`, with `scale_0`, `scale_1`, etc. holding the factor
+    that turns them back into real weights (see `quantize_model.py`). The first weights, which are most of the network, are
+    kept as `int8`: the accumulator adds their rows to its `float32` output, which is then in units of the scale, and the
+    scale is moved into the weights of the second layer, which ReLU allows. The other layers are small, and NumPy multiplies
+    `float32` matrices much faster than integer ones, so they are converted to `float32` when the network is loaded. The
+    network is no faster with `int8` weights, only smaller.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """:param path: The `.npz` file with the weights of the network."""
+        layers: list[tuple[npt.NDArray[Any], ARRAY_TYPE, float]] = []  # The weights, the bias and the scale of each layer.
+        if path:
+            arrays = model_store.load(path)
+            index = 0
+            while f"weights_{index}" in arrays:
+                weights = arrays[f"weights_{index}"]
+                if weights.dtype == np.int8 and f"scale_{index}" not in arrays:
+                    raise ValueError(f"The int8 weights_{index} in {path} have no scale_{index}.")
+                scale = float(arrays[f"scale_{index}"].reshape(-1)[0]) if weights.dtype == np.int8 else 1.0
+                layers.append((weights, arrays[f"bias_{index}"], scale))
+                index += 1
+            if not layers or layers[0][0].shape[0] != FEATURES or layers[-1][0].shape[1] != 1:
+                raise ValueError(f"The network in {path} must have {FEATURES} inputs and 1 output.")
+        else:
+            weights = np.zeros((FEATURES, 1), dtype=np.float32)
+            for piece_type, value in piece_values.items():
+                weights[(piece_type - 1) * 64:piece_type * 64] = value
+                weights[(piece_type + 5) * 64:(piece_type + 6) * 64] = -value
+            layers.append((weights, np.zeros(1, dtype=np.float32), 1.0))
+
+        self.first_weights, first_bias, self.first_scale = layers[0]
+        self.first_bias: ARRAY_TYPE = first_bias
+        if self.first_scale != 1:
+            self.first_bias = (first_bias / self.first_scale).astype(np.float32)
+        self.layers: list[tuple[ARRAY_TYPE, ARRAY_TYPE]] = []  # The layers after the first, in `float32`.
+        for index, (weights, bias, scale) in enumerate(layers[1:]):
+            if index == 0:
+                scale *= self.first_scale
+            self.layers.append((weights if scale == 1 else (weights * np.float32(scale)).astype(np.float32), bias))
+
+    def evaluate(self, accumulators: ARRAY_TYPE) -> ARRAY_TYPE:
+        """
+        Evaluate a batch of positions with one forward pass through the layers after the first.
+
+        Each layer multiplies, adds its bias and applies ReLU to the same array, so no temporary array is allocated for the
+        bias and the activation.
+
+        :param accumulators: The output of the first layer, before the activation, for each position (see `Accumulator`).
+        :return: The score of each position.
+        """
+        if not self.layers:
+            output: ARRAY_TYPE = accumulators[:, 0] * np.float32(self.first_scale)
+            return output
+        activations = np.maximum(accumulators, 0)
+        for weights, bias in self.layers[:-1]:
+            activations = activations @ weights
+            activations += bias
+            np.maximum(activations, 0, out=activations)
+        weights, bias = self.layers[-1]
+        scores: ARRAY_TYPE = (activations @ weights)[:, 0] + bias[0]
+        return scores
+
+
+class Accumulator:
+    """
+    The output of the first layer of the network for the positions on the current line of a search, from both sides.
+
+    A move changes at most four inputs (e.g. the king and the rook when castling), so the output after a move is the output
+    before it plus and minus a few rows of the first weights, instead of a product of all the inputs with all the weights.
+    The outputs are kept in an array that is allocated once, so unmaking a move only goes back one row. The inputs don't
+    depend on the square of the king, so king moves are updated like the other moves, and a full refresh is only needed
+    at the root of the search.
+    """
+
+    def __init__(self, network: Network) -> None:
+        """:param network: The network whose first layer is accumulated."""
+        self.network = network
+        self.values = np.zeros((Position.stack_size + 1, 2, network.first_weights.shape[1]), dtype=np.float32)
+        self.ply = 0
+
+    def refresh(self, position: Position) -> None:
+        """Compute the output of the first layer from all the pieces of a new root position."""
+        self.ply = 0
+        for side in range(2):
+            indexes = [feature_indexes[side][piece][square] for square, piece in enumerate(position.squares) if piece != EMPTY]
+            self.values[0][side] = self.network.first_bias + self.network.first_weights[indexes].sum(axis=0)
+
+    def make(self, position: Position, move: int) -> None:
+        """
+        Update the output for a move. Call this before the move is made on the position.
+
+        :param position: The position before the move.
+        :param move: The move, as in `bitboard.Position`.
+        """
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        promotion = move >> 12 & 7
+        flag = move >> 15
+        piece = position.squares[from_square]
+        removed = [(piece, from_square)]
+        added = [(position.turn * 6 + promotion - 1 if promotion else piece, to_square)]
+        if flag == CASTLING:
+            rook_from, rook_to = position.castling_rook_moves[to_square]
+            removed.append((position.turn * 6 + 3, rook_from))
+            added.append((position.turn * 6 + 3, rook_to))
+        elif flag == EN_PASSANT:
+            removed.append(((position.turn ^ 1) * 6, to_square ^ 8))
+        elif position.squares[to_square] != EMPTY:
+            removed.append((position.squares[to_square], to_square))
+
+        weights = self.network.first_weights
+        values = self.values[self.ply + 1]
+        values[:] = self.values[self.ply]
+        for side in range(2):
+            output = values[side]
+            for changed_piece, square in added:
+                output += weights[feature_indexes[side][changed_piece][square]]
+            for changed_piece, square in removed:
+                output -= weights[feature_indexes[side][changed_piece][square]]
+        self.ply += 1
+
+    def unmake(self) -> None:
+        """Go back to the output before the last move."""
+        self.ply -= 1
+
+    def current(self, side: int) -> ARRAY_TYPE:
+        """Get the output of the first layer for the current position from the point of view of a side (0 is white)."""
+        output: ARRAY_TYPE = self.values[self.ply][side]
+        return output
+
+
+class InferenceClient:
+    """
+    A connection to an inference server (see `inference_server.py`) that runs the layers after the first for many games.
+
+    A request is the number of positions followed by the output of the first layer for each position, and the reply is the
+    score of each position, all as little-endian `float32`. When the connection is opened, the server sends the width of
+    its first layer, so a client whose network doesn't match is refused.
+    """
+
+    def __init__(self, address: str, width: int) -> None:
+        """
+        Connect to the server.
+
+        :param address: "unix:/path/to/socket" or "host:port".
+        :param width: The number of outputs of the first layer of the network of the engine.
+        """
+        socket_path, host, port = engine_host.parse_address(address)
+        if socket_path:
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(socket_path)
+        else:
+            self.connection = socket.create_connection((host, port))
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        (server_width,) = INFERENCE_HEADER.unpack(self.receive(INFERENCE_HEADER.size))
+        if server_width != width:
+            self.close()
+            raise ValueError(f"The inference server at {address} has a first layer with {server_width} outputs, "
+                             f"but the network of the engine has {width}.")
+
+    def evaluate(self, accumulators: ARRAY_TYPE) -> ARRAY_TYPE:
+        """Evaluate a batch of positions on the server. See `Network.evaluate`."""
+        data = np.ascontiguousarray(accumulators, dtype=WIRE_FLOAT).tobytes()
+        self.connection.sendall(INFERENCE_HEADER.pack(len(accumulators)) + data)
+        scores: ARRAY_TYPE = np.frombuffer(self.receive(len(accumulators) * WIRE_FLOAT.itemsize), dtype=WIRE_FLOAT)
+        return scores
+
+    def receive(self, size: int) -> bytes:
+        """Read exactly `size` bytes from the server."""
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            count = self.connection.recv_into(view[received:])
+            if not count:
+                raise ConnectionError("The inference server closed the connection.")
+            received += count
+        return bytes(data)
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.connection.close()
+
+
+class NeuralEngine(ExampleEngine):
+    """
+    Search one or two moves deep and evaluate the positions at the end with a neural network.
+
+    The first layer of the network is updated with each move (see `Accumulator`), and the other layers evaluate the positions
+    at the end of the search together, in batches. The options in `homemade_options` are `Model` (the `.npz` file of the
+    network, see `Network`), `BatchSize` (the most positions evaluated in one forward pass), `Depth` (1 or 2) and
+    `InferenceServer` (the address of an inference server that evaluates the batches of all the games together, see
+    `inference_server.py`). Standard chess and Chess960 are supported.
+    """
+
+    default_batch_size = 256
+
+    def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
+                 draw_or_resign: Configuration, name: Optional[str] = None, **popen_args: str) -> None:
+        """Load the network."""
+        super().__init__(commands, options, stderr, draw_or_resign, name, **popen_args)
+        self.network = Network(options.get("Model"))
+        self.accumulator = Accumulator(self.network)
+        self.batch_size = max(1, int(options.get("BatchSize", self.default_batch_size)))
+        self.batch = np.zeros((self.batch_size, self.network.first_weights.shape[1]), dtype=np.float32)
+        self.batch_leaves: list[int] = []  # The index in `leaf_scores` of each position in `batch`.
+        self.leaf_scores: list[float] = []
+        self.depth = 2 if int(options.get("Depth", 1)) >= 2 else 1
+        self.encoding_times: list[float] = []  # The seconds spent updating the first layer for each move.
+        self.inference_times: list[float] = []  # The seconds spent in the other layers for each move.
+        self.encoding_time = 0.0
+        self.inference_time = 0.0
+        self.nodes = 0
+        self.inference_client: Optional[InferenceClient] = None
+        if options.get("InferenceServer"):
+            try:
+                self.inference_client = InferenceClient(str(options["InferenceServer"]), self.network.first_weights.shape[1])
+            except OSError as error:
+                logger.warning(f"Could not connect to the inference server: {error}. The network is evaluated in the game.")
+
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+               root_moves: MOVE) -> chess.engine.PlayResult:
+        """
+        Choose the move with the best score.
+
+        Every move is scored one move deep first. With `Depth: 2`, the replies are searched if the soft deadline hasn't
+        passed, and the moves are scored two moves deep unless the hard deadline passes first.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search (e.g. we have 10 seconds and search up to depth 10).
+        :param ponder: Whether the engine can ponder after playing a move.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine should only play a move that is in `root_moves`.
+        :return: The move to play.
+        """
+        deadline = self.deadline(board, time_limit)
+        self.encoding_time = 0.0
+        self.inference_time = 0.0
+        self.nodes = 0
+        position = Position(board)
+        self.accumulator.refresh(position)
+        moves = [position.from_move(move) for move in root_moves] if isinstance(root_moves, list) else position.legal_moves()
+        depth = 1
+        scores, pvs = self.search_depth(position, moves, depth, deadline)
+        if self.depth == 2 and not deadline.soft_expired():
+            try:
+                scores, pvs = self.search_depth(position, moves, 2, deadline)
+                depth = 2
+            except SearchAborted:
+                self.batch_leaves = []
+                logger.debug("The hard deadline passed during the search of the replies. Using the scores of depth 1.")
+
+        best = max(range(len(moves)), key=lambda index: scores[index])
+        self.encoding_times.append(self.encoding_time)
+        self.inference_times.append(self.inference_time)
+        elapsed = deadline.elapsed()
+        logger.debug(f"Evaluated {self.nodes} positions. First layer: {self.encoding_time * 1000:.1f} ms. "
+                     f"Other layers: {self.inference_time * 1000:.1f} ms. Total: {elapsed * 1000:.1f} ms.")
+
+        info: chess.engine.InfoDict = {}
+        info["depth"] = depth
+        info["nodes"] = self.nodes
+        info["nps"] = int(self.nodes / elapsed) if elapsed > 0 else 0
+        info["time"] = elapsed
+        info["score"] = chess.engine.PovScore(pov_score(scores[best]), board.turn)
+        info["pv"] = [position.to_move(move) for move in pvs[best]]
+        self.scores.append(info["score"])
+        result = PlayResult(info["pv"][0], info["pv"][1] if len(info["pv"]) > 1 else None, info)
+        return self.offer_draw_or_resign(result, board)
+
+    def search_depth(self, position: Position, moves: list[int], depth: int,
+                     deadline: Deadline) -> tuple[list[float], list[list[int]]]:
+        """
+        Score each move one or two moves deep.
+
+        :return: The score and the principal variation of each move.
+        """
+        self.leaf_scores = []
+        self.batch_leaves = []
+        owners = self.expand(position, moves, depth, deadline)
+        self.flush_batch()
+
+        scores = [float(MATE_SCORE + 1)] * len(moves)
+        pvs = [[move] for move in moves]
+        for (index, reply, sign), leaf_score in zip(owners, self.leaf_scores):
+            score = sign * leaf_score
+            if score < scores[index]:  # The opponent chooses the reply that is worst for us.
+                scores[index] = score
+                pvs[index] = [moves[index]] if reply is None else [moves[index], reply]
+        self.nodes += len(self.leaf_scores)
+        self.search_stats.nodes += len(self.leaf_scores)
+        self.search_stats.end_iteration(depth)
+        return scores, pvs
+
+    def expand(self, position: Position, moves: list[int], depth: int,
+               deadline: Deadline) -> list[tuple[int, Optional[int], int]]:
+        """
+        Make each move and, at depth 2, each reply, and queue the positions at the end for evaluation.
+
+        At depth 2, the hard deadline is checked after the replies of each move, which is more often than once per batch,
+        and `SearchAborted` is raised when it has passed.
+
+        :return: For each queued position, the index of the move, the reply, and the sign that turns the score of the
+            position into the score of the move.
+        """
+        owners: list[tuple[int, Optional[int], int]] = []
+        for index, move in enumerate(moves):
+            self.make(position, move)
+            replies = [] if depth == 1 or position.is_draw() else position.generate_moves()
+            legal_replies = 0
+            for reply in replies:
+                if self.make(position, reply):
+                    legal_replies += 1
+                    self.add_leaf(position)
+                    owners.append((index, reply, 1))
+                    self.unmake(position)
+            if not legal_replies:
+                self.add_leaf(position)
+                owners.append((index, None, -1))
+            self.unmake(position)
+            if depth > 1 and deadline.hard_expired():
+                raise SearchAborted()
+        return owners
+
+    def make(self, position: Position, move: int) -> bool:
+        """Make a move on the position and the accumulator. Return whether the move is legal."""
+        update_start = time.perf_counter()
+        self.accumulator.make(position, move)
+        self.encoding_time += time.perf_counter() - update_start
+        if position.make(move):
+            return True
+        self.accumulator.unmake()
+        return False
+
+    def unmake(self, position: Position) -> None:
+        """Unmake the last move on the position and the accumulator."""
+        position.unmake()
+        self.accumulator.unmake()
+
+    def add_leaf(self, position: Position) -> None:
+        """Queue a position for the network, or score it now if the game is over."""
+        if position.is_draw():
+            self.leaf_scores.append(0.0)
+        elif not has_legal_move(position):
+            self.leaf_scores.append(-MATE_SCORE if position.is_check() else 0.0)
+        else:
+            self.batch[len(self.batch_leaves)] = self.accumulator.current(position.turn)
+            self.batch_leaves.append(len(self.leaf_scores))
+            self.leaf_scores.append(0.0)
+            if len(self.batch_leaves) == self.batch_size:
+                self.flush_batch()
+
+    def flush_batch(self) -> None:
+        """Evaluate the queued positions with one forward pass."""
+        if not self.batch_leaves:
+            return
+        inference_start = time.perf_counter()
+        scores = self.evaluate(self.batch[:len(self.batch_leaves)]).tolist()
+        self.search_stats.evals += len(self.batch_leaves)
+        self.inference_time += time.perf_counter() - inference_start
+        for leaf, score in zip(self.batch_leaves, scores):
+            self.leaf_scores[leaf] = score
+        self.batch_leaves = []
+
+    def evaluate(self, accumulators: ARRAY_TYPE) -> ARRAY_TYPE:
+        """Evaluate a batch on the inference server if there is one, or else in this process."""
+        if self.inference_client is not None:
+            try:
+                return self.inference_client.evaluate(accumulators)
+            except OSError as error:
+                logger.warning(f"Lost the connection to the inference server: {error}. The network is evaluated in the game.")
+                self.inference_client.close()
+                self.inference_client = None
+        return self.network.evaluate(accumulators)
+
+    def quit(self) -> None:
+        """Close the connection to the inference server."""
+        super().quit()
+        if self.inference_client is not None:
+            self.inference_client.close()
+            self.inference_client = None
+
+
+class MonteCarloEngine(NeuralEngine):
+    """
+    Search with a Monte Carlo tree search (PUCT) and evaluate the leaves with the neural network.
+
+    The nodes are kept in the arrays of `mcts.Tree`. Each batch descends from the root `BatchSize` times (32 by default).
+    The position at the end of each descent waits for the network with a virtual loss on its path, so the other descents of
+    the batch choose other lines, and then the whole batch is evaluated together. There is no policy network, so the prior
+    of a move favors captures and promotions. The tree below the move that was played and the reply of the opponent is kept
+    for the next search. `Hash` in `homemade_options` limits the memory of the tree, in megabytes. The other options are
+    those of `NeuralEngine`, except `Depth`.
+    """
+
+    default_batch_size = 32
+    exploration = 1.5  # The weight of the prior against the value in PUCT.
+    first_play_urgency = 0.2  # How much worse than its parent an unvisited move is assumed to be.
+    value_scale = 400.0  # A score of the network in centipawns becomes a value of tanh(score / value_scale).
+
+    def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
+                 draw_or_resign: Configuration, name: Optional[str] = None, **popen_args: str) -> None:
+        """Load the network and start with an empty tree."""
+        super().__init__(commands, options, stderr, draw_or_resign, name, **popen_args)
+        self.tree = Tree()
+        self.tree_board: Optional[chess.Board] = None  # The position at the root of the tree.
+        self.max_nodes = max(1024, int(options.get("Hash", 64)) * 1024 * 1024 // Tree.bytes_per_node)
+        self.playouts = 0
+        self.playouts_per_second = 0
+
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+               root_moves: MOVE) -> chess.engine.PlayResult:
+        """
+        Search until the deadline, the node limit (in playouts), or the memory limit, and play the most visited move.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search (e.g. we have 10 seconds and search up to depth 10).
+        :param ponder: Whether the engine can ponder after playing a move.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine should only play a move that is in `root_moves`.
+        :return: The move to play.
+        """
+        deadline = self.deadline(board, time_limit)
+        self.encoding_time = 0.0
+        self.inference_time = 0.0
+        self.playouts = 0
+        position = Position(board)
+        self.accumulator.refresh(position)
+        reused = self.reuse_tree(board, position, root_moves)
+        while not self.playouts or not deadline.soft_expired():
+            if (time_limit.nodes and self.playouts >= time_limit.nodes) or self.tree.size >= self.max_nodes:
+                break
+            self.run_batch(position)
+
+        elapsed = self.search_stats.elapsed()
+        self.search_stats.nodes += self.playouts
+        self.search_stats.playouts += self.playouts
+        self.playouts_per_second = int(self.playouts / elapsed) if elapsed > 0 else 0
+        self.encoding_times.append(self.encoding_time)
+        self.inference_times.append(self.inference_time)
+        logger.debug(f"{self.playouts} playouts, {reused} nodes reused, {self.tree.size} nodes. "
+                     f"First layer: {self.encoding_time * 1000:.1f} ms. Other layers: {self.inference_time * 1000:.1f} ms.")
+        result = self.play_result(board, position)
+        return self.offer_draw_or_resign(result, board)
+
+    def reuse_tree(self, board: chess.Board, position: Position, root_moves: MOVE) -> int:
+        """
+        Keep the part of the tree below the current position, or start a new tree.
+
+        :return: The number of nodes that were kept.
+        """
+        node = -1 if isinstance(root_moves, list) else self.find_node(board, position)
+        self.tree = self.tree.subtree(node) if node >= 0 and self.tree.state[node] == EXPANDED else Tree()
+        self.tree_board = board.copy()
+        if isinstance(root_moves, list):
+            moves = [position.from_move(move) for move in root_moves]
+            self.tree.expand(0, moves, move_priors(position, moves))
+        return self.tree.size if node >= 0 else 0
+
+    def find_node(self, board: chess.Board, position: Position) -> int:
+        """Find the node of the current position by following the moves played since the last search, or return -1."""
+        previous = self.tree_board
+        if previous is None:
+            return -1
+        searched = len(previous.move_stack)
+        if len(board.move_stack) < searched or board.move_stack[:searched] != previous.move_stack:
+            return -1
+        root = Position(previous)
+        node = 0
+        for move in board.move_stack[searched:]:
+            node = self.tree.find_child(node, root.from_move(move))
+            if node < 0:
+                return -1
+            root.make(root.from_move(move))
+        return node if root.key == position.key else -1
+
+    def run_batch(self, position: Position) -> None:
+        """Descend from the root up to `BatchSize` times, and evaluate the new leaves together."""
+        tree = self.tree
+        paths: list[list[int]] = []
+        for _ in range(self.batch_size):
+            path = self.select(position)
+            leaf = path[-1]
+            if tree.state[leaf] == EXPANDED:  # The leaf of another descent, which is still waiting for the network.
+                self.unwind(position, path)
+                break
+            value = -tree.value(leaf) if tree.state[leaf] == TERMINAL else self.expand_leaf(position, leaf)
+            if value is None:
+                self.batch[len(paths)] = self.accumulator.current(position.turn)
+                tree.add_virtual_loss(path)
+                paths.append(path)
+            else:
+                tree.backup(path, value, False)
+                self.playouts += 1
+            self.unwind(position, path)
+
+        if paths:
+            inference_start = time.perf_counter()
+            values = np.tanh(self.evaluate(self.batch[:len(paths)]) / self.value_scale).tolist()
+            self.search_stats.evals += len(paths)
+            self.inference_time += time.perf_counter() - inference_start
+            for path, leaf_value in zip(paths, values):
+                tree.backup(path, leaf_value, True)
+            self.playouts += len(paths)
+
+    def select(self, position: Position) -> list[int]:
+        """Descend from the root to a leaf, making the moves on the position. Return the nodes from the root to the leaf."""
+        tree = self.tree
+        node = 0
+        path = [node]
+        while tree.state[node] == EXPANDED and (node == 0 or tree.visits[node]):
+            node = tree.select_child(node, self.exploration, self.first_play_urgency)
+            self.make(position, int(tree.move[node]))
+            path.append(node)
+        return path
+
+    def unwind(self, position: Position, path: list[int]) -> None:
+        """Unmake the moves of a descent."""
+        for _ in range(len(path) - 1):
+            self.unmake(position)
+
+    def expand_leaf(self, position: Position, leaf: int) -> Optional[float]:
+        """
+        Add the children of a leaf, or mark it as the end of the game.
+
+        :return: The value of the leaf for the side to move if the game is over, or `None` if it needs the network.
+        """
+        if leaf and position.is_draw():
+            self.tree.state[leaf] = TERMINAL
+            return 0.0
+        moves = position.legal_moves()
+        if not moves:
+            self.tree.state[leaf] = TERMINAL
+            return -1.0 if position.is_check() else 0.0
+        self.tree.expand(leaf, moves, move_priors(position, moves))
+        return None
+
+    def play_result(self, board: chess.Board, position: Position) -> PlayResult:
+        """Get the most visited move, with the score and the principal variation of the search in `info`."""
+        tree = self.tree
+        best = tree.most_visited_child(0)
+        nodes = tree.principal_variation() or [best]
+        value = tree.value(best)
+        if tree.state[best] == TERMINAL and value > 0:
+            score = float(MATE_SCORE)
+        else:
+            score = self.value_scale * float(np.arctanh(np.clip(value, -0.999, 0.999)))
+        pv = []
+        for node in nodes:
+            pv.append(position.to_move(int(tree.move[node])))
+            position.make(int(tree.move[node]))
+        for _ in nodes:
+            position.unmake()
+
+        info: chess.engine.InfoDict = {}
+        info["depth"] = len(pv)
+        info["nodes"] = self.playouts
+        info["nps"] = self.playouts_per_second
+        info["score"] = chess.engine.PovScore(pov_score(score), board.turn)
+        info["pv"] = pv
+        self.scores.append(info["score"])
+        return PlayResult(pv[0], pv[1] if len(pv) > 1 else None, info)
+
+    def get_stats(self, for_chat: bool = False) -> list[str]:
+        """Add the size of the tree and the speed of the search to the stats of the engine."""
+        stats = super().get_stats(for_chat)
+        if not for_chat and self.playouts:
+            stats.append(f"Tree: {self.readable_number(self.tree.size)} nodes, {Tree.bytes_per_node} bytes per node "
+                         f"({self.tree.memory() / 2 ** 20:.1f} MB), {self.readable_number(self.playouts_per_second)} "
+                         "playouts/s")
+        return stats
+
+
+def move_priors(position: Position, moves: list[int]) -> list[float]:
+    """Get the prior probability of each move: captures of more valuable pieces and promotions get more."""
+    weights = []
+    for move in moves:
+        captured = position.squares[move >> 6 & 63]
+        promotion = move >> 12 & 7
+        weight = 1.0
+        if captured != EMPTY and move >> 15 != CASTLING:  # In Chess960, the king can castle to its rook's square.
+            weight += piece_values[captured % 6 + 1] / 100
+        if promotion:
+            weight += piece_values[promotion] / 100
+        weights.append(weight)
+    total = sum(weights)
+    return [weight / total for weight in weights]
+
+
+def has_legal_move(position: Position) -> bool:
+    """Check whether the side to move has a legal move, stopping at the first one."""
+    for move in position.generate_moves():
+        if position.make(move):
+            position.unmake()
+            return True
+    return False
+
+
+def pov_score(score: float) -> chess.engine.Score:
+    """Convert a score in centipawns to a `chess.engine.Score`. The search finds mates in one move at most."""
+    if score >= MATE_SCORE:
+        return chess.engine.Mate(1)
+    if score <= -MATE_SCORE:
+        return chess.engine.Mate(-1)
+    return chess.engine.Cp(int(score))
@@ -0,0 +1,147 @@
+"""
+Evaluate the positions of the `NeuralEngine`s of all the games in one process.
+
+Every game is played in its own process, and a `NeuralEngine` evaluates its positions in batches, but one search only
+fills small batches, so with many games at the same time, each process pays the overhead of NumPy for each of its small
+batches. With `InferenceServer` in `homemade_options`, the engines send the output of the first layer of their positions to
+this server instead. The server collects the requests that arrive within `--max-latency` milliseconds of each other, or
+until every connected game is waiting, and runs the other layers on all of them with one forward pass.
+
+Start the server with the address to listen on and the same model as the engines, e.g.
+
+    python3 inference_server.py --listen unix:/tmp/inference.sock --model engines/model.npz
+
+and set `InferenceServer: "unix:/tmp/inference.sock"` in `homemade_options`.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+from typing import Optional
+import numpy as np
+from engine_host import parse_address
+from engines.mlengine import ARRAY_TYPE, INFERENCE_HEADER, WIRE_FLOAT, Network
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServer:
+    """Evaluate the batches sent by the engines of all the games together."""
+
+    def __init__(self, network: Network, max_batch: int, max_latency: float) -> None:
+        """
+        Set up the server without listening yet.
+
+        :param network: The network. The engines only send the output of its first layer.
+        :param max_batch: A forward pass is started when this many positions are waiting.
+        :param max_latency: The most seconds that a request waits for the requests of other games.
+        """
+        self.network = network
+        self.width = network.first_weights.shape[1]
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.connections = 0
+        self.pending: list[tuple[ARRAY_TYPE, asyncio.Future[ARRAY_TYPE]]] = []
+        self.pending_positions = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.positions = 0
+
+    async def serve(self, address: str) -> None:
+        """Accept connections until the server is stopped."""
+        socket_path, host, port = parse_address(address)
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)  # Left by a server that was killed.
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Inference server is listening on {address}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one engine until it closes the connection."""
+        connection = writer.get_extra_info("socket")
+        if connection is not None and connection.family != socket.AF_UNIX:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        try:
+            writer.write(INFERENCE_HEADER.pack(self.width))
+            while True:
+                (count,) = INFERENCE_HEADER.unpack(await reader.readexactly(INFERENCE_HEADER.size))
+                data = await reader.readexactly(count * self.width * WIRE_FLOAT.itemsize)
+                accumulators = np.frombuffer(data, dtype=WIRE_FLOAT).reshape(count, self.width)
+                scores = await self.evaluate(accumulators)
+                writer.write(np.ascontiguousarray(scores, dtype=WIRE_FLOAT).tobytes())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            self.flush_if_all_waiting()
+        logger.info(f"Evaluated {self.positions} positions in {self.batches} batches since the start.")
+
+    def evaluate(self, accumulators: ARRAY_TYPE) -> asyncio.Future[ARRAY_TYPE]:
+        """Queue a request for the next forward pass and get a future for its scores."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[ARRAY_TYPE] = loop.create_future()
+        self.pending.append((accumulators, future))
+        self.pending_positions += len(accumulators)
+        if self.pending_positions >= self.max_batch:
+            self.flush()
+        elif not self.flush_if_all_waiting() and self.timer is None:
+            self.timer = loop.call_later(self.max_latency, self.flush)
+        return future
+
+    def flush_if_all_waiting(self) -> bool:
+        """Start the forward pass early if no other game can send a request, because all of them are waiting."""
+        if self.pending and len(self.pending) >= self.connections:
+            self.flush()
+            return True
+        return False
+
+    def flush(self) -> None:
+        """Evaluate all the waiting requests with one forward pass and send each its scores."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        self.pending_positions = 0
+        if not pending:
+            return
+        scores = self.network.evaluate(np.concatenate([accumulators for accumulators, _ in pending]))
+        self.batches += 1
+        self.positions += len(scores)
+        start = 0
+        for accumulators, future in pending:
+            if not future.done():
+                future.set_result(scores[start:start + len(accumulators)])
+            start += len(accumulators)
+
+
+def main() -> None:
+    """Start the inference server."""
+    parser = argparse.ArgumentParser(description="Evaluate the positions of the NeuralEngines of all the games together.")
+    parser.add_argument("--listen", default="unix:/tmp/lichess-bot-inference.sock",
+                        help="Address to listen on: host:port or unix:/path/to/socket "
+                             "(default: unix:/tmp/lichess-bot-inference.sock).")
+    parser.add_argument("--model", help="The .npz file of the network. It must be the Model of the engines.")
+    parser.add_argument("--max-batch", type=int, default=4096,
+                        help="Start a forward pass when this many positions are waiting (default: 4096).")
+    parser.add_argument("--max-latency", type=float, default=2,
+                        help="The most milliseconds that a request waits for the requests of other games (default: 2).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    server = InferenceServer(Network(args.model), max(1, args.max_batch), max(0, args.max_latency) / 1000)
+    try:
+        asyncio.run(server.serve(args.listen))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
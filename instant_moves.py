@@ -0,0 +1,165 @@
+"""Find moves that can be played without a search, e.g. the only legal move."""
+import logging
+import chess
+import chess.engine
+import model
+from collections.abc import Callable
+from config import Configuration
+from timer import msec
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+piece_values = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 100}
+
+
+class InstantMoves:
+    """
+    Check a few cheap rules before the opening book, the endgame tablebases, the online sources, and the engine are used.
+
+    Each rule is a method that gets the `PositionContext` and returns a move or `None`. The rules are checked in the order of
+    `rules`, and only the rules enabled in the `engine.instant_moves` section of the config are used. Used in the game
+    process. There is one instance for every engine, which remembers the searches of the current game.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the memory of the searches of this game."""
+        self.searched_positions: dict[int, chess.engine.PlayResult] = {}  # Zobrist hash -> engine move
+        self.last_pv: list[chess.Move] = []  # The principal variation of the last search.
+        self.last_pv_ply = -1  # The number of moves played before the last search.
+        self.rules: list[tuple[str, Callable[[model.PositionContext], Optional[chess.engine.PlayResult]]]] = [
+            ("single_legal_move", self.single_legal_move),
+            ("forced_recapture", self.forced_recapture),
+            ("repeated_position", self.repeated_position),
+        ]
+
+    def new_game(self) -> None:
+        """Forget the searches of the previous game."""
+        self.searched_positions = {}
+        self.last_pv = []
+        self.last_pv_ply = -1
+
+    def get_move(self, position: model.PositionContext, instant_moves_cfg: Configuration) -> chess.engine.PlayResult:
+        """
+        Get a move that can be played without searching.
+
+        :param position: The current position.
+        :param instant_moves_cfg: The `engine.instant_moves` section of the config.
+        :return: The move, with the rule that chose it in `info["string"]`. The move is `None` if no rule applies.
+        """
+        no_move = chess.engine.PlayResult(None, None)
+        if not instant_moves_cfg.enabled:
+            return no_move
+
+        low_clock = self.low_clock(position, instant_moves_cfg)
+        rules = self.rules + ([("low_clock", self.predicted_reply)] if low_clock else [])
+        for name, rule in rules:
+            if name != "low_clock" and not instant_moves_cfg.lookup(name):
+                continue
+            result = rule(position)
+            if result is not None and result.move is not None:
+                logger.info(f"Got move {result.move} from the instant move rule {name} for game {position.game.id}")
+                return result
+        return no_move
+
+    def low_clock(self, position: model.PositionContext, instant_moves_cfg: Configuration) -> bool:
+        """Check whether the clock is so low that only the fastest move sources should be used."""
+        low_clock_time = msec(instant_moves_cfg.low_clock_time)
+        return (instant_moves_cfg.enabled and position.game.speed != "correspondence"
+                and len(position.board.move_stack) >= 2 and position.remaining_time < low_clock_time)
+
+    def remember_search(self, position: model.PositionContext, result: chess.engine.PlayResult) -> None:
+        """
+        Remember the move found by a search, for the rules `repeated_position` and `low_clock`.
+
+        :param position: The position that was searched.
+        :param result: The move found by the search.
+        """
+        if result.move is None:
+            return
+        self.searched_positions[position.zobrist_key] = result
+        self.last_pv = result.info.get("pv") or [result.move]
+        self.last_pv_ply = len(position.board.move_stack)
+
+    def single_legal_move(self, position: model.PositionContext) -> Optional[chess.engine.PlayResult]:
+        """Play the move if there is only one legal move."""
+        if len(position.legal_moves) != 1:
+            return None
+        return instant_move(position.legal_moves[0], "single legal move")
+
+    def forced_recapture(self, position: model.PositionContext) -> Optional[chess.engine.PlayResult]:
+        """
+        Recapture if the opponent just captured a piece and the recapture is not ambiguous.
+
+        The rule applies if exactly one legal move recaptures on the square of the capture and the opponent's capturing
+        piece is worth at least as much as the piece it captured. It doesn't apply if the opponent still attacks the square
+        after the recapture and our recapturing piece is worth more than the piece it takes, e.g. a queen that takes a
+        defended bishop, because the opponent could win material by taking again. The engine decides these.
+        """
+        board = position.board
+        if not board.move_stack:
+            return None
+        last_move = board.peek()
+        before = board.copy(stack=1)
+        before.pop()
+        if not before.is_capture(last_move):
+            return None
+
+        captured = before.piece_type_at(last_move.to_square) or chess.PAWN  # No piece on the square means en passant.
+        capturer = before.piece_type_at(last_move.from_square)
+        if capturer is None or piece_values[capturer] < piece_values[captured]:
+            return None
+
+        recaptures = [move for move in position.legal_moves
+                      if move.to_square == last_move.to_square and move.promotion in (None, chess.QUEEN)]
+        if len(recaptures) != 1:
+            return None
+        recapture = recaptures[0]
+        recapturer = recapture.promotion or board.piece_type_at(recapture.from_square) or chess.PAWN
+        after = board.copy(stack=False)
+        after.push(recapture)
+        if piece_values[recapturer] > piece_values[capturer] and after.is_attacked_by(after.turn, recapture.to_square):
+            return None
+        return instant_move(recapture, "forced recapture")
+
+    def repeated_position(self, position: model.PositionContext) -> Optional[chess.engine.PlayResult]:
+        """
+        Play the move found by the engine the last time this position was on the board.
+
+        The move is not repeated if the position after it was already on the board (so the opponent can head for a draw by
+        threefold repetition) while the engine thought it was winning.
+        """
+        result = self.searched_positions.get(position.zobrist_key)
+        if result is None or result.move is None or result.move not in position.legal_moves:
+            return None
+
+        score = result.info.get("score")
+        winning = score is not None and score.relative.score(mate_score=40000) > 0
+        board = position.board.copy()
+        board.push(result.move)
+        allows_draw = board.is_repetition(2)
+        if winning and allows_draw:
+            return None
+        info: chess.engine.InfoDict = {}
+        if score is not None:
+            info["score"] = score
+        if "pv" in result.info:
+            info["pv"] = result.info["pv"]
+        return instant_move(result.move, "repeated position", info)
+
+    def predicted_reply(self, position: model.PositionContext) -> Optional[chess.engine.PlayResult]:
+        """Play the next move of the last principal variation if the opponent played the move the engine expected."""
+        board = position.board
+        if self.last_pv_ply != len(board.move_stack) - 2 or len(self.last_pv) < 3 or board.peek() != self.last_pv[1]:
+            return None
+        move = self.last_pv[2]
+        if move not in position.legal_moves:
+            return None
+        return instant_move(move, "low clock, predicted reply", {"pv": self.last_pv[2:]})
+
+
+def instant_move(move: chess.Move, rule: str, info: Optional[chess.engine.InfoDict] = None) -> chess.engine.PlayResult:
+    """Create the result of an instant move rule, with the rule in the move commentary."""
+    move_info: chess.engine.InfoDict = info.copy() if info else {}
+    move_info["string"] = f"lichess-bot-source:Instant move ({rule})"
+    return chess.engine.PlayResult(move, None, move_info)
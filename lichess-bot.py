@@ -11,7 +11,11 @@ import logging
 import logging.handlers
 import multiprocessing
 import matchmaking
+import cpu_budget
+import correspondence
+import overhead
 import signal
+import threading
 import time
 import datetime
 import backoff
@@ -25,10 +29,12 @@ import traceback
 from config import load_config, Configuration
 from conversation import Conversation, ChatLine
 from timer import Timer, seconds, msec, hours, to_seconds
+from requests.models import Response
 from requests.exceptions import ChunkedEncodingError, ConnectionError, HTTPError, ReadTimeout
 from asyncio.exceptions import TimeoutError as MoveTimeout
 from rich.logging import RichHandler
 from collections import defaultdict
+from contextlib import contextmanager
 from collections.abc import Iterator, MutableSequence
 from http.client import RemoteDisconnected
 from queue import Queue
@@ -39,6 +45,7 @@ EVENT_TYPE = dict[str, Any]
 PLAY_GAME_ARGS_TYPE = dict[str, Any]
 EVENT_GETATTR_GAME_TYPE = dict[str, Any]
 GAME_EVENT_TYPE = dict[str, Any]
+GAME_QUEUE_TYPE = Queue[Union[GAME_EVENT_TYPE, Exception]]
 CONTROL_QUEUE_TYPE = Queue[EVENT_TYPE]
 CORRESPONDENCE_QUEUE_TYPE = Queue[str]
 LOGGING_QUEUE_TYPE = Queue[logging.LogRecord]
@@ -198,6 +205,22 @@ def thread_logging_configurer(queue: Union[CONTROL_QUEUE_TYPE, LOGGING_QUEUE_TYP
     root.setLevel(logging.DEBUG)
 
 
+def game_process_initializer(config: Configuration, logging_queue: LOGGING_QUEUE_TYPE) -> None:
+    """
+    Prepare a new game process before it plays any games.
+
+    If `engine.standby_engine` is enabled, an engine is started and kept waiting for the first game of this process.
+    """
+    thread_logging_configurer(logging_queue)
+    if not config.engine.standby_engine:
+        return
+
+    try:
+        engine_wrapper.start_standby_engine(config)
+    except Exception:
+        logger.exception("Could not start a standby engine. The engine will be started when a game starts.")
+
+
 def game_error_handler(error: BaseException) -> None:
     """Handle game errors."""
     logger.exception("Game ended due to error:", exc_info=error)
@@ -227,6 +250,10 @@ def start(li: lichess.Lichess, user_profile: USER_PROFILE_TYPE, config: Configur
                                                           seconds(config.correspondence.checkin_period)))
     correspondence_pinger.start()
     correspondence_queue: CORRESPONDENCE_QUEUE_TYPE = manager.Queue()
+    engine_allocations: cpu_budget.ENGINE_ALLOCATIONS_TYPE = manager.dict()
+    ponder_arbiter = cpu_budget.PonderArbiter(config.engine.cpu_budget, manager)
+    background_analysis = correspondence.BackgroundAnalysis(config, manager, analyze_correspondence_game)
+    overhead_samples: overhead.OVERHEAD_SAMPLES_TYPE = manager.list()
 
     logging_queue = manager.Queue()
     logging_listener = multiprocessing.Process(target=logging_listener_proc,
@@ -245,6 +272,10 @@ def start(li: lichess.Lichess, user_profile: USER_PROFILE_TYPE, config: Configur
                          control_queue,
                          correspondence_queue,
                          logging_queue,
+                         engine_allocations,
+                         ponder_arbiter,
+                         background_analysis,
+                         overhead_samples,
                          one_game)
     finally:
         control_stream.terminate()
@@ -267,6 +298,13 @@ def log_proc_count(change: str, active_games: set[str]) -> None:
     logger.info(f"{symbol} Process {change}. Count: {len(active_games)}. IDs: {active_games or None}")
 
 
+def log_ponder_stats(ponder_arbiter: cpu_budget.PonderArbiter) -> None:
+    """Log how often the ponder arbiter allowed, denied, and revoked pondering, and the ponder hits and misses."""
+    if ponder_arbiter.enabled:
+        stats = ponder_arbiter.stats()
+        logger.info("Pondering: " + ", ".join(f"{name}: {count}" for name, count in stats.items()))
+
+
 def lichess_bot_main(li: lichess.Lichess,
                      user_profile: USER_PROFILE_TYPE,
                      config: Configuration,
@@ -274,6 +312,10 @@ def lichess_bot_main(li: lichess.Lichess,
                      control_queue: CONTROL_QUEUE_TYPE,
                      correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
                      logging_queue: LOGGING_QUEUE_TYPE,
+                     engine_allocations: cpu_budget.ENGINE_ALLOCATIONS_TYPE,
+                     ponder_arbiter: cpu_budget.PonderArbiter,
+                     background_analysis: correspondence.BackgroundAnalysis,
+                     overhead_samples: overhead.OVERHEAD_SAMPLES_TYPE,
                      one_game: bool) -> None:
     """
     Handle all the games and challenges.
@@ -285,6 +327,10 @@ def lichess_bot_main(li: lichess.Lichess,
     :param control_queue: The queue containing all the events.
     :param correspondence_queue: The queue containing the correspondence games.
     :param logging_queue: The logging queue. Used by `logging_listener_proc`.
+    :param engine_allocations: The threads and hash size each game's engine may use. Filled by `cpu_budget.CpuBudget`.
+    :param ponder_arbiter: Decides which games may ponder.
+    :param background_analysis: Analyses parked correspondence games while game processes are free.
+    :param overhead_samples: The recent move overheads measured in all games.
     :param one_game: Whether the bot should play only one game. Only used in `test_bot/test_bot.py` to test lichess-bot.
     """
     global restart
@@ -305,6 +351,7 @@ def lichess_bot_main(li: lichess.Lichess,
     last_check_online_time = Timer(hours(1))
     matchmaker = matchmaking.Matchmaking(li, config, user_profile)
     matchmaker.show_earliest_challenge_time()
+    engine_budget = cpu_budget.CpuBudget(config.engine.cpu_budget, engine_allocations)
 
     play_game_args = {"li": li,
                       "control_queue": control_queue,
@@ -312,11 +359,23 @@ def lichess_bot_main(li: lichess.Lichess,
                       "config": config,
                       "challenge_queue": challenge_queue,
                       "correspondence_queue": correspondence_queue,
-                      "logging_queue": logging_queue}
+                      "logging_queue": logging_queue,
+                      "engine_allocations": engine_allocations,
+                      "ponder_arbiter": ponder_arbiter,
+                      "analysis_results": background_analysis.results,
+                      "overhead_samples": overhead_samples}
+    analysis_args = {"li": li,
+                     "user_profile": user_profile,
+                     "config": config,
+                     "logging_queue": logging_queue,
+                     "analysis_results": background_analysis.results,
+                     "stop_flags": background_analysis.stop_flags}
 
     recent_bot_challenges: defaultdict[str, list[Timer]] = defaultdict(list)
 
-    with multiprocessing.pool.Pool(max_games + 1) as pool:
+    with multiprocessing.pool.Pool(max_games + 1,
+                                   initializer=game_process_initializer,
+                                   initargs=(config, logging_queue)) as pool:
         while not (terminated or (one_game and one_game_completed) or restart):
             event = next_event(control_queue)
             if not event:
@@ -333,6 +392,7 @@ def lichess_bot_main(li: lichess.Lichess,
                     active_games.discard(game_id)
                     matchmaker.game_done()
                     log_proc_count("Freed", active_games)
+                    log_ponder_stats(ponder_arbiter)
                 save_pgn_record(event, config)
                 one_game_completed = True
             elif event["type"] == "challenge":
@@ -341,6 +401,7 @@ def lichess_bot_main(li: lichess.Lichess,
                 matchmaker.declined_challenge(event)
             elif event["type"] == "gameStart":
                 matchmaker.accepted_challenge(event)
+                engine_budget.set_speed(event["game"]["id"], event["game"].get("speed", ""))
                 start_game(event,
                            pool,
                            play_game_args,
@@ -361,6 +422,8 @@ def lichess_bot_main(li: lichess.Lichess,
                                              max_games)
             accept_challenges(li, challenge_queue, active_games, max_games)
             matchmaker.challenge(active_games, challenge_queue)
+            engine_budget.update(active_games)
+            background_analysis.update(li, pool, active_games, max_games, analysis_args)
             check_online_status(li, user_profile, last_check_online_time)
 
             control_queue.task_done()
@@ -549,7 +612,11 @@ def play_game(li: lichess.Lichess,
               config: Configuration,
               challenge_queue: MULTIPROCESSING_LIST_TYPE,
               correspondence_queue: CORRESPONDENCE_QUEUE_TYPE,
-              logging_queue: LOGGING_QUEUE_TYPE) -> None:
+              logging_queue: LOGGING_QUEUE_TYPE,
+              engine_allocations: cpu_budget.ENGINE_ALLOCATIONS_TYPE,
+              ponder_arbiter: cpu_budget.PonderArbiter,
+              analysis_results: correspondence.ANALYSIS_RESULTS_TYPE,
+              overhead_samples: overhead.OVERHEAD_SAMPLES_TYPE) -> None:
     """
     Play a game.
 
@@ -561,6 +628,10 @@ def play_game(li: lichess.Lichess,
     :param challenge_queue: The queue containing the challenges.
     :param correspondence_queue: The queue containing the correspondence games.
     :param logging_queue: The logging queue. Used by `logging_listener_proc`.
+    :param engine_allocations: The threads and hash size each game's engine may use.
+    :param ponder_arbiter: Decides which games may ponder.
+    :param analysis_results: The background analysis of correspondence games.
+    :param overhead_samples: The recent move overheads measured in all games.
     """
     thread_logging_configurer(logging_queue)
     logger = logging.getLogger(__name__)
@@ -574,10 +645,12 @@ def play_game(li: lichess.Lichess,
     abort_time = seconds(config.abort_time)
     game = model.Game(initial_state, user_profile["username"], li.baseUrl, abort_time)
 
-    with engine_wrapper.create_engine(config) as engine:
+    reuse_engine = config.engine.reuse_engine or config.engine.standby_engine
+    with engine_wrapper.create_engine(config, reuse=reuse_engine) as engine:
         engine.get_opponent_info(game)
         logger.debug(f"The engine for game {game_id} has pid={engine.get_pid()}")
         conversation = Conversation(game, engine, li, __version__, challenge_queue)
+        ponder_control = cpu_budget.PonderControl(ponder_arbiter, game.id, engine)
 
         logger.info(f"+++ {game}")
 
@@ -589,7 +662,7 @@ def play_game(li: lichess.Lichess,
         engine_cfg = config.engine
         ponder_cfg = correspondence_cfg if is_correspondence else engine_cfg
         can_ponder = ponder_cfg.uci_ponder or ponder_cfg.ponder
-        move_overhead = msec(config.move_overhead)
+        move_overhead_estimate = overhead.MoveOverhead(config, overhead_samples)
         delay = msec(config.rate_limiting_delay)
 
         keyword_map: defaultdict[str, str] = defaultdict(str, me=game.me.name, opponent=game.opponent.name)
@@ -598,67 +671,109 @@ def play_game(li: lichess.Lichess,
         hello_spectators = get_greeting("hello_spectators", config.greeting, keyword_map)
         goodbye_spectators = get_greeting("goodbye_spectators", config.greeting, keyword_map)
 
+        game_queue: GAME_QUEUE_TYPE = Queue()
+
         disconnect_time = correspondence_disconnect_time if not game.state.get("moves") else seconds(0)
         prior_game = None
         board = chess.Board()
         upd: dict[str, Any] = game.state
-        while not terminated:
-            move_attempted = False
-            try:
-                upd = upd or next_update(lines)
-                u_type = upd["type"] if upd else "ping"
-                if u_type == "chatLine":
-                    conversation.react(ChatLine(upd))
-                elif u_type == "gameState":
-                    game.state = upd
-                    board = setup_board(game)
-                    if not is_game_over(game) and is_engine_move(game, prior_game, board):
-                        disconnect_time = correspondence_disconnect_time
-                        say_hello(conversation, hello, hello_spectators, board)
-                        setup_timer = Timer()
-                        print_move_number(board)
-                        move_attempted = True
-                        engine.play_move(board,
-                                         game,
-                                         li,
-                                         setup_timer,
-                                         move_overhead,
-                                         can_ponder,
-                                         is_correspondence,
-                                         correspondence_move_time,
-                                         engine_cfg,
-                                         fake_think_time(config, board, game))
-                        time.sleep(to_seconds(delay))
-                    elif is_game_over(game):
-                        tell_user_game_result(game, board)
-                        engine.send_game_result(game, board)
-                        conversation.send_message("player", goodbye)
-                        conversation.send_message("spectator", goodbye_spectators)
-
-                    wb = "w" if board.turn == chess.WHITE else "b"
-                    terminate_time = msec(upd[f"{wb}time"]) + msec(upd[f"{wb}inc"]) + seconds(60)
-                    game.ping(abort_time, terminate_time, disconnect_time)
-                    prior_game = copy.deepcopy(game)
-                elif u_type == "ping" and should_exit_game(board, game, prior_game, li, is_correspondence):
-                    break
-            except (HTTPError,
-                    ReadTimeout,
-                    RemoteDisconnected,
-                    ChunkedEncodingError,
-                    ConnectionError,
-                    StopIteration,
-                    MoveTimeout) as e:
-                stopped = isinstance(e, StopIteration)
-                is_ongoing = game.id in (ongoing_game["gameId"] for ongoing_game in li.get_ongoing_games())
-                if stopped or (not move_attempted and not is_ongoing):
-                    break
-            finally:
-                upd = {}
-
+        with watched_game_stream(response, lines, game_queue, engine, ponder_control):
+            while not terminated:
+                move_attempted = False
+                try:
+                    upd = upd or next_update(game_queue)
+                    u_type = upd["type"] if upd else "ping"
+                    if u_type == "chatLine":
+                        conversation.react(ChatLine(upd))
+                    elif u_type == "gameState":
+                        game.state = upd
+                        board = setup_board(game)
+                        move_overhead_estimate.game_state_received(game, board)
+                        if not is_game_over(game) and is_engine_move(game, prior_game, board):
+                            disconnect_time = correspondence_disconnect_time
+                            say_hello(conversation, hello, hello_spectators, board)
+                            setup_timer = Timer()
+                            print_move_number(board)
+                            move_attempted = True
+                            ponder_control.before_move(board)
+                            engine.set_resources(engine_allocations.get(game.id, {}))
+                            move_overhead = move_overhead_estimate.current()
+                            engine.play_move(board,
+                                             game,
+                                             li,
+                                             setup_timer,
+                                             move_overhead,
+                                             can_ponder,
+                                             is_correspondence,
+                                             correspondence_move_time,
+                                             engine_cfg,
+                                             fake_think_time(config, board, game, move_overhead),
+                                             correspondence.stored_analysis(analysis_results, game.id, board))
+                            move_overhead_estimate.move_sent(game, board, setup_timer, engine.move_sent_timer)
+                            ponder_control.after_move()
+                            time.sleep(to_seconds(delay))
+                        elif is_game_over(game):
+                            tell_user_game_result(game, board)
+                            engine.send_game_result(game, board)
+                            conversation.send_message("player", goodbye)
+                            conversation.send_message("spectator", goodbye_spectators)
+
+                        wb = "w" if board.turn == chess.WHITE else "b"
+                        terminate_time = msec(upd[f"{wb}time"]) + msec(upd[f"{wb}inc"]) + seconds(60)
+                        game.ping(abort_time, terminate_time, disconnect_time)
+                        prior_game = copy.deepcopy(game)
+                    elif u_type == "ping" and should_exit_game(board, game, prior_game, li, is_correspondence):
+                        break
+                except (HTTPError,
+                        ReadTimeout,
+                        RemoteDisconnected,
+                        ChunkedEncodingError,
+                        ConnectionError,
+                        StopIteration,
+                        MoveTimeout) as e:
+                    stopped = isinstance(e, StopIteration)
+                    is_ongoing = game.id in (ongoing_game["gameId"] for ongoing_game in li.get_ongoing_games())
+                    if stopped or (not move_attempted and not is_ongoing):
+                        break
+                finally:
+                    upd = {}
         pgn_record = try_get_pgn_game_record(li, config, game, board, engine)
     final_queue_entries(control_queue, correspondence_queue, game, is_correspondence, pgn_record)
 
 
+def analyze_correspondence_game(li: lichess.Lichess,
+                                game_id: str,
+                                user_profile: USER_PROFILE_TYPE,
+                                config: Configuration,
+                                logging_queue: LOGGING_QUEUE_TYPE,
+                                analysis_results: correspondence.ANALYSIS_RESULTS_TYPE,
+                                stop_flags: correspondence.STOP_FLAGS_TYPE) -> None:
+    """
+    Analyse the current position of a parked correspondence game until the main process stops the analysis.
+
+    :param li: Provides communication with lichess.org.
+    :param game_id: The id of the game.
+    :param user_profile: Information on our bot.
+    :param config: The config that the bot will use.
+    :param logging_queue: The logging queue. Used by `logging_listener_proc`.
+    :param analysis_results: Where the analysis is stored for `play_game`.
+    :param stop_flags: The flags used by the main process to stop the analysis.
+    """
+    thread_logging_configurer(logging_queue)
+    response = li.get_game_stream(game_id)
+    initial_state = json.loads(next(response.iter_lines()).decode("utf-8"))
+    response.close()
+    game = model.Game(initial_state, user_profile["username"], li.baseUrl, seconds(config.abort_time))
+    board = setup_board(game)
+    if is_game_over(game) or not is_engine_move(game, None, board):
+        return
+
+    reuse_engine = config.engine.reuse_engine or config.engine.standby_engine
+    with engine_wrapper.create_engine(config, reuse=reuse_engine) as engine:
+        correspondence.analyze_position(engine, board, game_id, analysis_results, stop_flags,
+                                        config.correspondence.background_analysis_time)
+
+
 def get_greeting(greeting: str, greeting_cfg: Configuration, keyword_map: defaultdict[str, str]) -> str:
     """Get the greeting to send to the chat."""
     greeting_text: str = greeting_cfg.lookup(greeting)
@@ -672,12 +787,13 @@ def say_hello(conversation: Conversation, hello: str, hello_spectators: str, boa
         conversation.send_message("spectator", hello_spectators)
 
 
-def fake_think_time(config: Configuration, board: chess.Board, game: model.Game) -> datetime.timedelta:
+def fake_think_time(config: Configuration, board: chess.Board, game: model.Game,
+                    move_overhead: datetime.timedelta) -> datetime.timedelta:
     """Calculate how much time we should wait for fake_think_time."""
     sleep = seconds(0.0)
 
     if config.fake_think_time and len(board.move_stack) > 9:
-        remaining = max(seconds(0), game.my_remaining_time() - msec(config.move_overhead))
+        remaining = max(seconds(0), game.my_remaining_time() - move_overhead)
         delay = remaining * 0.025
         accel = 0.99 ** (len(board.move_stack) - 10)
         sleep = delay * accel
@@ -691,10 +807,61 @@ def print_move_number(board: chess.Board) -> None:
     logger.info(f"move: {len(board.move_stack) // 2 + 1}")
 
 
-def next_update(lines: Iterator[bytes]) -> GAME_EVENT_TYPE:
+@contextmanager
+def watched_game_stream(response: Response, lines: Iterator[bytes], game_queue: GAME_QUEUE_TYPE,
+                        engine: engine_wrapper.EngineWrapper, ponder_control: cpu_budget.PonderControl) -> Iterator[None]:
+    """
+    Read the game stream in a thread while the game is played.
+
+    When the game ends, even because of an error, the thread is stopped, so it can't stop the search of the engine after
+    the engine is given to the next game, and the ponder arbiter stops counting this game as thinking or pondering.
+
+    :param response: The response of the game stream.
+    :param lines: The lines of the response.
+    :param game_queue: Where the thread puts the updates of the game.
+    :param engine: The engine playing the game.
+    :param ponder_control: The control of the pondering of the game.
+    """
+    game_done = threading.Event()
+    game_stream = threading.Thread(target=watch_game_stream, args=(lines, game_queue, engine, game_done), daemon=True)
+    game_stream.start()
+    try:
+        yield
+    finally:
+        game_done.set()
+        response.close()
+        ponder_control.game_over()
+
+
+def watch_game_stream(lines: Iterator[bytes], game_queue: GAME_QUEUE_TYPE, engine: engine_wrapper.EngineWrapper,
+                      game_done: threading.Event) -> None:
+    """
+    Put the game events in a queue while the game process plays.
+
+    The events are read while the engine searches, so the search can be stopped as soon as the game ends.
+    An error while reading the stream is put in the queue, followed by `StopIteration` when the stream ends.
+
+    :param lines: The game stream.
+    :param game_queue: The queue read by `next_update`.
+    :param engine: The engine of the game.
+    :param game_done: Set when `play_game` stops playing. The engine may be used by the next game after that.
+    """
+    try:
+        for line in lines:
+            upd: GAME_EVENT_TYPE = json.loads(line.decode("utf-8")) if line else {}
+            if upd.get("type") == "gameState" and upd.get("status", "started") != "started" and not game_done.is_set():
+                engine.stop_search()
+            game_queue.put(upd)
+    except Exception as error:
+        game_queue.put(error)
+    game_queue.put(StopIteration())
+
+
+def next_update(game_queue: GAME_QUEUE_TYPE) -> GAME_EVENT_TYPE:
     """Get the next game state."""
-    binary_chunk = next(lines)
-    upd: GAME_EVENT_TYPE = json.loads(binary_chunk.decode("utf-8")) if binary_chunk else {}
+    upd = game_queue.get()
+    if isinstance(upd, Exception):
+        raise upd
     if upd:
         logger.debug(f"Game state: {upd}")
     return upd
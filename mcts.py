@@ -0,0 +1,170 @@
+"""
+The tree of a Monte Carlo tree search for homemade engines.
+
+A tree of Python objects costs a few hundred bytes per node and is slow to walk, so the nodes are rows of NumPy arrays
+instead: the move that leads to a node, its parent, its children, its visits, the sum of its values and its prior. The
+children of a node are next to each other, so choosing a child is a few operations on slices of the arrays. It needs NumPy
+(`pip install numpy`). `MonteCarloEngine` in `engines/mlengine.py` searches with it.
+"""
+from __future__ import annotations
+import math
+import numpy as np
+import numpy.typing as npt
+from typing import Any
+
+NEW, EXPANDED, TERMINAL = 0, 1, 2  # The states of a node: not expanded yet, with children, and the end of the game.
+
+
+class Tree:
+    """
+    The nodes of a search tree in arrays. The root is node 0.
+
+    The value of a node is from the point of view of the side that made the move leading to it, between -1 (lost) and 1
+    (won), so a parent chooses the child with the highest value. The virtual losses of a node count the searches that
+    are going through it and whose leaves are waiting for the network. Each is counted as a visit that lost, so the next
+    searches of the same batch try other moves.
+    """
+
+    fields = (("move", np.int32), ("parent", np.int32), ("first_child", np.int32), ("child_count", np.uint8),
+              ("state", np.int8), ("visits", np.int32), ("virtual_losses", np.int32), ("value_sum", np.float32),
+              ("prior", np.float32))
+    bytes_per_node = sum(np.dtype(dtype).itemsize for _, dtype in fields)
+
+    def __init__(self, capacity: int = 1024) -> None:
+        """Create a tree with only the root."""
+        self.move: npt.NDArray[Any]
+        self.parent: npt.NDArray[Any]
+        self.first_child: npt.NDArray[Any]
+        self.child_count: npt.NDArray[Any]
+        self.state: npt.NDArray[Any]
+        self.visits: npt.NDArray[Any]
+        self.virtual_losses: npt.NDArray[Any]
+        self.value_sum: npt.NDArray[Any]
+        self.prior: npt.NDArray[Any]
+        for name, dtype in self.fields:
+            setattr(self, name, np.zeros(max(1, capacity), dtype=dtype))
+        self.parent[0] = -1
+        self.prior[0] = 1
+        self.size = 1
+
+    def grow(self, capacity: int) -> None:
+        """Make room for at least `capacity` nodes. The arrays at least double, so adding nodes takes constant time."""
+        current = len(self.move)
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, 2 * current)
+        for name, dtype in self.fields:
+            array = np.zeros(new_capacity, dtype=dtype)
+            array[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, array)
+
+    def expand(self, node: int, moves: list[int], priors: list[float]) -> None:
+        """Add the children of a node, one for each legal move, with the prior probability of each move."""
+        first = self.size
+        self.grow(first + len(moves))
+        end = first + len(moves)
+        self.move[first:end] = moves
+        self.parent[first:end] = node
+        self.prior[first:end] = priors
+        self.first_child[node] = first
+        self.child_count[node] = len(moves)
+        self.state[node] = EXPANDED
+        self.size = end
+
+    def select_child(self, node: int, exploration: float, first_play_urgency: float) -> int:
+        """
+        Choose the child to search with PUCT: the value of the child plus its prior times a bonus that shrinks with its visits.
+
+        :param node: An expanded node.
+        :param exploration: The weight of the prior and the visits, against the value.
+        :param first_play_urgency: How much worse than the parent an unvisited child is assumed to be.
+        :return: The child.
+        """
+        first = int(self.first_child[node])
+        end = first + int(self.child_count[node])
+        virtual_losses = self.virtual_losses[first:end]
+        visits = self.visits[first:end] + virtual_losses
+        parent_visits = int(self.visits[node]) + int(self.virtual_losses[node])
+        parent_value = -float(self.value_sum[node]) / max(1, int(self.visits[node]))
+        values = np.where(visits > 0, (self.value_sum[first:end] - virtual_losses) / np.maximum(visits, 1),
+                          parent_value - first_play_urgency)
+        bonus = exploration * math.sqrt(parent_visits) * self.prior[first:end] / (1 + visits)
+        return first + int(np.argmax(values + bonus))
+
+    def find_child(self, node: int, move: int) -> int:
+        """Get the child of a node for a move, or -1 if the node wasn't expanded."""
+        if self.state[node] != EXPANDED:
+            return -1
+        first = int(self.first_child[node])
+        matches = np.flatnonzero(self.move[first:first + int(self.child_count[node])] == move)
+        return first + int(matches[0]) if len(matches) else -1
+
+    def add_virtual_loss(self, path: list[int]) -> None:
+        """Count a search through the nodes of a path whose leaf waits for its value."""
+        self.virtual_losses[path] += 1
+
+    def backup(self, path: list[int], value: float, virtual_loss: bool) -> None:
+        """
+        Add the value of a leaf to the nodes on its path.
+
+        :param path: The nodes from the root to the leaf.
+        :param value: The value of the leaf from the point of view of the side to move at the leaf.
+        :param virtual_loss: Whether `add_virtual_loss` was called for the path, so the virtual losses are removed.
+        """
+        signs = np.where(np.arange(len(path)) % 2 == len(path) % 2, value, -value)  # -value at the leaf.
+        self.visits[path] += 1
+        self.value_sum[path] += signs.astype(np.float32)
+        if virtual_loss:
+            self.virtual_losses[path] -= 1
+
+    def value(self, node: int) -> float:
+        """Get the mean value of a node, from the point of view of the side that moved to it."""
+        return float(self.value_sum[node]) / max(1, int(self.visits[node]))
+
+    def most_visited_child(self, node: int) -> int:
+        """Get the child that was searched most, which is the move to play."""
+        first = int(self.first_child[node])
+        return first + int(np.argmax(self.visits[first:first + int(self.child_count[node])]))
+
+    def principal_variation(self) -> list[int]:
+        """Follow the most visited children from the root."""
+        nodes = []
+        node = 0
+        while self.state[node] == EXPANDED and self.visits[node] > 1:
+            node = self.most_visited_child(node)
+            if not self.visits[node]:
+                break
+            nodes.append(node)
+        return nodes
+
+    def subtree(self, node: int) -> Tree:
+        """
+        Copy a node and the nodes below it to a new tree, where the node is the root.
+
+        This keeps the search of the position after the moves that were played since the last search.
+        """
+        old_nodes = [node]
+        index = 0
+        while index < len(old_nodes):  # The children of each node stay next to each other.
+            old = old_nodes[index]
+            if self.state[old] == EXPANDED:
+                first = int(self.first_child[old])
+                old_nodes.extend(range(first, first + int(self.child_count[old])))
+            index += 1
+        tree = Tree(len(old_nodes))
+        selected = np.array(old_nodes, dtype=np.int64)
+        for name, _ in self.fields:
+            getattr(tree, name)[:len(old_nodes)] = getattr(self, name)[selected]
+        new_index = np.full(self.size, -1, dtype=np.int32)
+        new_index[selected] = np.arange(len(old_nodes), dtype=np.int32)
+        tree.parent[1:len(old_nodes)] = new_index[tree.parent[1:len(old_nodes)]]
+        tree.parent[0] = -1
+        expanded = tree.state[:len(old_nodes)] == EXPANDED
+        tree.first_child[:len(old_nodes)][expanded] = new_index[tree.first_child[:len(old_nodes)][expanded]]
+        tree.virtual_losses[:len(old_nodes)] = 0
+        tree.size = len(old_nodes)
+        return tree
+
+    def memory(self) -> int:
+        """Get the bytes used by the arrays."""
+        return len(self.move) * self.bytes_per_node
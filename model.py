@@ -1,5 +1,7 @@
-"""Store information about a challenge, game or player in a class."""
+"""Store information about a challenge, game, player or position in a class."""
 import math
+import chess
+import chess.polyglot
 from urllib.parse import urljoin
 import logging
 import datetime
@@ -8,6 +10,7 @@ from timer import Timer, msec, seconds, sec_str, to_msec, to_seconds, years
 from config import Configuration
 from typing import Any
 from collections import defaultdict
+from functools import cached_property
 
 logger = logging.getLogger(__name__)
 
@@ -282,3 +285,56 @@ class Player:
     def __repr__(self) -> str:
         """Get a string representation of `Player`."""
         return self.__str__()
+
+
+class PositionContext:
+    """
+    Store information about the position in which the bot has to move.
+
+    It is created once per move and passed to every move source (instant moves, opening books, endgame tablebases, and
+    online sources), so that each value is computed at most once. The values that are not always needed are computed
+    the first time they are used.
+    """
+
+    def __init__(self, board: chess.Board, game: Game) -> None:
+        """
+        Store the values that every move source uses.
+
+        :param board: The current position. It must not change while the context is used.
+        :param game: The game that the bot is playing.
+        """
+        self.board = board
+        self.game = game
+        self.turn = board.turn
+        self.wb = "w" if board.turn == chess.WHITE else "b"
+        self.uci_variant = str(board.uci_variant)
+        self.variant = "standard" if self.uci_variant == "chess" else self.uci_variant  # The name used by lichess.org.
+        self.remaining_time = msec(game.state[f"{self.wb}time"])
+
+    @cached_property
+    def fen(self) -> str:
+        """The FEN of the position."""
+        return self.board.fen()
+
+    @cached_property
+    def zobrist_key(self) -> int:
+        """The Zobrist hash of the position."""
+        return chess.polyglot.zobrist_hash(self.board)
+
+    @cached_property
+    def legal_moves(self) -> list[chess.Move]:
+        """The legal moves in the position."""
+        return list(self.board.legal_moves)
+
+    @cached_property
+    def piece_count(self) -> int:
+        """The number of pieces on the board, including kings and pawns."""
+        return chess.popcount(self.board.occupied)
+
+    def __str__(self) -> str:
+        """Get a string representation of `PositionContext`."""
+        return f"{self.game.id}: {self.fen}"
+
+    def __repr__(self) -> str:
+        """Get a string representation of `PositionContext`."""
+        return self.__str__()
@@ -0,0 +1,82 @@
+"""
+Load the weights of the networks of homemade engines once for all the games.
+
+Every game is played in its own process, so weights that are read into memory by the constructor of an engine are read
+again for every game and kept once per process. `load` unpacks a `.npz` file once into a directory of `.npy` files next to
+it, and then maps these files into memory read-only. The pages of a mapped file are shared by all the processes that map
+it, so the memory used by each game doesn't grow with the size of the network, and loading only maps the files.
+"""
+from __future__ import annotations
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import numpy.typing as npt
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+ARRAYS_TYPE = dict[str, npt.NDArray[Any]]
+
+loaded_models: dict[str, tuple[str, ARRAYS_TYPE]] = {}  # The path of a model -> its cache directory and its arrays.
+
+
+def load(path: str) -> ARRAYS_TYPE:
+    """
+    Get the arrays of a `.npz` file as read-only arrays mapped from files.
+
+    :param path: The `.npz` file.
+    :return: The arrays, by name. Writing to them raises an error. `int8` arrays (e.g. quantized weights) are kept as they
+        are, and all the others are converted to `float32`.
+    """
+    path = os.path.abspath(path)
+    cache_directory = get_cache_directory(path)
+    if path in loaded_models and loaded_models[path][0] == cache_directory:
+        return loaded_models[path][1]
+
+    if not os.path.isdir(cache_directory):
+        unpack(path, cache_directory)
+    arrays: ARRAYS_TYPE = {}
+    for file_name in os.listdir(cache_directory):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".npy":
+            # A plain view of the mapped file, because indexing a `np.memmap` is slower.
+            arrays[name] = np.load(os.path.join(cache_directory, file_name), mmap_mode="r").view(np.ndarray)
+    loaded_models[path] = (cache_directory, arrays)
+    return arrays
+
+
+def get_cache_directory(path: str) -> str:
+    """Get the directory of the `.npy` files of a model. It changes when the model file changes."""
+    status = os.stat(path)
+    return os.path.join(f"{path}.mmap", f"{status.st_size}-{status.st_mtime_ns}")
+
+
+def unpack(path: str, cache_directory: str) -> None:
+    """
+    Write the arrays of a `.npz` file to `.npy` files in a new directory, and delete the files of older versions.
+
+    The files are written to a temporary directory that is renamed at the end, so a game that starts at the same time
+    never sees half of the files. If another game renamed its directory first, its files are used.
+    """
+    logger.info(f"Unpacking the model {path} to {cache_directory}")
+    parent = os.path.dirname(cache_directory)
+    os.makedirs(parent, exist_ok=True)
+    temporary_directory = tempfile.mkdtemp(dir=parent)
+    with np.load(path) as arrays:
+        for name in arrays.files:
+            array = arrays[name]
+            dtype = np.int8 if array.dtype == np.int8 else np.float32
+            np.save(os.path.join(temporary_directory, f"{name}.npy"), np.ascontiguousarray(array, dtype=dtype))
+    try:
+        os.rename(temporary_directory, cache_directory)
+    except OSError:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        if not os.path.isdir(cache_directory):
+            raise
+
+    for old_version in os.listdir(parent):
+        old_directory = os.path.join(parent, old_version)
+        if old_directory != cache_directory and not old_version.startswith("tmp"):
+            shutil.rmtree(old_directory, ignore_errors=True)  # Processes that mapped the old files can still read them.
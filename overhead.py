@@ -0,0 +1,113 @@
+"""Measure the move overhead (the time lichess.org charges on top of the time spent thinking) and estimate it."""
+import datetime
+import logging
+import math
+import chess
+import model
+from collections.abc import MutableSequence
+from config import Configuration
+from timer import Timer, msec, msec_str, to_msec
+from typing import Optional
+OVERHEAD_SAMPLES_TYPE = MutableSequence[float]
+
+logger = logging.getLogger(__name__)
+
+
+class MoveOverhead:
+    """
+    Estimate the move overhead of a game from the clock times sent by lichess.org.
+
+    After each of our moves, the time lichess.org took from our clock (minus the increment) is compared with the time
+    between receiving the position and sending the move. The difference is the overhead of that move. The estimate is a
+    percentile of the recent overheads of this game or, early in the game, of the recent overheads of all games.
+    Used in the game process.
+    """
+
+    min_samples = 5  # How many overheads must be measured before they are used.
+
+    def __init__(self, config: Configuration, global_samples: OVERHEAD_SAMPLES_TYPE) -> None:
+        """
+        Initialize the estimate.
+
+        :param config: The config that the bot will use.
+        :param global_samples: The recent overheads (in milliseconds) of all games. Shared by all game processes.
+        """
+        calibration_cfg = config.move_overhead_calibration
+        self.enabled: bool = calibration_cfg.enabled
+        self.configured = msec(config.move_overhead)
+        self.percentile: float = calibration_cfg.percentile
+        self.window: int = calibration_cfg.window
+        self.minimum = msec(calibration_cfg.min)
+        self.maximum = msec(calibration_cfg.max)
+        self.global_samples = global_samples
+        self.samples: list[float] = []
+        self.pending: Optional[tuple[int, float, float, datetime.timedelta, Timer]] = None
+
+    def current(self) -> datetime.timedelta:
+        """Get the move overhead to use for the next move."""
+        if not self.enabled:
+            return self.configured
+
+        samples = self.samples if len(self.samples) >= self.min_samples else list(self.global_samples)
+        if len(samples) < self.min_samples:
+            return self.configured
+        estimate = msec(percentile(samples, self.percentile))
+        return min(self.maximum, max(self.minimum, estimate))
+
+    def move_sent(self, game: model.Game, board: chess.Board, setup_timer: Timer, sent_timer: Timer) -> None:
+        """
+        Remember the clock before our move and when the move was sent.
+
+        :param game: The game, with the state in which we had to move.
+        :param board: The position before our move.
+        :param setup_timer: Started when the position was received.
+        :param sent_timer: Started when the move was sent.
+        """
+        if not self.enabled or len(board.move_stack) < 2 or game.speed == "correspondence":
+            return  # The clock does not run for the first move of each side, and correspondence clocks are too coarse.
+
+        wb = "w" if game.is_white else "b"
+        time_to_move = setup_timer.time_since_reset() - sent_timer.time_since_reset()
+        self.pending = (len(board.move_stack), game.state[f"{wb}time"], game.state[f"{wb}inc"], time_to_move, sent_timer)
+
+    def game_state_received(self, game: model.Game, board: chess.Board) -> None:
+        """
+        Measure the overhead of our last move once the game state includes it.
+
+        :param game: The game with the new state.
+        :param board: The position of the new state.
+        """
+        if self.pending is None or len(board.move_stack) <= self.pending[0]:
+            return
+
+        ply, clock_before, increment, time_to_move, sent_timer = self.pending
+        self.pending = None
+        wb = "w" if game.is_white else "b"
+        charged = msec(clock_before + increment - game.state[f"{wb}time"])
+        overhead = max(0.0, to_msec(charged - time_to_move))
+        if len(board.move_stack) == ply + 1:
+            logger.debug(f"Move round trip: {msec_str(sent_timer.time_since_reset())}. Time to move: "
+                         f"{msec_str(time_to_move)}. Charged by lichess: {msec_str(charged)}. Overhead: {overhead:.0f} ms")
+        self.add_sample(overhead)
+
+    def add_sample(self, overhead: float) -> None:
+        """Add a measured overhead (in milliseconds) to the samples of this game and of all games."""
+        self.samples = (self.samples + [overhead])[-self.window:]
+        self.global_samples.append(overhead)
+        if len(self.global_samples) > self.window:
+            del self.global_samples[:-self.window]
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    """
+    Get a percentile of the samples, interpolating between the two nearest samples.
+
+    :param samples: The samples. There must be at least one.
+    :param percent: The percentile (0 to 100).
+    :return: The value below which `percent` percent of the samples fall.
+    """
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * min(100.0, max(0.0, percent)) / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
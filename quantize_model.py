@@ -0,0 +1,133 @@
+"""
+Shrink the network of `NeuralEngine` by storing its weights as `int8`, and check how much its scores change.
+
+The weights of each layer are divided by a scale, so that the largest weight becomes 127, and rounded to `int8`. The biases
+stay `float32`. The first layer has most of the weights of the network, so the smaller model maps about a quarter of the
+memory into every game. This saves memory, not time: the network still computes in `float32`, and adding `int8` rows to
+the accumulator is a little slower than adding `float32` rows. The scores of the smaller network are compared with the
+scores of the original network on positions from random games, along with the time spent in each part of the network, e.g.
+
+    python3 quantize_model.py engines/model.npz engines/model-int8.npz
+
+Use the new file as `Model` in `homemade_options`. To compare two models that already exist, add `--compare-only`.
+"""
+import argparse
+import logging
+import random
+import time
+import chess
+import numpy as np
+import numpy.typing as npt
+from typing import Any
+from bitboard import Position
+from engines.mlengine import Accumulator, Network
+
+logger = logging.getLogger(__name__)
+
+
+def quantize(path: str, output: str) -> None:
+    """
+    Write a copy of a model with `int8` weights and a `scale_{index}` for each layer.
+
+    :param path: The `.npz` file with `float32` weights.
+    :param output: The new `.npz` file.
+    """
+    arrays: dict[str, npt.NDArray[Any]] = {}
+    with np.load(path) as model:
+        for name in model.files:
+            array = model[name]
+            if name.startswith("weights_") and array.dtype != np.int8:
+                largest = float(np.abs(array).max())
+                scale = largest / 127 if largest > 0 else 1.0
+                arrays[name] = np.clip(np.round(array / scale), -127, 127).astype(np.int8)
+                arrays[name.replace("weights_", "scale_")] = np.array([scale], dtype=np.float32)
+            else:
+                arrays[name] = array
+    np.savez(output, **arrays)  # type: ignore[arg-type]
+
+
+def random_positions(count: int, seed: int) -> list[chess.Board]:
+    """Get positions from games of random moves, from the opening to the endgame."""
+    rng = random.Random(seed)
+    positions: list[chess.Board] = []
+    while len(positions) < count:
+        board = chess.Board()
+        while not board.is_game_over() and len(positions) < count and board.ply() < 200:
+            board.push(rng.choice(list(board.legal_moves)))
+            positions.append(board.copy(stack=False))
+    return positions
+
+
+def scores(network: Network, positions: list[chess.Board]) -> tuple[npt.NDArray[np.float32], float]:
+    """Get the score of each position, and the seconds per position spent in the layers after the first."""
+    accumulator = Accumulator(network)
+    batch = np.zeros((len(positions), network.first_weights.shape[1]), dtype=np.float32)
+    for index, board in enumerate(positions):
+        position = Position(board)
+        accumulator.refresh(position)
+        batch[index] = accumulator.current(position.turn)
+    network.evaluate(batch[:1])  # The first forward pass is slower.
+    start = time.perf_counter()
+    result = np.concatenate([network.evaluate(batch[index:index + 256]) for index in range(0, len(positions), 256)])
+    return result, (time.perf_counter() - start) / len(positions)
+
+
+def update_time(network: Network, positions: list[chess.Board]) -> float:
+    """Get the seconds per move spent updating the output of the first layer, for every legal move of the positions."""
+    accumulator = Accumulator(network)
+    elapsed = 0.0
+    moves = 0
+    for board in positions:
+        position = Position(board)
+        accumulator.refresh(position)
+        legal_moves = position.legal_moves()
+        start = time.perf_counter()
+        for move in legal_moves:
+            accumulator.make(position, move)
+            accumulator.unmake()
+        elapsed += time.perf_counter() - start
+        moves += len(legal_moves)
+    return elapsed / max(1, moves)
+
+
+def compare(reference_path: str, other_path: str, count: int, seed: int) -> None:
+    """Log how far the scores of a model are from the scores of the reference model."""
+    positions = random_positions(count, seed)
+    reference = Network(reference_path)
+    other = Network(other_path)
+    reference_scores, reference_time = scores(reference, positions)
+    other_scores, other_time = scores(other, positions)
+    reference_update_time = update_time(reference, positions)
+    other_update_time = update_time(other, positions)
+    errors = np.abs(other_scores - reference_scores)
+    same_sign = np.mean(np.sign(other_scores) == np.sign(reference_scores))
+    logger.info(f"Compared {len(positions)} positions of random games.")
+    logger.info(f"Score error in centipawns: mean {errors.mean():.2f}, 99th percentile {np.percentile(errors, 99):.2f}, "
+                f"max {errors.max():.2f}. Same sign: {100 * same_sign:.1f}%.")
+    logger.info(f"First weights: {reference.first_weights.nbytes / 1024:.0f} KB ({reference.first_weights.dtype}) -> "
+                f"{other.first_weights.nbytes / 1024:.0f} KB ({other.first_weights.dtype}).")
+    logger.info(f"First layer: {reference_update_time * 1e6:.2f} -> {other_update_time * 1e6:.2f} microseconds per move.")
+    logger.info(f"Layers after the first: {reference_time * 1e6:.2f} -> {other_time * 1e6:.2f} microseconds per position.")
+
+
+def main() -> None:
+    """Write a model with `int8` weights and compare it with the original."""
+    parser = argparse.ArgumentParser(description="Store the weights of the network of NeuralEngine as int8 to use less "
+                                                 "memory, and check its scores.")
+    parser.add_argument("model", help="The .npz file of the network.")
+    parser.add_argument("output", help="The .npz file of the network with int8 weights.")
+    parser.add_argument("--compare-only", action="store_true",
+                        help="Only compare the scores of the two models, e.g. to check a model trained again.")
+    parser.add_argument("--positions", type=int, default=2000, help="How many positions to compare (default: 2000).")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random games (default: 0).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.compare_only:
+        quantize(args.model, args.output)
+        logger.info(f"Wrote {args.output}")
+    compare(args.model, args.output, max(1, args.positions), args.seed)
+
+
+if __name__ == "__main__":
+    main()
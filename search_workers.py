@@ -0,0 +1,144 @@
+"""
+Worker processes for the searches of homemade engines.
+
+Python runs the code of one process on one core, so a homemade engine needs more processes to use more cores. The workers
+are started with `subprocess` instead of `multiprocessing`, because the games are played in the daemon processes of a
+`multiprocessing.Pool`, which can't have children. The engine sends a function and its arguments to a worker with `pickle`,
+and the worker sends back what the function returned. Run as a script, this module is a worker.
+"""
+from __future__ import annotations
+import concurrent.futures
+import logging
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import threading
+from collections.abc import Callable
+from typing import IO, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">Q")  # The length of the pickled message that follows.
+CALL_TYPE = tuple[Callable[..., Any], tuple[Any, ...]]
+
+
+def send(stream: IO[bytes], message: Any) -> None:
+    """Write a pickled message to a pipe."""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def receive(stream: IO[bytes]) -> Any:
+    """Read a pickled message from a pipe. Raise `EOFError` if the other process closed it."""
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise EOFError("The search worker stopped.")
+    (length,) = HEADER.unpack(header)
+    data = stream.read(length)
+    if len(data) < length:
+        raise EOFError("The search worker stopped.")
+    return pickle.loads(data)
+
+
+def call_worker(process: subprocess.Popen[bytes], function: Callable[..., Any], args: tuple[Any, ...]) -> Any:
+    """Run a function in a worker process and wait for the result. An exception in the worker is raised again here."""
+    assert process.stdin is not None and process.stdout is not None
+    send(process.stdin, (function, args))
+    status, value = receive(process.stdout)
+    if status == "error":
+        raise value
+    return value
+
+
+class SearchWorkers:
+    """
+    A pool of worker processes that run one function call each per search.
+
+    The workers are started by the first search that needs them and are kept until `close` is called, so a function can
+    keep data between the searches of a game (e.g. a transposition table) in a global variable of its module. The functions
+    and their arguments must be picklable: the functions must be defined at the top level of a module.
+    """
+
+    poll_interval = 0.05  # How often, in seconds, the pool checks whether the search should stop.
+
+    def __init__(self) -> None:
+        """Initialize the pool without starting any worker."""
+        self.processes: list[subprocess.Popen[bytes]] = []
+        self.executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def start(self, count: int) -> None:
+        """Start workers until there are `count` of them."""
+        if self.executor is not None and len(self.processes) < count:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        while len(self.processes) < count:
+            self.processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                   cwd=os.path.dirname(os.path.abspath(__file__))))
+        if self.executor is None:
+            # Each thread waits for the result of one worker.
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=count, thread_name_prefix="search-worker")
+
+    def run(self, calls: list[CALL_TYPE], stopped: threading.Event) -> Optional[list[Any]]:
+        """
+        Run each call in its own worker, at the same time.
+
+        :param calls: The functions to call and their arguments.
+        :param stopped: When this is set (e.g. because the game ended), the workers are stopped.
+        :return: What each function returned, or `None` if the workers were stopped.
+        """
+        self.start(len(calls))
+        assert self.executor is not None
+        futures = [self.executor.submit(call_worker, process, function, args)
+                   for process, (function, args) in zip(self.processes, calls)]
+        while concurrent.futures.wait(futures, timeout=self.poll_interval).not_done:
+            if stopped.is_set():
+                logger.debug("Stopping the search workers.")
+                self.close()
+                return None
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            self.close()  # Start new workers for the next search, in case one of them died.
+            raise
+
+    def close(self) -> None:
+        """Stop all the workers."""
+        for process in self.processes:
+            process.kill()
+        for process in self.processes:
+            process.wait()
+            for stream in (process.stdin, process.stdout):
+                if stream is not None:
+                    stream.close()
+        self.processes = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+def main() -> None:
+    """Run the function calls sent by the engine until the engine closes the pipe."""
+    requests = sys.stdin.buffer
+    replies = sys.stdout.buffer
+    sys.stdout = sys.stderr  # Anything printed by the functions must not be mixed with the replies.
+    try:
+        while True:
+            try:
+                function, args = receive(requests)
+            except EOFError:
+                return
+            try:
+                reply = ("result", function(*args))
+            except Exception as error:
+                reply = ("error", error)
+            send(replies, reply)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,12 @@ With these classes, bot makers will not have to implement the UCI or XBoard inte
 from __future__ import annotations
 import chess
 from chess.engine import PlayResult
+import functools
 import random
-from engine_wrapper import MinimalEngine
-from typing import Any, Union
+from engine_wrapper import MinimalEngine, Deadline, SearchStats, COMMANDS_TYPE, OPTIONS_TYPE
+from config import Configuration
+from alphabeta import Searcher
+from typing import Any, Optional, Union
 import logging
 MOVE = Union[chess.engine.PlayResult, list[chess.Move]]
 
@@ -61,6 +64,7 @@ class ComboEngine(ExampleEngine):
     Get a move using multiple different methods.
 
     This engine demonstrates how one can use `time_limit`, `draw_offered`, and `root_moves`.
+    Engines that search until their time runs out can use `self.deadline(board, time_limit)` instead.
     """
 
     def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
@@ -75,15 +79,8 @@ class ComboEngine(ExampleEngine):
         :param root_moves: If it is a list, the engine should only play a move that is in `root_moves`.
         :return: The move to play.
         """
-        if isinstance(time_limit.time, int):
-            my_time = time_limit.time
-            my_inc = 0
-        elif board.turn == chess.WHITE:
-            my_time = time_limit.white_clock if isinstance(time_limit.white_clock, int) else 0
-            my_inc = time_limit.white_inc if isinstance(time_limit.white_inc, int) else 0
-        else:
-            my_time = time_limit.black_clock if isinstance(time_limit.black_clock, int) else 0
-            my_inc = time_limit.black_inc if isinstance(time_limit.black_inc, int) else 0
+        remaining_time, my_inc = self.time_manager.clock(board, time_limit)
+        my_time = remaining_time or 0
 
         possible_moves = root_moves if isinstance(root_moves, list) else list(board.legal_moves)
 
@@ -95,3 +92,76 @@ class ComboEngine(ExampleEngine):
             possible_moves.sort(key=str)
             move = possible_moves[0]
         return PlayResult(move, None, draw_offered=draw_offered)
+
+
+class AlphaBeta(ExampleEngine):
+    """
+    Search with iterative deepening alpha-beta. A reference engine to build on and to benchmark other engines against.
+
+    The search is in `alphabeta.py`. Set the size of the transposition table in megabytes with `Hash` in `homemade_options`.
+    With `Threads` above 1, the root moves are split between that many processes, and each process gets a transposition
+    table of its own of `Hash / Threads` megabytes (see `MinimalEngine.parallel_search`). Standard chess and Chess960 are
+    supported.
+    """
+
+    searcher_class: type[Searcher] = Searcher  # Replace this with a subclass of `Searcher` to change the search.
+    supports_pondering = True
+
+    def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
+                 draw_or_resign: Configuration, name: Optional[str] = None, **popen_args: str) -> None:
+        """Create the transposition table, which is kept until the end of the game, and the worker processes."""
+        super().__init__(commands, options, stderr, draw_or_resign, name, **popen_args)
+        self.searcher = self.searcher_class(int(options.get("Hash", 16)))
+        if self.thread_count() > 1:
+            self.search_workers.start(self.thread_count())  # Start the workers while the game starts.
+
+    def new_game(self) -> None:
+        """Clear the transposition table."""
+        super().new_game()
+        self.searcher.new_game()
+
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+               root_moves: MOVE) -> chess.engine.PlayResult:
+        """
+        Search until the deadline, or until the depth or the number of nodes in `time_limit` is reached.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search (e.g. we have 10 seconds and search up to depth 10).
+        :param ponder: Whether the engine can ponder after playing a move.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine should only play a move that is in `root_moves`.
+        :return: The move to play, with the depth, nodes, speed, score and principal variation in `info`.
+        """
+        threads = self.thread_count()
+        if threads > 1:
+            hash_size_mb = max(1, int(self.resources.get("hash", self.options.get("Hash", 16))) // threads)
+            result = self.parallel_search(board, time_limit, root_moves,
+                                          functools.partial(search_root_moves, self.searcher_class, hash_size_mb,
+                                                            self.game_number))
+        else:
+            result = self.searcher.search(board, self.deadline(board, time_limit), time_limit.depth, time_limit.nodes,
+                                          root_moves if isinstance(root_moves, list) else None, self.search_stats)
+        if "score" not in result.info:  # The game ended during a parallel search.
+            return result
+        self.scores.append(result.info["score"])
+        return self.offer_draw_or_resign(result, board)
+
+
+# The searcher of each `AlphaBeta` worker process, with the number of the game it is used for. See `search_root_moves`.
+worker_searchers: dict[tuple[type[Searcher], int], tuple[int, Searcher]] = {}
+
+
+def search_root_moves(searcher_class: type[Searcher], hash_size_mb: int, game_number: int, board: chess.Board,
+                      deadline: Deadline, time_limit: chess.engine.Limit, moves: list[chess.Move],
+                      stats: SearchStats) -> PlayResult:
+    """
+    Search some of the root moves in a worker process of `AlphaBeta`.
+
+    The searcher, with its transposition table, is kept until the game with the number `game_number` ends.
+    """
+    key = (searcher_class, hash_size_mb)
+    entry = worker_searchers.get(key)
+    if entry is None or entry[0] != game_number:
+        entry = (game_number, searcher_class(hash_size_mb))
+        worker_searchers[key] = entry
+    return entry[1].search(board, deadline, time_limit.depth, time_limit.nodes, moves, stats)
@@ -24,6 +24,11 @@ class GameStream:
     def __init__(self) -> None:
         """Initialize `self.moves_sent` to an empty string. It stores the moves that we have already sent."""
         self.moves_sent = ""
+        self.closed = False
+
+    def close(self) -> None:
+        """Stop sending game events."""
+        self.closed = True
 
     def iter_lines(self) -> Generator[bytes, None, None]:
         """Send the game events to lichess-bot."""
@@ -57,7 +62,7 @@ class GameStream:
                        "binc": 100,
                        "status": "started"}}).encode("utf-8")
         time.sleep(1)
-        while True:
+        while not self.closed:
             time.sleep(0.001)
             with open("./logs/events.txt") as events:
                 event = events.read()
@@ -70,7 +75,7 @@ class GameStream:
                     for move in moves.split():
                         board.push_uci(move)
                     wtime, btime = [seconds(float(n)) for n in state[1].split(",")]
-                    if len(moves) <= len(self.moves_sent) and not event:
+                    if len(moves) <= len(self.moves_sent) and not event and not self.closed:
                         time.sleep(0.001)
                         continue
                     self.moves_sent = moves
@@ -0,0 +1,80 @@
+"""Test the alpha-beta search of homemade engines."""
+import math
+import chess
+import chess.engine
+import pytest
+from alphabeta import Searcher
+from engine_wrapper import Deadline
+from typing import Optional
+
+
+def search(fen: str, max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> chess.engine.PlayResult:
+    """Search a position without a time limit."""
+    return Searcher().search(chess.Board(fen), Deadline(math.inf, math.inf), max_depth, max_nodes)
+
+
+@pytest.mark.timeout(60, method="thread")
+@pytest.mark.parametrize("fen,mate", [("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1", 1),
+                                      ("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1", 2),
+                                      ("r5k1/5ppp/8/8/7N/8/5PPP/6K1 b - - 0 1", 1)])
+def test_mate(fen: str, mate: int) -> None:
+    """Test that the search finds the shortest mate and stops there."""
+    result = search(fen, max_depth=2 * mate + 2)
+    assert result.info["score"].relative == chess.engine.Mate(mate)
+    assert result.info["depth"] <= 2 * mate
+    board = chess.Board(fen)
+    for move in result.info["pv"]:
+        assert move in board.legal_moves
+        board.push(move)
+    assert board.is_checkmate()
+
+
+@pytest.mark.timeout(60, method="thread")
+def test_win_material() -> None:
+    """Test that a hanging queen is taken."""
+    result = search("4k3/8/8/3q4/8/8/8/3RK3 w - - 0 1", max_depth=4)
+    assert result.move == chess.Move.from_uci("d1d5")
+
+
+@pytest.mark.timeout(60, method="thread")
+def test_depth_limit() -> None:
+    """Test that the search stops at the deepest iteration allowed."""
+    result = search(chess.STARTING_FEN, max_depth=3)
+    assert result.info["depth"] == 3
+    assert result.move in list(chess.Board().legal_moves)
+
+
+@pytest.mark.timeout(60, method="thread")
+def test_node_limit() -> None:
+    """Test that the search stops after the number of nodes allowed, with the best move of the last iteration."""
+    result = search(chess.STARTING_FEN, max_nodes=2000)
+    assert result.info["nodes"] <= 2000
+    assert result.info["depth"] >= 1
+    assert result.move in list(chess.Board().legal_moves)
+
+
+@pytest.mark.timeout(60, method="thread")
+def test_expired_deadline() -> None:
+    """Test that a move is found even if the deadline passed, because the first iteration always finishes."""
+    result = Searcher().search(chess.Board(), Deadline(0, 0))
+    assert result.info["depth"] == 1
+    assert result.move in list(chess.Board().legal_moves)
+
+
+@pytest.mark.timeout(60, method="thread")
+def test_root_moves() -> None:
+    """Test that only the root moves are searched."""
+    root_moves = [chess.Move.from_uci("a2a3"), chess.Move.from_uci("h2h3")]
+    result = Searcher().search(chess.Board(), Deadline(math.inf, math.inf), max_depth=3, root_moves=root_moves)
+    assert result.move in root_moves
+
+
+@pytest.mark.timeout(60, method="thread")
+def test_chess960() -> None:
+    """Test that a Chess960 game can be searched, and that castling is played as the king taking its rook."""
+    board = chess.Board("2rkr3/2p1p3/8/8/8/8/8/RK6 w A - 0 1", chess960=True)
+    result = Searcher().search(board, Deadline(math.inf, math.inf), max_depth=3)
+    assert result.move == chess.Move.from_uci("b1a1")
+    assert result.info["score"].relative == chess.engine.Mate(1)
+    board = chess.Board.from_chess960_pos(0)
+    assert Searcher().search(board, Deadline(math.inf, math.inf), max_depth=3).move in list(board.legal_moves)
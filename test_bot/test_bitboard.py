@@ -0,0 +1,152 @@
+"""Test the bitboard position of homemade engines against python-chess."""
+import chess
+import chess.polyglot
+import chess.variant
+import pytest
+from bitboard import Position
+
+positions = {"start": chess.STARTING_FEN,
+             "kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+             "endgame": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+             "promotions": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+             "checks": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+             "en passant": "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"}
+
+chess960_positions = {"chess960 1": "bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9",
+                      "chess960 2": "2nnrbkr/p1qppppp/8/1ppb4/6PP/3PP3/PPP2P2/BQNNRBKR w HEhe - 1 9",
+                      "chess960 3": "b1q1rrkb/pppppppp/3nn3/8/P7/1PPP4/4PPPP/BQNNRKRB w GE - 1 9",
+                      "king on its castled square": "1r4kr/8/8/8/8/8/8/1R4KR w HBhb - 0 1",
+                      "king and rook swap": "4k3/8/8/8/8/8/8/5KR1 w G - 0 1"}
+
+
+def perft(position: Position, depth: int) -> int:
+    """Count the positions `depth` moves from the position."""
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in position.generate_moves():
+        if position.make(move):
+            nodes += perft(position, depth - 1)
+            position.unmake()
+    return nodes
+
+
+@pytest.mark.timeout(150, method="thread")
+@pytest.mark.parametrize("name,depth,nodes", [("start", 4, 197281),
+                                              ("kiwipete", 3, 97862),
+                                              ("endgame", 4, 43238),
+                                              ("promotions", 3, 9467),
+                                              ("checks", 3, 62379)])
+def test_perft(name: str, depth: int, nodes: int) -> None:
+    """Test the number of positions a few moves deep, which is known for these positions."""
+    assert perft(Position(chess.Board(positions[name])), depth) == nodes
+
+
+def compare(position: Position, board: chess.Board, depth: int) -> None:
+    """Check that the moves and the Zobrist hash of every position `depth` moves deep are the same as python-chess's."""
+    assert position.key == chess.polyglot.zobrist_hash(board)
+    assert position.is_check() == board.is_check()
+    if depth == 0:
+        return
+    moves = position.legal_moves()
+    assert sorted(position.to_move(move).uci() for move in moves) == sorted(move.uci() for move in board.legal_moves)
+    for move in moves:
+        assert position.make(move)
+        board.push(position.to_move(move))
+        compare(position, board, depth - 1)
+        board.pop()
+        position.unmake()
+
+
+@pytest.mark.timeout(150, method="thread")
+@pytest.mark.parametrize("name,depth,nodes", [("chess960 1", 3, 12189),
+                                              ("chess960 2", 3, 18002),
+                                              ("chess960 3", 3, 10471)])
+def test_perft_chess960(name: str, depth: int, nodes: int) -> None:
+    """Test the number of positions a few moves deep in Chess960 positions, where it is known."""
+    assert perft(Position(chess.Board(chess960_positions[name], chess960=True)), depth) == nodes
+
+
+@pytest.mark.timeout(150, method="thread")
+@pytest.mark.parametrize("name", positions)
+def test_moves_and_keys(name: str) -> None:
+    """Test the legal moves and the Zobrist hashes against python-chess."""
+    board = chess.Board(positions[name])
+    compare(Position(board), board, 2)
+
+
+@pytest.mark.timeout(150, method="thread")
+@pytest.mark.parametrize("name", chess960_positions)
+def test_moves_and_keys_chess960(name: str) -> None:
+    """Test the legal moves, including castling, and the Zobrist hashes of Chess960 positions against python-chess."""
+    board = chess.Board(chess960_positions[name], chess960=True)
+    compare(Position(board), board, 2)
+
+
+@pytest.mark.timeout(150, method="thread")
+def test_castling_chess960() -> None:
+    """Test castling from every square of the king and the rooks of the Chess960 start positions against python-chess."""
+    back_ranks = set()
+    for scharnagl in range(960):
+        board = chess.Board.from_chess960_pos(scharnagl)
+        for square in chess.scan_forward(board.knights | board.bishops | board.queens):
+            board.remove_piece_at(square)
+        if board.board_fen() not in back_ranks:
+            back_ranks.add(board.board_fen())
+            compare(Position(board), board, 2)
+    assert len(back_ranks) == 56  # Each choice of 3 of the 8 squares, with the king between the rooks.
+
+
+def test_start_chess960() -> None:
+    """Test that a Chess960 start position has the moves of python-chess."""
+    board = chess.Board.from_chess960_pos(0)
+    compare(Position(board), board, 2)
+
+
+def test_unmake() -> None:
+    """Test that unmaking moves restores the position."""
+    position = Position(chess.Board(positions["kiwipete"]))
+    before = (list(position.bitboards), list(position.squares), position.key, position.castling, position.ep_square,
+              position.halfmove_clock, position.middlegame, position.endgame, position.phase)
+    for move in position.legal_moves():
+        assert position.make(move)
+        position.unmake()
+    assert (position.bitboards, position.squares, position.key, position.castling, position.ep_square,
+            position.halfmove_clock, position.middlegame, position.endgame, position.phase) == before
+
+
+@pytest.mark.parametrize("name", positions)
+def test_to_board(name: str) -> None:
+    """Test that converting back to a `chess.Board` gives the same position."""
+    board = chess.Board(positions[name])
+    assert Position(board).to_board().fen() == board.fen()
+
+
+def test_from_move() -> None:
+    """Test that a `chess.Move` is converted to a move of the position and back, and that illegal moves are refused."""
+    board = chess.Board(positions["kiwipete"])
+    position = Position(board)
+    for move in board.legal_moves:
+        assert position.to_move(position.from_move(move)) == move
+    with pytest.raises(ValueError):
+        position.from_move(chess.Move.from_uci("a1a8"))
+
+
+def test_repetition() -> None:
+    """Test that a position that was on the board before is a repetition, including the moves before the search."""
+    board = chess.Board()
+    for move in ["g1f3", "g8f6", "f3g1", "f6g8"]:
+        board.push_uci(move)
+    assert Position(board).is_repetition()
+
+    position = Position(chess.Board())
+    assert not position.is_repetition()
+    for uci in ["g1f3", "g8f6", "f3g1", "f6g8"]:
+        assert position.make(position.from_move(chess.Move.from_uci(uci)))
+    assert position.is_repetition()
+
+
+def test_unsupported() -> None:
+    """Test that only standard chess and Chess960 are supported."""
+    with pytest.raises(ValueError):
+        Position(chess.variant.AtomicBoard())
@@ -11,6 +11,7 @@ import os
 import sys
 import stat
 import shutil
+import subprocess
 import importlib
 import config
 from timer import Timer, to_seconds, seconds
@@ -270,6 +271,37 @@ def test_sjeng() -> None:
                                        "bo vs b - zzzzzzzz.pgn"))
 
 
+@pytest.mark.timeout(150, method="thread")
+def test_remote() -> None:
+    """Test lichess-bot with Stockfish running in an engine host (Remote)."""
+    if platform != "linux" and platform != "win32":
+        assert True
+        return
+    if os.path.exists("logs"):
+        shutil.rmtree("logs")
+    os.mkdir("logs")
+    address = "127.0.0.1:9797"
+    engine_host = subprocess.Popen([sys.executable, "engine_host.py", "--listen", address, "--", stockfish_path])
+    time.sleep(2)
+    with open("./config.yml.default") as file:
+        CONFIG = yaml.safe_load(file)
+    CONFIG["token"] = ""
+    CONFIG["engine"]["protocol"] = "remote"
+    CONFIG["engine"]["remote"]["address"] = address
+    CONFIG["engine"]["uci_options"]["Threads"] = 1
+    CONFIG["pgn_directory"] = "TEMP/remote_game_record"
+    try:
+        win = run_bot(CONFIG, logging_level)
+    finally:
+        engine_host.terminate()
+        engine_host.wait()
+    shutil.rmtree("logs")
+    lichess_bot.logger.info("Finished Testing Remote")
+    assert win == "1"
+    assert os.path.isfile(os.path.join(CONFIG["pgn_directory"],
+                                       "bo vs b - zzzzzzzz.pgn"))
+
+
 @pytest.mark.timeout(150, method="thread")
 def test_homemade() -> None:
     """Test lichess-bot with a homemade engine running Stockfish (Homemade)."""
@@ -0,0 +1,68 @@
+"""Test the division of the engine threads and hash between games."""
+import pytest
+from config import Configuration
+from cpu_budget import CpuBudget, divide
+
+
+def test_divide__equal_weights() -> None:
+    """Test that an amount is divided evenly and that the remainder goes to some of the games."""
+    shares = divide(8, {"a": 1, "b": 1, "c": 1})
+    assert sum(shares.values()) == 8
+    assert sorted(shares.values()) == [2, 3, 3]
+
+
+def test_divide__proportional() -> None:
+    """Test that the shares follow the weights."""
+    assert divide(12, {"bullet": 3, "blitz": 2, "classical": 1}) == {"bullet": 6, "blitz": 4, "classical": 2}
+
+
+def test_divide__at_least_one() -> None:
+    """Test that every game gets at least 1, even if the total is too small."""
+    assert divide(2, {"a": 1, "b": 1, "c": 1, "d": 1}) == {"a": 1, "b": 1, "c": 1, "d": 1}
+    assert divide(1, {"a": 100, "b": 1}) == {"a": 1, "b": 1}
+
+
+def test_divide__no_games() -> None:
+    """Test that there is nothing to divide without games."""
+    assert divide(8, {}) == {}
+
+
+def budget(**settings: object) -> CpuBudget:
+    """Create a budget with a plain dictionary for the allocations."""
+    return CpuBudget(Configuration({"enabled": True, "threads": 8, **settings}), {})
+
+
+def test_cpu_budget__threads_and_hash() -> None:
+    """Test that the threads and hash are divided between the active games by their speed."""
+    cpu_budget = budget(hash=1024)
+    cpu_budget.set_speed("bullet_game", "bullet")
+    cpu_budget.set_speed("classical_game", "classical")
+    cpu_budget.update({"bullet_game", "classical_game"})
+    assert cpu_budget.allocations == {"bullet_game": {"threads": 6, "hash": 768},
+                                      "classical_game": {"threads": 2, "hash": 256}}
+
+
+def test_cpu_budget__game_ends() -> None:
+    """Test that a game that ends loses its share and that the other games get it."""
+    cpu_budget = budget()
+    cpu_budget.update({"a", "b"})
+    assert cpu_budget.allocations == {"a": {"threads": 4}, "b": {"threads": 4}}
+    cpu_budget.update({"b"})
+    assert cpu_budget.allocations == {"b": {"threads": 8}}
+
+
+def test_cpu_budget__speed_weights() -> None:
+    """Test that the configured speed weights replace the default weights."""
+    cpu_budget = budget(speed_weights={"bullet": 1})
+    cpu_budget.set_speed("bullet_game", "bullet")
+    cpu_budget.set_speed("classical_game", "classical")
+    cpu_budget.update({"bullet_game", "classical_game"})
+    assert cpu_budget.allocations == {"bullet_game": {"threads": 4}, "classical_game": {"threads": 4}}
+
+
+@pytest.mark.parametrize("enabled", [False, None])
+def test_cpu_budget__disabled(enabled: object) -> None:
+    """Test that a disabled budget doesn't change the engines."""
+    cpu_budget = budget(enabled=enabled)
+    cpu_budget.update({"a", "b"})
+    assert cpu_budget.allocations == {}
@@ -0,0 +1,39 @@
+"""Test the ensemble of engines."""
+import chess.engine
+from typing import Any, cast
+from config import Configuration, insert_default_values
+from engine_wrapper import EngineWrapper, EnsembleEngine, OPTIONS_TYPE
+
+
+class RecordingEngine:
+    """Take the place of `chess.engine.SimpleEngine` and remember the options it is configured with."""
+
+    def __init__(self) -> None:
+        """Start without options."""
+        self.configured: list[OPTIONS_TYPE] = []
+
+    def configure(self, options: OPTIONS_TYPE) -> None:
+        """Remember the options."""
+        self.configured.append(dict(options))
+
+
+def test_new_game() -> None:
+    """Test that a new game only configures each engine once, with its own options, and resets the ensemble."""
+    CONFIG: dict[str, Any] = {}
+    insert_default_values(CONFIG)
+    engine_cfg = Configuration(CONFIG).engine
+    members = []
+    for threads in [2, 1]:
+        member = EngineWrapper({"Threads": threads}, engine_cfg.draw_or_resign)
+        member.engine = cast(chess.engine.SimpleEngine, RecordingEngine())
+        members.append(member)
+    ensemble = EnsembleEngine(members, engine_cfg.ensemble, engine_cfg.draw_or_resign)
+    ensemble.scores = [chess.engine.PovScore(chess.engine.Cp(20), chess.WHITE)]
+    ensemble.move_commentary = [{"depth": 10}]
+
+    ensemble.new_game()
+    assert [cast(RecordingEngine, member.engine).configured for member in members] == [[{"Threads": 2}], [{"Threads": 1}]]
+    assert ensemble.game_number == 1
+    assert all(member.game_number == 1 for member in members)
+    assert ensemble.scores == []
+    assert ensemble.move_commentary == []
@@ -0,0 +1,114 @@
+"""Test the moves that are played without a search."""
+import chess
+import chess.engine
+import model
+from typing import Any, Optional, Union
+from config import Configuration
+from instant_moves import InstantMoves
+from test_bot.test_time_manager import make_game
+
+
+def instant_moves_config(**rules: Any) -> Configuration:
+    """Get the `engine.instant_moves` section of the config with all the rules enabled, changed by `rules`."""
+    return Configuration({"enabled": True, "single_legal_move": True, "forced_recapture": True, "repeated_position": True,
+                          "low_clock_time": 0, **rules})
+
+
+def get_move(board: chess.Board, instant_moves: Optional[InstantMoves] = None, clock: int = 60000,
+             **rules: Any) -> Optional[chess.Move]:
+    """Get the instant move in a position, or `None` if no rule applies."""
+    instant_moves = instant_moves or InstantMoves()
+    position = model.PositionContext(board, make_game(wtime=clock, btime=clock))
+    return instant_moves.get_move(position, instant_moves_config(**rules)).move
+
+
+def remember(instant_moves: InstantMoves, board: chess.Board, pv: list[str], score: int = 0) -> None:
+    """Remember a search of the position that found `pv`."""
+    moves = [chess.Move.from_uci(move) for move in pv]
+    result = chess.engine.PlayResult(moves[0], None, {"pv": moves, "score": chess.engine.PovScore(chess.engine.Cp(score),
+                                                                                                  board.turn)})
+    instant_moves.remember_search(model.PositionContext(board, make_game(wtime=60000, btime=60000)), result)
+
+
+def board_after(start: Union[str, chess.Board], *moves: str) -> chess.Board:
+    """Get the position after playing `moves` from a FEN or from a copy of a board."""
+    board = start.copy() if isinstance(start, chess.Board) else chess.Board(start)
+    for move in moves:
+        board.push_uci(move)
+    return board
+
+
+def test_disabled() -> None:
+    """Test that no rule is used if instant moves are disabled."""
+    board = chess.Board("7k/8/8/8/8/8/6q1/7K w - - 0 1")
+    assert get_move(board, enabled=False) is None
+
+
+def test_single_legal_move() -> None:
+    """Test that the only legal move is played."""
+    board = chess.Board("7k/8/8/8/8/8/6q1/7K w - - 0 1")
+    assert get_move(board) == chess.Move.from_uci("h1g2")
+    assert get_move(board, single_legal_move=False) is None
+    assert get_move(chess.Board()) is None
+
+
+def test_forced_recapture() -> None:
+    """Test that the only recapture is played."""
+    board = board_after("4k3/8/8/8/1b6/8/3B4/3Q3K b - - 0 1", "b4d2")
+    assert get_move(board) == chess.Move.from_uci("d1d2")
+    assert get_move(board, forced_recapture=False) is None
+
+
+def test_forced_recapture__not_a_capture() -> None:
+    """Test that there is nothing to recapture after a move that didn't capture."""
+    assert get_move(board_after("4k3/8/8/8/1b6/8/3B4/3Q3K b - - 0 1", "b4c5")) is None
+
+
+def test_forced_recapture__cheaper_capturer() -> None:
+    """Test that the engine decides whether to recapture if the opponent captured with a cheaper piece."""
+    assert get_move(board_after("4k3/8/8/2p5/3B4/8/8/3R3K b - - 0 1", "c5d4")) is None
+
+
+def test_forced_recapture__several_recaptures() -> None:
+    """Test that the engine chooses between several recaptures."""
+    assert get_move(board_after("4k3/8/8/8/1b6/8/3B4/3QK3 b - - 0 1", "b4d2")) is None
+
+
+def test_forced_recapture__defended_square() -> None:
+    """Test that a recapture that puts a more valuable piece en prise is left to the engine."""
+    board = board_after("4k3/8/7q/8/1b6/8/3B4/K2Q4 b - - 0 1", "b4d2")
+    assert get_move(board) is None
+
+
+def test_repeated_position() -> None:
+    """Test that the move of the earlier search of a repeated position is played again."""
+    instant_moves = InstantMoves()
+    remember(instant_moves, chess.Board(), ["e2e4", "e7e5"], score=50)
+    board = board_after(chess.STARTING_FEN, "g1f3", "g8f6", "f3g1", "f6g8")
+    assert get_move(board, instant_moves) == chess.Move.from_uci("e2e4")
+    assert get_move(board, instant_moves, repeated_position=False) is None
+
+
+def test_repeated_position__winning() -> None:
+    """Test that a winning engine doesn't repeat a move that lets the opponent head for a draw by repetition."""
+    board = board_after(chess.STARTING_FEN, "g1f3", "g8f6", "f3g1", "f6g8")
+    instant_moves = InstantMoves()
+    remember(instant_moves, chess.Board(), ["g1f3", "g8f6"], score=50)
+    assert get_move(board, instant_moves) is None
+
+    instant_moves = InstantMoves()
+    remember(instant_moves, chess.Board(), ["g1f3", "g8f6"], score=0)
+    assert get_move(board, instant_moves) == chess.Move.from_uci("g1f3")
+
+
+def test_low_clock() -> None:
+    """Test that the expected move is played at once on a low clock if the opponent played the expected reply."""
+    instant_moves = InstantMoves()
+    board = board_after(chess.STARTING_FEN, "e2e4", "e7e5")
+    remember(instant_moves, board, ["g1f3", "b8c6", "f1b5"])
+    expected = board_after(board, "g1f3", "b8c6")
+    assert get_move(expected, instant_moves, clock=500, low_clock_time=1000) == chess.Move.from_uci("f1b5")
+    assert get_move(expected, instant_moves, clock=5000, low_clock_time=1000) is None
+
+    unexpected = board_after(board, "g1f3", "g8f6")
+    assert get_move(unexpected, instant_moves, clock=500, low_clock_time=1000) is None
@@ -0,0 +1,117 @@
+"""Test the tree of the Monte Carlo tree search."""
+import pytest
+from mcts import EXPANDED, NEW, Tree
+
+
+def small_tree() -> Tree:
+    """Get a tree whose root has the moves 10, 11 and 12, where the move 11 has the replies 20 and 21."""
+    tree = Tree(capacity=2)
+    tree.expand(0, [10, 11, 12], [0.5, 0.3, 0.2])
+    tree.expand(2, [20, 21], [0.6, 0.4])
+    return tree
+
+
+def test_expand() -> None:
+    """Test that the children of a node are next to each other, with their moves, parent and prior."""
+    tree = small_tree()
+    assert tree.size == 6
+    assert tree.state[0] == tree.state[2] == EXPANDED
+    assert tree.state[1] == NEW
+    assert list(tree.move[1:6]) == [10, 11, 12, 20, 21]
+    assert list(tree.parent[:6]) == [-1, 0, 0, 0, 2, 2]
+    assert tree.prior[4] == pytest.approx(0.6)
+    assert tree.find_child(0, 11) == 2
+    assert tree.find_child(2, 21) == 5
+    assert tree.find_child(0, 99) == -1
+    assert tree.find_child(1, 10) == -1
+
+
+def test_backup() -> None:
+    """Test that the value of a leaf is added to its path, with the sign of the side that moved to each node."""
+    tree = small_tree()
+    tree.backup([0, 2, 5], 0.5, virtual_loss=False)
+    assert list(tree.visits[:6]) == [1, 0, 1, 0, 0, 1]
+    assert tree.value(5) == pytest.approx(-0.5)
+    assert tree.value(2) == pytest.approx(0.5)
+    assert tree.value(0) == pytest.approx(-0.5)
+
+    tree.backup([0, 1], -1, virtual_loss=False)
+    assert tree.value(1) == pytest.approx(1)
+    assert tree.visits[0] == 2
+
+
+def test_virtual_loss() -> None:
+    """Test that a virtual loss turns the next search away from a node until its value is backed up."""
+    tree = small_tree()
+    for child in [1, 2, 3]:
+        tree.backup([0, child], 0, virtual_loss=False)
+    first = tree.select_child(0, 1.5, 0.2)
+    tree.add_virtual_loss([0, first])
+    assert tree.select_child(0, 1.5, 0.2) != first
+    tree.backup([0, first], 0, virtual_loss=True)
+    assert list(tree.virtual_losses[:6]) == [0] * 6
+    assert tree.visits[first] == 2
+
+
+def test_select_child() -> None:
+    """Test that an unvisited child is chosen by its prior and that a child that wins is searched again."""
+    tree = small_tree()
+    tree.backup([0], 0, virtual_loss=False)
+    assert tree.select_child(0, 0.5, 0.2) == 1
+    tree.backup([0, 3], -1, virtual_loss=False)  # The move 12 wins for the side that played it.
+    assert tree.select_child(0, 0.5, 0.2) == 3
+
+
+def test_most_visited_child() -> None:
+    """Test that the move played and the principal variation follow the most visited children."""
+    tree = small_tree()
+    for path in [[0, 2, 4], [0, 2, 5], [0, 2, 5], [0, 1]]:
+        tree.backup(path, 0, virtual_loss=False)
+    assert tree.most_visited_child(0) == 2
+    assert tree.principal_variation() == [2, 5]
+
+
+def test_subtree() -> None:
+    """Test that the subtree of a node has the node as root, with the same children, visits and values."""
+    tree = small_tree()
+    for path in [[0, 2, 4], [0, 2, 5], [0, 2, 5], [0, 1]]:
+        tree.backup(path, 0.25, virtual_loss=False)
+    tree.add_virtual_loss([0, 2, 4])
+    subtree = tree.subtree(2)
+    assert subtree.size == 3
+    assert subtree.parent[0] == -1
+    assert list(subtree.parent[1:3]) == [0, 0]
+    assert subtree.state[0] == EXPANDED
+    assert subtree.first_child[0] == 1
+    assert subtree.child_count[0] == 2
+    assert list(subtree.move[:3]) == [11, 20, 21]
+    assert list(subtree.visits[:3]) == [3, 1, 2]
+    assert subtree.value(0) == pytest.approx(tree.value(2))
+    assert subtree.value(2) == pytest.approx(tree.value(5))
+    assert list(subtree.virtual_losses[:3]) == [0, 0, 0]
+    assert subtree.find_child(0, 21) == 2
+
+    subtree.expand(1, [30], [1.0])
+    assert subtree.size == 4
+    assert tree.size == 6
+    assert tree.state[4] == NEW
+
+
+def test_subtree_of_leaf() -> None:
+    """Test that the subtree of a node that wasn't expanded only has the node."""
+    tree = small_tree()
+    tree.backup([0, 3], 1, virtual_loss=False)
+    subtree = tree.subtree(3)
+    assert subtree.size == 1
+    assert subtree.state[0] == NEW
+    assert subtree.visits[0] == 1
+    assert subtree.move[0] == 12
+
+
+def test_grow() -> None:
+    """Test that the arrays grow without losing nodes."""
+    tree = Tree(capacity=1)
+    tree.expand(0, list(range(100)), [0.01] * 100)
+    assert tree.size == 101
+    assert list(tree.move[1:101]) == list(range(100))
+    assert tree.memory() >= 101 * Tree.bytes_per_node
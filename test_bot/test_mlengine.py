@@ -0,0 +1,58 @@
+"""Test the search of the neural network engine."""
+import math
+import threading
+import chess
+import chess.engine
+import pytest
+from typing import Any
+from config import Configuration, insert_default_values
+from engine_wrapper import Deadline
+from engines.mlengine import NeuralEngine
+
+
+class FixedDeadlineEngine(NeuralEngine):
+    """A `NeuralEngine` whose searches all get the same deadline."""
+
+    fixed_deadline = Deadline(math.inf, math.inf)
+
+    def deadline(self, board: chess.Board, time_limit: chess.engine.Limit) -> Deadline:
+        """Get the fixed deadline."""
+        return self.fixed_deadline
+
+
+def search(fen: str, deadline: Deadline) -> chess.engine.PlayResult:
+    """Search a position at `Depth: 2`, with the network that counts the material."""
+    CONFIG: dict[str, Any] = {}
+    insert_default_values(CONFIG)
+    engine = FixedDeadlineEngine([], {"Depth": 2}, None, Configuration(CONFIG).engine.draw_or_resign)
+    engine.fixed_deadline = deadline
+    return engine.search(chess.Board(fen), chess.engine.Limit(), False, False, chess.engine.PlayResult(None, None))
+
+
+@pytest.mark.timeout(30, method="thread")
+def test_depth_2() -> None:
+    """Test that the replies are searched when there is time, so a defended piece is not taken."""
+    result = search("4k3/8/2p5/3n4/8/8/8/3QK3 w - - 0 1", Deadline(math.inf, math.inf))
+    assert result.info["depth"] == 2
+    assert len(result.info["pv"]) == 2
+    assert result.move != chess.Move.from_uci("d1d5")
+
+
+@pytest.mark.timeout(30, method="thread")
+@pytest.mark.parametrize("deadline", [Deadline(math.inf, 0), Deadline(0, math.inf)])
+def test_deadline(deadline: Deadline) -> None:
+    """Test that the search plays the best move at depth 1 if a deadline passes before the replies are searched."""
+    result = search("4k3/8/8/3q4/8/8/8/3RK3 w - - 0 1", deadline)
+    assert result.info["depth"] == 1
+    assert result.info["pv"] == [chess.Move.from_uci("d1d5")]
+    assert result.move == chess.Move.from_uci("d1d5")
+
+
+@pytest.mark.timeout(30, method="thread")
+def test_stopped() -> None:
+    """Test that a stopped search (e.g. because the game ended) doesn't search the replies."""
+    stopped = threading.Event()
+    stopped.set()
+    result = search(chess.STARTING_FEN, Deadline(math.inf, math.inf, stopped))
+    assert result.info["depth"] == 1
+    assert result.move is not None and result.move in chess.Board().legal_moves
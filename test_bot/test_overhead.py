@@ -0,0 +1,91 @@
+"""Test the calibration of the move overhead."""
+import chess
+import pytest
+from typing import Any
+import model
+from config import Configuration, insert_default_values
+from overhead import MoveOverhead, percentile
+from timer import Timer, msec, seconds
+
+
+def test_percentile() -> None:
+    """Test the percentiles of a few samples, between the samples and at both ends."""
+    samples = [40.0, 10.0, 30.0, 20.0, 50.0]
+    assert percentile(samples, 0) == 10
+    assert percentile(samples, 50) == 30
+    assert percentile(samples, 100) == 50
+    assert percentile(samples, 90) == pytest.approx(46)
+    assert percentile(samples, 150) == 50
+    assert percentile([7.0], 95) == 7
+
+
+def move_overhead(global_samples: list[float], **calibration: Any) -> MoveOverhead:
+    """Get the estimate of a game with the default config, changed by `calibration`."""
+    CONFIG: dict[str, Any] = {"move_overhead": 1000, "move_overhead_calibration": {"enabled": True, **calibration}}
+    insert_default_values(CONFIG)
+    return MoveOverhead(Configuration(CONFIG), global_samples)
+
+
+def test_move_overhead__disabled() -> None:
+    """Test that the configured overhead is used when the calibration is disabled."""
+    overhead = move_overhead([500.0] * 10, enabled=False)
+    assert overhead.current() == msec(1000)
+
+
+def test_move_overhead__few_samples() -> None:
+    """Test that the configured overhead is used until enough overheads are measured."""
+    overhead = move_overhead([])
+    for sample in [300.0, 300.0, 300.0, 300.0]:
+        overhead.add_sample(sample)
+        assert overhead.current() == msec(1000)
+    overhead.add_sample(300)
+    assert overhead.current() == msec(300)
+
+
+def test_move_overhead__global_samples() -> None:
+    """Test that the overheads of other games are used until this game has enough of its own."""
+    overhead = move_overhead([200.0] * 10, percentile=50)
+    assert overhead.current() == msec(200)
+    for _ in range(5):
+        overhead.add_sample(400)
+    assert overhead.current() == msec(400)
+
+
+def test_move_overhead__limits() -> None:
+    """Test that the estimate stays between the smallest and largest overheads allowed."""
+    assert move_overhead([10.0] * 10).current() == msec(100)
+    assert move_overhead([9000.0] * 10).current() == msec(5000)
+
+
+def test_move_overhead__window() -> None:
+    """Test that only the most recent overheads are kept."""
+    global_samples: list[float] = []
+    overhead = move_overhead(global_samples, window=5)
+    for sample in range(10):
+        overhead.add_sample(sample)
+    assert overhead.samples == [5, 6, 7, 8, 9]
+    assert global_samples == [5, 6, 7, 8, 9]
+
+
+def test_move_overhead__measure() -> None:
+    """Test that the overhead is the time taken from the clock minus the increment and the time to send the move."""
+    game = model.Game({"id": "zzzzzzzz",
+                       "speed": "blitz",
+                       "variant": {"name": "Standard"},
+                       "createdAt": 1600000000000,
+                       "white": {"id": "bo", "name": "bo", "title": "BOT", "rating": 3000},
+                       "black": {"id": "b", "name": "b", "title": "BOT", "rating": 3000},
+                       "state": {"moves": "", "wtime": 10000, "btime": 10000, "winc": 1000, "binc": 1000}},
+                      "bo", "https://lichess.org/", seconds(20))
+    board = chess.Board()
+    for move in ["e2e4", "e7e5"]:
+        board.push_uci(move)
+    overhead = move_overhead([])
+    setup_timer = Timer()
+    overhead.move_sent(game, board, setup_timer, Timer())
+    for move in ["g1f3", "b8c6"]:
+        board.push_uci(move)
+    game.state["wtime"] = 10000 + 1000 - 300
+    overhead.game_state_received(game, board)
+    assert overhead.samples == [pytest.approx(300, abs=50)]
+    assert overhead.pending is None
@@ -0,0 +1,134 @@
+"""Test the time management of homemade engines."""
+import threading
+import chess
+import chess.engine
+import pytest
+from typing import Any, cast
+import lichess
+import model
+from config import Configuration, insert_default_values
+from engine_wrapper import MinimalEngine, TimeManager, game_clock_time
+from timer import Timer, msec, seconds
+
+
+def make_game(wtime: int, btime: int, winc: int = 0, binc: int = 0) -> model.Game:
+    """Create a game with the clocks (in milliseconds) of both sides."""
+    return model.Game({"id": "zzzzzzzz",
+                       "speed": "blitz",
+                       "clock": {"initial": 180000, "increment": winc},
+                       "variant": {"name": "Standard"},
+                       "createdAt": 1600000000000,
+                       "white": {"id": "bo", "name": "bo", "title": "BOT", "rating": 3000},
+                       "black": {"id": "b", "name": "b", "title": "BOT", "rating": 3000},
+                       "state": {"moves": "", "wtime": wtime, "btime": btime, "winc": winc, "binc": binc}},
+                      "bo", "https://lichess.org/", seconds(20))
+
+
+def test_deadline__move_time() -> None:
+    """Test that a fixed search time is both deadlines."""
+    deadline = TimeManager().deadline(chess.Board(), chess.engine.Limit(time=2.5))
+    assert deadline.soft_time == deadline.hard_time == 2.5
+
+
+def test_deadline__no_clock() -> None:
+    """Test that a search without a time limit only ends when it is stopped."""
+    stopped = threading.Event()
+    deadline = TimeManager().deadline(chess.Board(), chess.engine.Limit(depth=10), stopped)
+    assert not deadline.soft_expired()
+    assert not deadline.hard_expired()
+    stopped.set()
+    assert deadline.soft_expired()
+    assert deadline.hard_expired()
+
+
+def test_deadline__clock() -> None:
+    """Test the share of the clock and of the increment at the start of the game."""
+    limit = chess.engine.Limit(white_clock=60, black_clock=30, white_inc=1, black_inc=2)
+    deadline = TimeManager().deadline(chess.Board(), limit)
+    assert deadline.soft_time == pytest.approx(60 / 40 + 0.75 * 1)
+    assert deadline.hard_time == pytest.approx(3 * deadline.soft_time)
+
+    board = chess.Board()
+    board.push_uci("e2e4")
+    deadline = TimeManager().deadline(board, limit)
+    assert deadline.soft_time == pytest.approx(30 / 40 + 0.75 * 2)
+
+
+def test_deadline__remaining_moves() -> None:
+    """Test that the moves to the next time control replace the estimate of the moves left."""
+    limit = chess.engine.Limit(white_clock=60, black_clock=60, remaining_moves=10)
+    assert TimeManager().deadline(chess.Board(), limit).soft_time == pytest.approx(6)
+
+
+def test_deadline__endgame() -> None:
+    """Test that fewer moves are expected when only kings and pawns are left."""
+    board = chess.Board("4k3/pppp4/8/8/8/8/4PPPP/4K3 w - - 0 40")
+    deadline = TimeManager().deadline(board, chess.engine.Limit(white_clock=30, black_clock=30))
+    assert deadline.soft_time == pytest.approx(30 / 15)
+
+
+def test_deadline__panic() -> None:
+    """Test that a large increment can't make a search use more than a share of the clock."""
+    limit = chess.engine.Limit(white_clock=1, black_clock=1, white_inc=10, black_inc=10)
+    deadline = TimeManager().deadline(chess.Board(), limit)
+    assert deadline.hard_time == pytest.approx(0.4)
+    assert deadline.soft_time == pytest.approx(0.4)
+
+
+def test_panic_time() -> None:
+    """Test the longest time of a search with and without a clock."""
+    time_manager = TimeManager()
+    assert time_manager.panic_time(chess.Board(), chess.engine.Limit(time=3)) == 3
+    assert time_manager.panic_time(chess.Board(), chess.engine.Limit(depth=5)) == float("inf")
+    assert time_manager.panic_time(chess.Board(), chess.engine.Limit(white_clock=10, black_clock=1)) == pytest.approx(4)
+
+
+@pytest.mark.parametrize("color", chess.COLORS)
+def test_panic_time__game_clock_time(color: chess.Color) -> None:
+    """Test that the move overhead is taken off the clock only once, by `game_clock_time`."""
+    board = chess.Board()
+    board.turn = color
+    game = make_game(wtime=2500, btime=2500)
+    limit = game_clock_time(board, game, Timer(), msec(2000))
+    time_manager = TimeManager()
+    assert time_manager.panic_time(board, limit) == pytest.approx(0.4 * 0.5, abs=0.01)
+    deadline = time_manager.deadline(board, limit)
+    assert 0 < deadline.soft_time <= deadline.hard_time <= time_manager.panic_time(board, limit)
+
+
+class DeadlineEngine(MinimalEngine):
+    """Play the first legal move and remember the deadline of the search."""
+
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit, *args: Any) -> chess.engine.PlayResult:
+        """Remember the deadline of the search and play the first legal move."""
+        self.search_deadline = self.deadline(board, time_limit)
+        return chess.engine.PlayResult(next(iter(board.legal_moves)), None)
+
+
+class MoveRecorder:
+    """Take the place of `lichess.Lichess` and remember the moves sent."""
+
+    def __init__(self) -> None:
+        """Start without moves."""
+        self.moves: list[chess.engine.PlayResult] = []
+
+    def make_move(self, game_id: str, move: chess.engine.PlayResult) -> None:
+        """Remember the move."""
+        self.moves.append(move)
+
+
+def test_deadline__play_move() -> None:
+    """Test that a homemade engine playing a game doesn't take the move overhead off its clock a second time."""
+    CONFIG: dict[str, Any] = {}
+    insert_default_values(CONFIG)
+    engine_cfg = Configuration(CONFIG).engine
+    engine = DeadlineEngine([], {}, None, engine_cfg.draw_or_resign)
+    board = chess.Board()
+    for move in ["e2e4", "e7e5"]:
+        board.push_uci(move)
+    game = make_game(wtime=2500, btime=2500, winc=2000, binc=2000)
+    li = MoveRecorder()
+    engine.play_move(board, game, cast(lichess.Lichess, li), Timer(), msec(2000), False, False, seconds(0), engine_cfg,
+                     seconds(0))
+    assert len(li.moves) == 1
+    assert engine.search_deadline.hard_time == pytest.approx(0.4 * 0.5, abs=0.01)